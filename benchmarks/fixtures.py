@@ -0,0 +1,20 @@
+from corpbondabm.bondmarket2017_r1 import BondMarket
+from corpbondabm.runner2017_r1 import TREYNOR_BOUNDS, TREYNOR_FACTOR
+from corpbondabm.trader2017_r1 import Dealer, DealerPanel
+
+
+def make_market(bonds, year=2003, batch_pricing=True):
+    bondmarket = BondMarket('bondmarket1', year, batch_pricing=batch_pricing)
+    for bond in bonds:
+        bondmarket.add_bond(bond['Name'], bond['Nominal'], bond['Maturity'], bond['Coupon'], bond['Yield'], bond['NPer'])
+    return bondmarket
+
+
+def make_dealers(bondmarket, d_special, long_limit=0.1, short_limit=0.075):
+    '''Dealers as the Runner builds them, and a DealerPanel over them'''
+    dealers = []
+    for name, special in d_special.items():
+        portfolio = {bond['Name']: {'Name': bond['Name'], 'Nominal': bond['Nominal'], 'Price': bond['Price'],
+                                    'Specialization': special[bond['Name']]} for bond in bondmarket.bonds}
+        dealers.append(Dealer(name, list(portfolio), portfolio, long_limit, short_limit, TREYNOR_BOUNDS, TREYNOR_FACTOR))
+    return dealers, DealerPanel(dealers)
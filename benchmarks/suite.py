@@ -0,0 +1,196 @@
+'''
+Benchmarks for pricing, quoting, matching and full runs
+
+Run from this folder (the market data paths are relative, as for the tests):
+
+    PYTHONPATH=.. python -m benchmarks.suite --out results.json
+    PYTHONPATH=.. python -m benchmarks.suite --quick --compare results.json
+
+Each case is run repeat times after one warm-up call; the result keeps the best and
+median time per call and the peak memory traced by tracemalloc over one further call.
+'''
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.fixtures import make_dealers, make_market
+from corpbondabm import helper_fxs
+from corpbondabm.runner2017_r1 import Runner, PRIMER
+from corpbondabm.synthetic import make_bonds, make_d_special, synthetic_market
+
+BONDS = (5, 100, 1000, 10000)
+DEALERS = (3, 20, 200)
+# runs last past the day-50 yield shock, which is when the funds start trading
+RUNS = [{'bonds': 5, 'dealers': 3, 'funds': 0, 'days': 100},
+        {'bonds': 5, 'dealers': 3, 'funds': 100, 'days': 100},
+        {'bonds': 100, 'dealers': 20, 'funds': 100, 'days': 60},
+        {'bonds': 1000, 'dealers': 20, 'funds': 100, 'days': 60},
+        {'bonds': 1000, 'dealers': 200, 'funds': 0, 'days': 60}]
+QUICK = {'bonds': 20, 'dealers': 5, 'funds': 20, 'days': 60}
+REGRESSION = 0.1
+SEED = 1
+
+
+def price_bond(bonds):
+    market = make_market(make_bonds(bonds, SEED))
+    u = market.universe
+    terms = list(zip(u.maturity.tolist(), u.coupon.tolist(), u.ytm.tolist()))
+    return lambda: [market._price_bond(100, m, c, y, 2) for m, c, y in terms]
+
+
+def bond_ytm(bonds):
+    market = make_market(make_bonds(bonds, SEED))
+    u = market.universe
+    terms = list(zip(u.maturity.tolist(), u.coupon.tolist(), (0.99*u.price).tolist(), u.ytm.tolist()))
+    return lambda: [market.bond_ytm(100, m, c, p, 2, y) for m, c, p, y in terms]
+
+
+def update_eod_bond_price(bonds, batch_pricing=True):
+    market = make_market(make_bonds(bonds, SEED), batch_pricing=batch_pricing)
+    steps = iter(range(10**9))
+    return lambda: market.update_eod_bond_price(next(steps) % len(market.yield_curve_p))
+
+
+def get_duration(bonds):
+    u = make_market(make_bonds(bonds, SEED)).universe
+    terms = list(zip(u.nominal.tolist(), u.maturity.tolist(), u.coupon.tolist(), u.ytm.tolist()))
+    return lambda: [helper_fxs.get_duration(None, n, m, c, y, 2) for n, m, c, y in terms]
+
+
+def make_quote(bonds, dealers):
+    '''One rfq quoted by every dealer, one make_quote call each'''
+    market = make_market(make_bonds(bonds, SEED))
+    dealer_list, _ = make_dealers(market, make_d_special(dealers, market.bonds, SEED))
+    rfq = {'order_id': 'm1_1', 'name': market.universe.names[-1], 'side': 'sell', 'amount': 100}
+    def run():
+        for d in dealer_list:
+            d.make_quote(rfq)
+            d.quote_details.clear()
+    return run
+
+
+def quote_prices(bonds, dealers):
+    '''One rfq quoted by the whole DealerPanel at once'''
+    market = make_market(make_bonds(bonds, SEED))
+    _, panel = make_dealers(market, make_d_special(dealers, market.bonds, SEED))
+    rfq = {'order_id': 'm1_1', 'name': market.universe.names[-1], 'side': 'sell', 'amount': 100}
+    return lambda: panel.quote_prices(rfq)
+
+
+def match_trade(dealers):
+    market = make_market(make_bonds(5, SEED))
+    rng = np.random.default_rng(SEED)
+    quotes = [{'Dealer': 'd%d' % (i+1), 'order_id': 'm1_1', 'name': market.universe.names[0], 'amount': 100, 'side': 'sell',
+               'price': float(p)} for i, p in enumerate(np.round(99 + rng.random(dealers), 2))]
+    return lambda: market.match_trade(quotes, PRIMER)
+
+
+def runner(bonds, dealers, funds, days):
+    '''Build and run a Runner: the m1 fund plus a cohort of funds mutual funds'''
+    market = synthetic_market(bonds, dealers, SEED)
+    cohorts = [{'kind': 'MutualFund', 'name': 'mf', 'funds': funds, 'share': 0.05}] if funds else []
+    return lambda: Runner(run_steps=days, seed=SEED, run=False, cohorts=cohorts, **market).run_mcs(PRIMER)
+
+
+def cases(quick=False):
+    '''(name, params, factory) for every benchmark; factory(**params) returns the call to time'''
+    bonds = BONDS[:2] if quick else BONDS
+    dealers = DEALERS[:2] if quick else DEALERS
+    for n in bonds:
+        yield 'price_bond', {'bonds': n}, price_bond
+        yield 'bond_ytm', {'bonds': n}, bond_ytm
+        yield 'update_eod_bond_price', {'bonds': n}, update_eod_bond_price
+        yield 'update_eod_bond_price', {'bonds': n, 'batch_pricing': False}, update_eod_bond_price
+        yield 'get_duration', {'bonds': n}, get_duration
+    for n in bonds:
+        for d in dealers:
+            yield 'make_quote', {'bonds': n, 'dealers': d}, make_quote
+            yield 'quote_prices', {'bonds': n, 'dealers': d}, quote_prices
+    for d in dealers:
+        yield 'match_trade', {'dealers': d}, match_trade
+    for params in ([QUICK] if quick else RUNS):
+        yield 'runner', params, runner
+
+
+def measure(name, params, factory, repeat=5):
+    call = factory(**params)
+    call() # warm-up: caches, first-touch allocation
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'Benchmark': name, 'Params': params, 'Repeat': repeat, 'Best': min(times), 'Median': float(np.median(times)),
+            'PeakMemory': peak}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'Python': platform.python_version(), 'NumPy': np.__version__, 'Platform': platform.platform(),
+            'Commit': commit, 'Time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run_suite(quick=False, repeat=5, only=None, echo=print):
+    results = []
+    for name, params, factory in cases(quick):
+        if only and name not in only:
+            continue
+        result = measure(name, params, factory, repeat if name != 'runner' else max(1, repeat//2))
+        echo('%-22s %-55s %10.6f s %8.1f MB' % (name, json.dumps(params), result['Best'], result['PeakMemory']/2**20))
+        results.append(result)
+    return {'Environment': environment(), 'Results': results}
+
+
+def key(result):
+    return result['Benchmark'], json.dumps(result['Params'], sort_keys=True)
+
+
+def compare(baseline, current, threshold=REGRESSION):
+    '''Cases whose best time grew by more than threshold (a fraction) against baseline'''
+    before = {key(r): r for r in baseline['Results']}
+    regressions = []
+    for r in current['Results']:
+        old = before.get(key(r))
+        if old is not None and r['Best'] > (1+threshold)*old['Best']:
+            regressions.append({'Benchmark': r['Benchmark'], 'Params': r['Params'], 'Baseline': old['Best'],
+                                'Current': r['Best'], 'Ratio': r['Best']/old['Best']})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='corpbondabm benchmarks')
+    parser.add_argument('--quick', action='store_true', help='small sizes only')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='*', help='benchmark names to run')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=REGRESSION)
+    args = parser.parse_args(argv)
+    results = run_suite(args.quick, args.repeat, args.only)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for r in regressions:
+            print('REGRESSION %-22s %-55s %.2fx' % (r['Benchmark'], json.dumps(r['Params']), r['Ratio']))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
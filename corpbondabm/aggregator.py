@@ -0,0 +1,283 @@
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from corpbondabm.replicator import replication_seeds, warm_worker
+from corpbondabm.runner2017_r1 import Runner
+
+SERIES = ('Prices', 'NAV', 'NAVPerShare', 'Cash', 'CashFlow', 'DealerInventory', 'Spreads')
+COMPRESSION = 100
+BUFFER_SIZE = 64
+QUANTILES = (0.05, 0.5, 0.95)
+
+
+class RunningMoments(object):
+    '''
+    RunningMoments
+
+    Welford running count, mean and variance for every cell of an array, updated one
+    row (e.g. one day) at a time; NaN values are skipped. Two RunningMoments over the
+    same shape merge exactly (Chan et al.), so replications can be split across workers.
+    '''
+
+    def __init__(self, shape):
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def __repr__(self):
+        return 'RunningMoments({0})'.format(self.mean.shape)
+
+    def update(self, row, values):
+        values = np.asarray(values, dtype=float)
+        seen = ~np.isnan(values)
+        self.count[row] += seen
+        delta = np.where(seen, values, self.mean[row]) - self.mean[row]
+        self.mean[row] += delta/np.maximum(self.count[row], 1)
+        self.m2[row] += delta*(np.where(seen, values, self.mean[row]) - self.mean[row])
+
+    def merge(self, other):
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        share = np.divide(other.count, count, out=np.zeros_like(count), where=count > 0)
+        self.m2 += other.m2 + delta**2*self.count*share
+        self.mean += delta*share
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        '''Sample variance, NaN for cells with fewer than two values'''
+        return np.divide(self.m2, self.count - 1, out=np.full(self.m2.shape, np.nan), where=self.count > 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+def merge_centroids(means, weights, compression, size):
+    '''
+    Merge each row of (rows x n) weighted points into at most size centroids
+
+    Points are sorted and grouped by the t-digest k1 scale of their quantile, so
+    centroids are small in the tails and large in the middle. Empty centroids have
+    weight 0 and a NaN mean.
+    '''
+    order = np.argsort(means, axis=1) # NaN (empty) points sort last
+    means = np.take_along_axis(means, order, axis=1)
+    weights = np.take_along_axis(weights, order, axis=1)
+    means = np.where(weights > 0, means, 0.0)
+    total = weights.sum(axis=1, keepdims=True)
+    q = (np.cumsum(weights, axis=1) - weights/2)/np.where(total > 0, total, 1)
+    k = compression/(2*np.pi)*np.arcsin(np.clip(2*q - 1, -1, 1)) + compression/4
+    bucket = np.minimum(k.astype(int), size-1) + size*np.arange(len(means))[:, None]
+    merged_weights = np.bincount(bucket.ravel(), weights.ravel(), len(means)*size).reshape(len(means), size)
+    sums = np.bincount(bucket.ravel(), (weights*means).ravel(), len(means)*size).reshape(len(means), size)
+    merged_means = np.divide(sums, merged_weights, out=np.full(sums.shape, np.nan), where=merged_weights > 0)
+    return merged_means, merged_weights
+
+
+class QuantileSketch(object):
+    '''
+    QuantileSketch
+
+    merging t-digest-like quantile sketch for every cell of an array, updated one row at
+    a time like RunningMoments
+
+    Each row keeps up to buffer_size raw values per cell, then merges them into at most
+    compression/2 + 1 centroids, so memory is fixed however many values arrive. The
+    exact minimum and maximum are kept for the tails; NaN values are skipped.
+    '''
+
+    def __init__(self, shape, compression=COMPRESSION, buffer_size=BUFFER_SIZE):
+        self.shape = tuple(shape)
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.size = int(compression//2) + 1
+        rows, cells = self.shape[0], int(np.prod(self.shape[1:], dtype=int))
+        self.means = np.full((rows, cells, self.size), np.nan)
+        self.weights = np.zeros((rows, cells, self.size))
+        self.minimum = np.full((rows, cells), np.nan)
+        self.maximum = np.full((rows, cells), np.nan)
+        self.filled = np.zeros(rows, dtype=int)
+        self.buffer = None
+
+    def __repr__(self):
+        return 'QuantileSketch({0}, {1})'.format(self.shape, self.compression)
+
+    def __getstate__(self):
+        # ship merged centroids only: the buffers are mostly empty
+        self.flush()
+        state = self.__dict__.copy()
+        state['buffer'] = None
+        return state
+
+    def add(self, row, values):
+        if self.buffer is None:
+            self.buffer = np.full((self.shape[0], self.buffer_size, self.means.shape[1]), np.nan)
+        self.buffer[row, self.filled[row]] = np.ravel(values)
+        self.filled[row] += 1
+        if self.filled[row] == self.buffer_size:
+            self.compress(row)
+
+    def compress(self, row):
+        values = self.buffer[row, :self.filled[row]].T
+        self.minimum[row] = np.fmin(self.minimum[row], np.fmin.reduce(values, axis=1))
+        self.maximum[row] = np.fmax(self.maximum[row], np.fmax.reduce(values, axis=1))
+        self.means[row], self.weights[row] = merge_centroids(np.concatenate([self.means[row], values], axis=1),
+                                                             np.concatenate([self.weights[row], ~np.isnan(values)], axis=1),
+                                                             self.compression, self.size)
+        self.buffer[row] = np.nan
+        self.filled[row] = 0
+
+    def flush(self):
+        for row in np.flatnonzero(self.filled):
+            self.compress(row)
+
+    def merge(self, other):
+        if other.shape != self.shape or other.compression != self.compression:
+            raise ValueError('Cannot merge {0} into {1}'.format(other, self))
+        self.flush()
+        other.flush()
+        rows, cells = self.means.shape[:2]
+        means, weights = merge_centroids(np.concatenate([self.means, other.means], axis=2).reshape(rows*cells, -1),
+                                         np.concatenate([self.weights, other.weights], axis=2).reshape(rows*cells, -1),
+                                         self.compression, self.size)
+        self.means, self.weights = means.reshape(rows, cells, -1), weights.reshape(rows, cells, -1)
+        self.minimum = np.fmin(self.minimum, other.minimum)
+        self.maximum = np.fmax(self.maximum, other.maximum)
+        return self
+
+    def quantile(self, q):
+        '''Estimated quantile q (a number or a sequence) of every cell: NaN for cells with no values'''
+        self.flush()
+        qs = np.atleast_1d(np.asarray(q, dtype=float))
+        result = np.full((len(qs),) + self.means.shape[:2], np.nan)
+        for row, cell in zip(*np.nonzero(self.weights.sum(axis=2))):
+            weights = self.weights[row, cell]
+            used = weights > 0
+            total = weights.sum()
+            ranks = np.concatenate([[0], np.cumsum(weights[used]) - weights[used]/2, [total]])
+            values = np.concatenate([[self.minimum[row, cell]], self.means[row, cell, used], [self.maximum[row, cell]]])
+            result[:, row, cell] = np.interp(qs*total, ranks, values)
+        result = result.reshape((len(qs),) + self.shape)
+        return result if np.ndim(q) else result[0]
+
+
+class StepAggregator(object):
+    '''
+    StepAggregator
+
+    cross-replication distribution of StepRecord series, day by day: Welford mean and
+    variance plus a quantile sketch for each series cell, so memory does not grow with
+    the number of replications
+
+    Pass it to Runner.iter_steps as a consumer for every replication. It reads the
+    prices print_last_prices broadcasts, the m1 NAV, cash and cash flow add_nav_to_history
+    records, dealer inventories and the mean inside spread per bond from the dealers'
+    quotes. Aggregators over the same days and market merge, so replications can run
+    in separate processes.
+    '''
+
+    def __init__(self, start, stop, bonds, dealers, series=SERIES, compression=COMPRESSION, buffer_size=BUFFER_SIZE):
+        self.start = start
+        self.stop = stop
+        self.series = tuple(series)
+        shapes = {'Prices': (bonds,), 'DealerInventory': (dealers, bonds), 'Spreads': (bonds,)}
+        self.shapes = {name: (stop-start,) + shapes.get(name, ()) for name in self.series}
+        self.moments = {name: RunningMoments(shape) for name, shape in self.shapes.items()}
+        self.sketches = {name: QuantileSketch(shape, compression, buffer_size) for name, shape in self.shapes.items()}
+
+    @classmethod
+    def for_runner(cls, runner, **kwargs):
+        return cls(runner.primer, runner.end_date, len(runner.bondmarket.universe.names), len(runner.dealer_panel), **kwargs)
+
+    def __repr__(self):
+        return 'StepAggregator({0}, {1}, {2} replications)'.format(self.start, self.stop, self.replications)
+
+    def __call__(self, record):
+        row = record.Day - self.start
+        for name in self.series:
+            value = getattr(record, name)
+            self.moments[name].update(row, value)
+            self.sketches[name].add(row, value)
+
+    @property
+    def replications(self):
+        '''Replications seen on the first day'''
+        return int(self.moments[self.series[0]].count[0].max(initial=0))
+
+    def merge(self, other):
+        if (other.start, other.stop, other.shapes) != (self.start, self.stop, self.shapes):
+            raise ValueError('Cannot merge {0} into {1}'.format(other, self))
+        for name in self.series:
+            self.moments[name].merge(other.moments[name])
+            self.sketches[name].merge(other.sketches[name])
+        return self
+
+    def count(self, name):
+        return self.moments[name].count
+
+    def mean(self, name):
+        return np.where(self.moments[name].count > 0, self.moments[name].mean, np.nan)
+
+    def std(self, name):
+        return self.moments[name].std
+
+    def quantile(self, name, q):
+        return self.sketches[name].quantile(q)
+
+    def band(self, name, level=0.9):
+        '''Central band holding level of the replications: (lower, upper) quantiles per day'''
+        lower, upper = self.quantile(name, [(1-level)/2, (1+level)/2])
+        return lower, upper
+
+    def summary(self, name, quantiles=QUANTILES):
+        '''Count, Mean, Std and quantiles of one series, one row per day and series cell (Cell is the flat position)'''
+        import pandas as pd
+        shape = self.shapes[name]
+        cells = int(np.prod(shape[1:], dtype=int))
+        columns = {'Day': np.repeat(np.arange(self.start, self.stop), cells), 'Cell': np.tile(np.arange(cells), shape[0]),
+                   'Count': self.count(name).ravel(), 'Mean': self.mean(name).ravel(), 'Std': self.std(name).ravel()}
+        for q, values in zip(quantiles, self.quantile(name, quantiles)):
+            columns['Q%g' % q] = values.ravel()
+        return pd.DataFrame(columns)
+
+
+def aggregate_chunk(seeds, configs, kwargs):
+    '''Worker: run replications one after another into one StepAggregator'''
+    aggregator = None
+    for seed, config in zip(seeds, configs):
+        runner = Runner(run=False, seed=seed, **config)
+        if aggregator is None:
+            aggregator = StepAggregator.for_runner(runner, **kwargs)
+        for _ in runner.iter_steps(consumers=[aggregator]):
+            pass
+    return aggregator
+
+
+def aggregate_replications(configs, seed=None, max_workers=None, chunks=None, **kwargs):
+    '''
+    Run one Runner per config dict across a process pool, keeping only a StepAggregator
+
+    Seeds are spawned as in run_replications and no h5 files are written. Each worker
+    aggregates a contiguous chunk of replications and the chunks are merged, so only
+    one aggregator per chunk crosses between processes. The configs must share the run
+    length and market size; kwargs go to StepAggregator.
+    '''
+    configs = list(configs)
+    if not configs:
+        raise ValueError('aggregate_replications needs at least one config')
+    seeds = replication_seeds(len(configs), seed)
+    chunks = min(len(configs), chunks or 4*(max_workers or os.cpu_count() or 1))
+    bounds = np.linspace(0, len(configs), chunks+1).astype(int)
+    years = sorted({config.get('year', 2003) for config in configs})
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=warm_worker, initargs=(years,)) as pool:
+        futures = [pool.submit(aggregate_chunk, seeds[lo:hi], configs[lo:hi], kwargs)
+                   for lo, hi in zip(bounds[:-1], bounds[1:])]
+        aggregator = futures[0].result()
+        for future in futures[1:]:
+            aggregator.merge(future.result())
+    return aggregator
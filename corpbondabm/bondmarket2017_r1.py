@@ -1,9 +1,286 @@
 import numpy as np
-import pandas as pd
-import scipy.optimize as optimize
 
+from collections.abc import MutableMapping, Sequence
 from math import pow
 
+from corpbondabm import marketdata
+from corpbondabm.randomstreams import RandomStream
+from corpbondabm.recorder import CHUNK_SIZE, StreamRecorder
+
+NEWTON_TOL = 1.48e-08
+NEWTON_MAXITER = 50
+TRADE_COLUMNS = [('Sequence', np.int64), ('Dealer', object), ('OrderId', object), ('Bond', object), ('Size', float),
+                 ('Side', object), ('Price', float), ('Day', np.int64)]
+SIDES = ('buy', 'sell')
+
+
+class BondUniverse(object):
+    '''
+    BondUniverse
+    
+    columnar store for the bonds traded in a BondMarket: one contiguous float array per
+    field plus a name -> index map
+    
+    Price is the end-of-day model price and LastPrice is the last traded (or repriced) 
+    price. Column views returned by the properties are zero-copy but are only valid 
+    until the next add() grows the arrays.
+    '''
+    
+    COLUMNS = ('Nominal', 'Maturity', 'Coupon', 'Yield', 'Price', 'LastPrice', 'NPer')
+    
+    def __init__(self, capacity=8):
+        self.names = []
+        self.index = {}
+        self.size = 0
+        self._columns = {c: np.zeros(capacity) for c in self.COLUMNS}
+        
+    def __len__(self):
+        return self.size
+    
+    def add(self, name, nominal, maturity, coupon, ytm, price, nper):
+        if name in self.index:
+            raise ValueError('Bond %s already in universe' % name)
+        capacity = len(self._columns['Price'])
+        if self.size == capacity:
+            for c, col in self._columns.items():
+                grown = np.zeros(2*capacity)
+                grown[:capacity] = col
+                self._columns[c] = grown
+        row = dict(zip(self.COLUMNS, (nominal, maturity, coupon, ytm, price, price, nper)))
+        for c, col in self._columns.items():
+            col[self.size] = row[c]
+        self.index[name] = self.size
+        self.names.append(name)
+        self.size += 1
+        
+    def column(self, name):
+        return self._columns[name][:self.size]
+    
+    @property
+    def nominal(self):
+        return self._columns['Nominal'][:self.size]
+    
+    @property
+    def maturity(self):
+        return self._columns['Maturity'][:self.size]
+    
+    @property
+    def coupon(self):
+        return self._columns['Coupon'][:self.size]
+    
+    @property
+    def ytm(self):
+        return self._columns['Yield'][:self.size]
+    
+    @property
+    def price(self):
+        return self._columns['Price'][:self.size]
+    
+    @property
+    def last_price(self):
+        return self._columns['LastPrice'][:self.size]
+    
+    @property
+    def nper(self):
+        return self._columns['NPer'][:self.size]
+    
+    
+class BondRow(dict):
+    '''
+    BondRow
+    
+    dict snapshot of one bond in a BondUniverse; item assignment writes through to the
+    universe columns
+    '''
+    
+    def __init__(self, universe, j):
+        dict.__init__(self, Name=universe.names[j])
+        for c in BondView.FIELDS:
+            dict.__setitem__(self, c, universe._columns[c][j])
+        self._universe = universe
+        self._j = j
+        
+    def __setitem__(self, key, value):
+        if key not in BondView.FIELDS:
+            raise KeyError(key)
+        self._universe._columns[key][self._j] = value
+        dict.__setitem__(self, key, value)
+        
+    def __reduce__(self):
+        return (BondRow, (self._universe, self._j))
+    
+    
+class BondView(Sequence):
+    '''
+    BondView
+    
+    list-of-dicts view of a BondUniverse, kept so callers of BondMarket.bonds still work
+    '''
+    
+    FIELDS = ('Nominal', 'Maturity', 'Coupon', 'Yield', 'Price')
+    
+    def __init__(self, universe):
+        self._universe = universe
+        
+    def __len__(self):
+        return self._universe.size
+    
+    def __getitem__(self, j):
+        if isinstance(j, slice):
+            return [self[i] for i in range(*j.indices(len(self)))]
+        if j < 0:
+            j += len(self)
+        if not 0 <= j < len(self):
+            raise IndexError('bond index out of range')
+        return BondRow(self._universe, j)
+    
+    
+class PriceView(MutableMapping):
+    '''
+    PriceView
+    
+    name -> last price mapping backed by the LastPrice column of a BondUniverse
+    
+    Agents can read the whole vector without copying through .array (in universe order)
+    and .index.
+    '''
+    
+    def __init__(self, universe):
+        self._universe = universe
+        
+    @property
+    def array(self):
+        return self._universe.last_price
+    
+    @property
+    def index(self):
+        return self._universe.index
+        
+    def __getitem__(self, name):
+        return self._universe._columns['LastPrice'][self._universe.index[name]]
+    
+    def __setitem__(self, name, price):
+        self._universe._columns['LastPrice'][self._universe.index[name]] = price
+        
+    def __delitem__(self, name):
+        raise TypeError('Bonds cannot be removed from the universe')
+    
+    def __iter__(self):
+        return iter(self._universe.names)
+    
+    def __len__(self):
+        return self._universe.size
+    
+    def positions(self, bond_list):
+        '''Positions of bond_list in .array'''
+        return np.array([self._universe.index[bond] for bond in bond_list])
+
+
+def take_prices(prices, bond_list, order=None):
+    '''
+    Prices of bond_list, from a dict by bond name or a market's PriceView
+    
+    Returns the prices and the PriceView positions (None for a dict) to pass back as 
+    order next time. Bonds are only ever appended to a market, so the positions are 
+    looked up once and the prices then read as one array.
+    '''
+    if hasattr(prices, 'array'):
+        if order is None:
+            order = prices.positions(bond_list)
+        return prices.array[order], order
+    return np.array([prices[bond] for bond in bond_list], dtype=float), None
+
+
+def split_order_id(order_id):
+    '''(buy side, rfq number) from an order id of the form <buy side>_<rfq number>, e.g. m1_12'''
+    buy_side, _, number = order_id.rpartition('_')
+    if not buy_side or not number.isdigit():
+        raise ValueError("order id {0!r} is not of the form '<buy side>_<rfq number>'".format(order_id))
+    return buy_side, int(number)
+
+
+class TradeLog(Sequence):
+    '''
+    TradeLog
+    
+    preallocated column store of the trades in a BondMarket
+    
+    Agents, bonds and sides are kept as integer codes (into agents, the universe and 
+    SIDES) and order ids as the buy side's code plus its integer rfq number. Indexing 
+    returns the trade report dict and to_columns() the decoded columns for output. 
+    append also takes a trade report dict, as the list of trades did.
+    '''
+    
+    COLUMNS = (('Sequence', np.int64), ('Dealer', np.int32), ('BuySide', np.int32), ('OrderNumber', np.int64), 
+               ('Bond', np.int32), ('Size', float), ('Side', np.int8), ('Price', float), ('Day', np.int64))
+    
+    def __init__(self, universe, agents, agent_index, capacity=1024):
+        self._universe = universe
+        self._agents = agents
+        self._agent_index = agent_index
+        self.size = 0
+        self._columns = {c: np.zeros(capacity, dtype=dtype) for c, dtype in self.COLUMNS}
+        
+    def __len__(self):
+        return self.size
+    
+    def append(self, sequence, dealer=None, buyside=None, order_number=None, bond=None, size=None, side=None, price=None, 
+               day=None):
+        if isinstance(sequence, dict):
+            sequence, dealer, buyside, order_number, bond, size, side, price, day = self.encode(sequence)
+        capacity = len(self._columns['Price'])
+        if self.size == capacity:
+            for c, col in self._columns.items():
+                grown = np.zeros(2*capacity, dtype=col.dtype)
+                grown[:capacity] = col
+                self._columns[c] = grown
+        k = self.size
+        cols = self._columns
+        cols['Sequence'][k] = sequence
+        cols['Dealer'][k] = dealer
+        cols['BuySide'][k] = buyside
+        cols['OrderNumber'][k] = order_number
+        cols['Bond'][k] = bond
+        cols['Size'][k] = size
+        cols['Side'][k] = side
+        cols['Price'][k] = price
+        cols['Day'][k] = day
+        self.size += 1
+        
+    def encode(self, report):
+        '''The codes for a trade report dict, registering agents not seen before'''
+        buy_side, order_number = split_order_id(report['OrderId'])
+        for name in (report['Dealer'], buy_side):
+            if name not in self._agent_index:
+                self._agent_index[name] = len(self._agents)
+                self._agents.append(name)
+        return (report['Sequence'], self._agent_index[report['Dealer']], self._agent_index[buy_side], order_number, 
+                self._universe.index[report['Bond']], report['Size'], SIDES.index(report['Side']), report['Price'], report['Day'])
+        
+    def column(self, name):
+        return self._columns[name][:self.size]
+    
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(*k.indices(len(self)))]
+        if k < 0:
+            k += self.size
+        if not 0 <= k < self.size:
+            raise IndexError('trade index out of range')
+        c = {name: col[k].item() for name, col in self._columns.items()}
+        agents = self._agents
+        return {'Sequence': c['Sequence'], 'Dealer': agents[c['Dealer']], 'OrderId': '%s_%d' % (agents[c['BuySide']], c['OrderNumber']),
+                'Bond': self._universe.names[c['Bond']], 'Size': c['Size'], 'Side': SIDES[c['Side']], 'Price': c['Price'], 'Day': c['Day']}
+    
+    def to_columns(self):
+        '''The trades as a dict of decoded columns, in TRADE_COLUMNS order'''
+        agents = np.array(self._agents, dtype=object)
+        buyside = agents[self.column('BuySide')]
+        return {'Sequence': self.column('Sequence'), 'Dealer': agents[self.column('Dealer')],
+                'OrderId': np.array(['%s_%d' % x for x in zip(buyside, self.column('OrderNumber').tolist())], dtype=object),
+                'Bond': np.array(self._universe.names, dtype=object)[self.column('Bond')], 'Size': self.column('Size'),
+                'Side': np.array(SIDES, dtype=object)[self.column('Side')], 'Price': self.column('Price'), 'Day': self.column('Day')}
+
 
 class BondMarket(object):
     '''
@@ -12,47 +289,116 @@ class BondMarket(object):
     base class for bond market
     '''
     
-    def __init__(self, name, year):
+    def __init__(self, name, year, batch_pricing=True, rng=None):
         '''
         Initialize BondMarket with some base class attributes and a method
         
+        batch_pricing reprices the whole universe with one vectorized Newton solve at the 
+        end of the day; set it to False to fall back to the per-bond scalar solver.
         
+        rng is the market's RandomStream for breaking ties between quotes (default: the
+        legacy global np.random).
         '''
         self._market_id = name # trader id
-        self.bonds = []
-        self.trades = []
-        self.last_prices = {}
+        self.universe = BondUniverse()
+        self.bonds = BondView(self.universe)
+        self.agents = []
+        self.agent_index = {}
+        self.trades = TradeLog(self.universe, self.agents, self.agent_index)
+        self.last_prices = PriceView(self.universe)
         self.price_history = []
         self.yield_curve_p = self.load_yieldcurve_change(year)
+        self._bond_yield_changes = None
         self.trade_sequence = 0
+        self.batch_pricing = batch_pricing
+        self.newton_iterations = 0
+        self.rng = rng if rng is not None else RandomStream()
+        self.trade_recorder = None
+        self.price_recorder = None
         
     def __repr__(self):
         return 'BondMarket({0})'.format(self._market_id)
     
+    def stream_to(self, writer, chunk_size=CHUNK_SIZE):
+        '''Stream trades and end-of-day prices to writer in chunks instead of keeping them in memory'''
+        self.trade_recorder = StreamRecorder(writer, 'trades', TRADE_COLUMNS, chunk_size)
+        price_columns = [(name, float) for name in self.universe.names] + [('Date', np.int64)]
+        self.price_recorder = StreamRecorder(writer, 'last_prices', price_columns, chunk_size)
+    
     def add_bond(self, name, nominal, maturity, coupon, ytm, nper):
         price = self._price_bond(100, maturity, coupon, ytm, nper)
-        self.bonds.append({'Name': name, 'Nominal': nominal, 'Maturity': maturity, 'Coupon': coupon, 'Yield': ytm, 'Price': price})
-        self.last_prices[name] = price
+        self.universe.add(name, nominal, maturity, coupon, ytm, price, nper)
         
     def load_yieldcurve_change(self, inyear):
-        indf = pd.read_csv('../csv/yieldcurvep.csv', parse_dates=['DATE'])
-        indf = indf.assign(Year = [x.year for x in indf.DATE])
-        return np.array(indf[indf.Year==inyear][['YTM1p', 'YTM2p', 'YTM5p', 'YTM10p', 'YTM25p']])
+        # read-only view into the shared market data cache
+        return marketdata.load_yieldcurve_change(inyear)
     
+    def bond_yield_changes(self):
+        '''(days x bonds) daily yield changes for the universe, interpolated from the curve tenors'''
+        u = self.universe
+        if self._bond_yield_changes is None or self._bond_yield_changes.shape[1] != u.size:
+            self._bond_yield_changes = marketdata.interpolate_tenors(self.yield_curve_p, u.maturity)
+        return self._bond_yield_changes
+        
     def bond_ytm(self, nominal, maturity, coupon, new_price, nper, guess):
         nper = float(nper)
         n = nper*maturity
         payment = nominal*coupon/nper
         ytm_func = lambda x: payment*(1-pow(1+(x/nper),-n))/(x/nper) + pow(1+(x/nper),-n)*nominal - new_price
-        return optimize.newton(ytm_func, guess)
+        from scipy import optimize # only needed when the batch solve falls back
+        ytm, result = optimize.newton(ytm_func, guess, full_output=True)
+        self.newton_iterations += result.iterations
+        return ytm
+    
+    def bond_ytms(self, nominal, maturity, coupon, new_price, nper, guess):
+        '''
+        Vectorized bond_ytm: one Newton iteration over arrays of bonds
+        
+        All bonds step together until every step size is below NEWTON_TOL; any bond that
+        has not converged (or has gone non-finite) after NEWTON_MAXITER iterations is 
+        re-solved with the scalar bond_ytm. Both add their iterations to 
+        newton_iterations, which update_eod_bond_price resets.
+        '''
+        nper = np.asarray(nper, dtype=float)
+        n = nper*maturity
+        payment = nominal*coupon/nper
+        ytm = np.empty(np.broadcast(n, coupon, new_price, guess).shape)
+        ytm[...] = guess
+        converged = np.zeros(ytm.shape, dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            for iteration in range(1, NEWTON_MAXITER+1):
+                rate = ytm/nper
+                discount = np.power(1+rate, -n)
+                annuity = (1-discount)/rate
+                price_error = payment*annuity + discount*nominal - new_price
+                # d(price)/d(rate): annuity term plus principal term, then chain rule to the yield
+                dprice_drate = payment*(n*discount/(1+rate) - annuity)/rate - n*discount*nominal/(1+rate)
+                delta = price_error*nper/dprice_drate
+                ytm = ytm - delta
+                converged = np.abs(delta) < NEWTON_TOL
+                if converged.all():
+                    break
+        self.newton_iterations += iteration
+        failed = ~(converged & np.isfinite(ytm))
+        if failed.any():
+            nominal, maturity, coupon, new_price, nper, guess = np.broadcast_arrays(nominal, maturity, coupon, new_price, nper, guess)
+            for j in zip(*np.nonzero(failed)):
+                ytm[j] = self.bond_ytm(nominal[j], maturity[j], coupon[j], new_price[j], nper[j], guess[j])
+        return ytm
     
     def update_eod_bond_price(self, step):
-        ytm_delta_ps = self.yield_curve_p[step]
-        for j, bond in enumerate(self.bonds):
-            bond['Yield'] = self.bond_ytm(100, bond['Maturity'], bond['Coupon'], self.last_prices[bond['Name']], 2, bond['Yield'])*(1+ytm_delta_ps[j])
-            new_price = self._price_bond(100, bond['Maturity'], bond['Coupon'], bond['Yield'], 2)
-            bond['Price'] = new_price
-            self.last_prices[bond['Name']] = new_price
+        ytm_delta_ps = self.bond_yield_changes()[step]
+        u = self.universe
+        self.newton_iterations = 0
+        if not self.batch_pricing:
+            for j in range(u.size):
+                u.ytm[j] = self.bond_ytm(100, u.maturity[j], u.coupon[j], u.last_price[j], u.nper[j], u.ytm[j])*(1+ytm_delta_ps[j])
+                u.price[j] = self._price_bond(100, u.maturity[j], u.coupon[j], u.ytm[j], u.nper[j])
+                u.last_price[j] = u.price[j]
+            return
+        u.ytm[:] = self.bond_ytms(100, u.maturity, u.coupon, u.last_price, u.nper, u.ytm)*(1+ytm_delta_ps)
+        u.price[:] = self._price_bonds(100, u.maturity, u.coupon, u.ytm, u.nper)
+        u.last_price[:] = u.price
         
     def _price_bond(self, nominal, maturity, coupon, ytm, nper):
         n = nper*maturity
@@ -61,12 +407,19 @@ class BondMarket(object):
         discount = pow(1+rate,-n)
         return payment*(1-discount)/rate + discount*nominal
     
+    def _price_bonds(self, nominal, maturity, coupon, ytm, nper):
+        '''Vectorized _price_bond over arrays of maturity, coupon and yield'''
+        n = np.multiply(nper, maturity)
+        payment = np.multiply(nominal, coupon)/nper
+        rate = np.divide(ytm, nper)
+        discount = np.power(1+rate, -n)
+        return payment*(1-discount)/rate + discount*nominal
+    
     def shock_ytm(self, shock):
-        for bond in self.bonds:
-            bond['Yield'] += shock
-            new_price = self._price_bond(100, bond['Maturity'], bond['Coupon'], bond['Yield'], 2)
-            bond['Price'] = new_price
-            self.last_prices[bond['Name']] = new_price
+        u = self.universe
+        u.ytm[:] += shock
+        u.price[:] = self._price_bonds(100, u.maturity, u.coupon, u.ytm, u.nper)
+        u.last_price[:] = u.price
     
     #def compute_weights_from_price(self):
         #prices = np.array([x['Price']*x['Nominal']/100 for x in self.bonds])
@@ -74,21 +427,40 @@ class BondMarket(object):
         #weights = prices/market_value
         #return weights
     
+    def register_agent(self, name):
+        '''Integer id for an agent name, used in place of the name on the matching path'''
+        if name not in self.agent_index:
+            self.agent_index[name] = len(self.agents)
+            self.agents.append(name)
+        return self.agent_index[name]
+    
     def compute_weights_from_nominal(self):
-        nominals = np.array([x['Nominal'] for x in self.bonds])
-        nominal_value = np.sum(nominals)
-        weights = nominals/nominal_value
-        names = [x['Name'] for x in self.bonds]
-        return dict(zip(names, weights))
+        nominals = self.universe.nominal
+        weights = nominals/np.sum(nominals)
+        return dict(zip(self.universe.names, weights))
     
     def report_trades(self, matched_quote, step):
-        # Report all information to the transaction collector
+        '''
+        Report a matched quote to the trade log
+        
+        The quote's order_id must be <buy side>_<rfq number> (e.g. m1_12), as the buy 
+        side traders number their rfqs; anything else raises ValueError.
+        '''
+        buy_side, order_number = split_order_id(matched_quote['order_id'])
+        self.log_trade(self.register_agent(matched_quote['Dealer']), self.register_agent(buy_side), order_number, 
+                       self.universe.index[matched_quote['name']], matched_quote['amount'], SIDES.index(matched_quote['side']),
+                       matched_quote['price'], step)
+        
+    def log_trade(self, dealer, buyside, order_number, bond, size, side, price, step):
+        '''Write one trade (agent, bond and side codes) to the trade log and set the bond's last price'''
         self.trade_sequence += 1
-        trade_report = {'Sequence': self.trade_sequence, 'Dealer': matched_quote['Dealer'], 'OrderId': matched_quote['order_id'], 
-                        'Bond': matched_quote['name'], 'Size': matched_quote['amount'], 'Side': matched_quote['side'], 
-                        'Price': matched_quote['price'], 'Day': step}
-        self.trades.append(trade_report)
-        self.last_prices[trade_report['Bond']] = trade_report['Price']
+        if self.trade_recorder is not None:
+            self.trade_recorder.record({'Sequence': self.trade_sequence, 'Dealer': self.agents[dealer], 
+                                        'OrderId': '%s_%d' % (self.agents[buyside], order_number), 'Bond': self.universe.names[bond],
+                                        'Size': size, 'Side': SIDES[side], 'Price': price, 'Day': step})
+        else:
+            self.trades.append(self.trade_sequence, dealer, buyside, order_number, bond, size, side, price, step)
+        self.universe._columns['LastPrice'][bond] = price
         
     def make_dealer_confirm(self, matched_quote):
         # Report Dealer, Size, Bond, Side
@@ -97,34 +469,76 @@ class BondMarket(object):
         
     def make_buyside_confirm(self, matched_quote):
         # Report BuySide, Size, Bond, Side, Price
-        buy_side = matched_quote['order_id'].split('_')[0]
+        buy_side = matched_quote['order_id'].rsplit('_', 1)[0]
         return {'BuySide': buy_side, 'Size': matched_quote['amount'], 'Bond': matched_quote['name'], 
                 'Side': matched_quote['side'], 'Price': matched_quote['price']}
+    
+    def best_quote(self, prices, side):
+        '''
+        Position of the best price in prices (NaN for no quote): the highest bid for a sell
+        rfq, the lowest ask for a buy rfq, with ties broken at random. None if no quotes.
+        '''
+        score = prices if side == 'sell' else -prices
+        ties = np.flatnonzero(score == np.fmax.reduce(score, initial=np.nan))
+        if not len(ties):
+            return None
+        return ties[self.rng.randint(0, len(ties))]
         
     def match_trade(self, quotes, step):
+        '''
+        Trade with the best of the dealers' quotes (None for a dealer not quoting)
+        
+        Order ids must be <buy side>_<rfq number>, as for report_trades. Returns the 
+        dealer and buy side confirms; raises ValueError if no dealer quoted.
+        '''
         # if side is buy, dealer is quoting ask prices
-        quotes = [q for q in quotes if q]
-        side = quotes[0]['side']
-        prices = [quotes[i]['price'] for i in range(0,len(quotes))]
-        best_price = np.min(prices) if side == 'buy' else np.max(prices)
-        best_quotes = [q for q in quotes if q['price'] == best_price]
-        match = best_quotes[np.random.randint(0, len(best_quotes))]
+        prices = np.array([q['price'] if q else np.nan for q in quotes])
+        i = self.best_quote(prices, next((q['side'] for q in quotes if q), None))
+        if i is None:
+            raise ValueError('no dealer quoted')
+        match = quotes[i]
         self.report_trades(match, step)
         return self.make_dealer_confirm(match), self.make_buyside_confirm(match)
     
+    def match_prices(self, prices, dealer_ids, buyside_id, order_number, bond, side, amount, step):
+        '''
+        match_trade on a vector of dealer prices, for callers that carry integer ids
+        
+        prices holds each dealer's quote (NaN for none) and dealer_ids their agent ids; 
+        bond is the universe index and side a SIDES code. The trade goes straight into the 
+        trade log. Returns the position of the winning dealer and the price, or None.
+        '''
+        i = self.best_quote(prices, SIDES[side])
+        if i is None:
+            return None
+        price = float(prices[i])
+        self.log_trade(dealer_ids[i], buyside_id, order_number, bond, amount, side, price, step)
+        return i, price
+    
     def print_last_prices(self, step):
-        current_prices = {bond: price for bond, price in self.last_prices.items()}
+        current_prices = dict(zip(self.universe.names, self.universe.last_price.tolist()))
         current_prices['Date'] = step
-        self.price_history.append(current_prices)
+        if self.price_recorder is not None:
+            self.price_recorder.record(current_prices)
+        else:
+            self.price_history.append(current_prices)
     
     def last_prices_to_h5(self, filename):
         '''Append last prices to an h5 file'''
+        if self.price_recorder is not None:
+            self.price_recorder.flush()
+            return
+        import pandas as pd
         temp_df = pd.DataFrame(self.price_history)
-        temp_df.to_hdf(filename, 'last_prices', append=True, format='table', complevel=5, complib='blosc') 
+        temp_df.to_hdf(filename, key='last_prices', append=True, format='table', complevel=5, complib='blosc') 
         
     def trades_to_h5(self, filename):
         '''Append trades to an h5 file'''
-        temp_df = pd.DataFrame(self.trades)
-        temp_df.to_hdf(filename, 'trades', append=True, format='table', complevel=5, complib='blosc')
+        if self.trade_recorder is not None:
+            self.trade_recorder.flush()
+            return
+        import pandas as pd
+        temp_df = pd.DataFrame(self.trades.to_columns())
+        temp_df.to_hdf(filename, key='trades', append=True, format='table', complevel=5, complib='blosc')
             
         
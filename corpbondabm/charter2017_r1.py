@@ -1,17 +1,21 @@
-import matplotlib.animation as animation
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
+import time
 
-from matplotlib import rc
-rc('font', **{'family': 'serif', 'serif': ['Cambria', 'Times New Roman']})
+import numpy as np
 
 from corpbondabm.bondmarket2017_r1 import BondMarket
+from corpbondabm.pricefeed import PriceFeed, PricePublisher
+from corpbondabm.profiler import PhaseProfiler
+from corpbondabm.randomstreams import make_streams
 from corpbondabm.trader2017_r1 import MutualFund2, InsuranceCo, Dealer
 
 TREYNOR_BOUNDS = (0.01, 0.0125)
 TREYNOR_FACTOR = 10000
 PRIMER = 8
+COLORS = ['DarkOrange', 'DarkBlue', 'DarkGreen', 'Chartreuse', 'DarkRed']
+LABELS = 12
+MAX_POINTS = 2000
+FRAME_RATE = 10
+FONT = {'family': 'serif', 'serif': ['Cambria', 'Times New Roman', 'DejaVu Serif']}
 
 BONDS = [
          {'Name': 'MM101', 'Nominal': 500000, 'Maturity': 1, 'Coupon': 0.0175, 'Yield': 0.015, 'NPer': 2},
@@ -27,25 +31,125 @@ D_SPECIAL = {
              'd3': {'MM101': 0.5, 'MM102': 0.5, 'MM103': 0.75, 'MM104': 0.9, 'MM105': 0.9}
             }
 
-class Charter(object):
+class PriceChart(object):
+    '''
+    PriceChart
+    
+    base class for the price charts: one line per bond, drawn from per-bond arrays that 
+    grow by doubling. Each day's prices are appended and at most max_points of them are 
+    drawn per line, every k-th day once the history is longer. With headless=True the 
+    figure is drawn with Agg and no display is needed.
+    '''
+    
+    def setup_chart(self, bond_names, end_date, headless=False, max_points=MAX_POINTS, capacity=256, start_date=PRIMER):
+        self.bond_names = list(bond_names)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.headless = headless
+        self.max_points = max_points
+        self.chart_days = np.zeros(max(capacity, 1))
+        self.chart_prices = np.zeros((len(self.bond_names), len(self.chart_days)))
+        self.chart_size = 0
+        self.fig, self.ax, self.lines, = self.makefig()
+        
+    def append_prices(self, days, prices):
+        '''Append n days: days (n,) and prices (n x bonds)'''
+        n, size = len(days), self.chart_size
+        if size + n > len(self.chart_days):
+            capacity = max(2*len(self.chart_days), size + n)
+            self.chart_days = np.resize(self.chart_days, capacity)
+            chart_prices = np.zeros((len(self.bond_names), capacity))
+            chart_prices[:, :size] = self.chart_prices[:, :size]
+            self.chart_prices = chart_prices
+        self.chart_days[size:size+n] = days
+        self.chart_prices[:, size:size+n] = np.transpose(prices)
+        self.chart_size = size + n
+        
+    def draw_lines(self):
+        keep = self.decimate(self.chart_size)
+        x = self.chart_days[keep]
+        for ix, line in enumerate(self.lines):
+            line.set_data(x, self.chart_prices[ix, keep])
+        return tuple(self.lines)
+            
+    def decimate(self, n):
+        '''Positions of the first n days to draw: all of them, or every k-th (and the last) past max_points'''
+        if n <= self.max_points:
+            return slice(0, n)
+        step = -(-n // self.max_points)
+        keep = np.arange(0, n, step)
+        return np.append(keep, n-1) if keep[-1] != n-1 else keep
+        
+    def makefig(self):
+        # matplotlib is imported when the first chart is made, not with the module
+        import matplotlib
+        matplotlib.rc('font', **FONT)
+        if self.headless:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            fig = Figure(figsize=(13,9))
+            FigureCanvasAgg(fig)
+        else:
+            import matplotlib.pyplot as plt
+            fig = plt.figure(figsize=(13,9))
+        ax = fig.add_subplot(111)
+        ax.axis([self.start_date, self.end_date, 40, 104])
+        ax.set_xlabel('Date')
+        ax.set_ylabel('Price')
+        lines = []
+        # one line per bond; past the named colors use the default cycle, and only the first LABELS bonds are labelled
+        for i, bond in enumerate(self.bond_names):
+            c = COLORS[i] if i < len(COLORS) else 'C%d' % (i % 10)
+            line_obj = ax.plot([], [], lw=2 if i < len(COLORS) else 1, color=c)[0]
+            lines.append(line_obj)
+            if i < LABELS:
+                ax.text(0.05+0.075*i, 1.0, bond, transform=ax.transAxes, ha="right", va="bottom", color=c, fontweight="light", fontsize=10)
+        return fig, ax, lines
+    
+    def setup_plot(self):
+        for line in self.lines:
+            line.set_data([], [])
+        return tuple(self.lines)
+    
+    def animate_chart(self, func, frames, interval, **kwargs):
+        '''Show the chart, calling func(frame) for each of frames every interval ms'''
+        import matplotlib.animation as animation
+        import matplotlib.pyplot as plt
+        self.animate = animation.FuncAnimation(self.fig, func, frames, init_func=self.setup_plot, interval=interval, 
+                                               repeat=False, **kwargs)
+        self.show = plt.show()
+
+
+class Charter(PriceChart):
     
     def __init__(self, market_name='bondmarket1', bonds=BONDS, d_special=D_SPECIAL,
                  mm_name='m1', mm_share=0.15, mm_lower=0.03, mm_upper=0.08, mm_target=0.05,
                  ic_name='i1', ic_bond=0.6, dealer_long=0.1, dealer_short=0.075, run_steps=252,
-                 year=2003):
+                 year=2003, seed=None, rng_block=0, profiler=None, headless=False, output=None,
+                 frame_file=None, frame_every=1, max_points=MAX_POINTS):
+        '''
+        The simulation runs in the animation callback, one day per frame. headless=True 
+        runs it without a display instead: every frame_every-th day is saved to 
+        frame_file (a pattern such as 'frame_%04d.png', formatted with the day) and the 
+        final chart to output. See FeedCharter to watch a run from another process.
+        '''
+        self.streams = make_streams(['runner', market_name, mm_name, ic_name]+list(d_special), seed, rng_block)
+        self.rng = self.streams['runner']
         self.bondmarket = self.make_market(market_name, year, bonds)
         self.mutualfund = self.make_mutual_fund(mm_name, mm_share, mm_lower, mm_upper, mm_target)
         self.insuranceco = self.make_insurance_co(ic_name, 1-mm_share, ic_bond, year)
         self.dealers, self.dealers_dict = self.make_dealers(dealer_long, dealer_short, d_special)
         self.run_steps = run_steps
+        self.profiler = profiler
         self.seed_mutual_fund(PRIMER)
-        self.fig, self.ax, self.lines, = self.makefig()
-        self.animate = animation.FuncAnimation(self.fig, self.run_mcs_chart, np.arange(PRIMER, self.run_steps, 1),
-                                               init_func=self.setup_plot, interval=100, repeat=False, blit=True)
-        self.show = plt.show()
+        self.setup_chart(self.bondmarket.universe.names, run_steps, headless, max_points, run_steps-PRIMER)
+        if headless:
+            self.run_headless(output, frame_file, frame_every)
+        else:
+            self.animate_chart(self.run_mcs_chart, np.arange(PRIMER, self.run_steps, 1), 100, blit=True)
         
     def make_market(self, name, year, bonds):
-        bondmarket = BondMarket(name, year)
+        bondmarket = BondMarket(name, year, rng=self.streams[name])
         for bond in bonds:
             bondmarket.add_bond(bond['Name'], bond['Nominal'], bond['Maturity'], bond['Coupon'], bond['Yield'], bond['NPer'])
         return bondmarket
@@ -59,7 +163,7 @@ class Charter(object):
             mm_bond = {'Name': bond['Name'], 'Nominal': share*bond['Nominal'], 'Maturity': bond['Maturity'],
                        'Coupon': bond['Coupon'], 'Yield': bond['Yield'], 'Price': bond['Price']}
             portfolio[bond['Name']] = mm_bond
-        m1 = MutualFund2(name, ll, ul, target, bond_list, portfolio, nominal_weights, 100000)
+        m1 = MutualFund2(name, ll, ul, target, bond_list, portfolio, nominal_weights, 100000, self.streams[name])
         return m1
         
     def make_insurance_co(self, name, share, bond_weight, year):
@@ -70,7 +174,7 @@ class Charter(object):
             ic_bond = {'Name': bond['Name'], 'Nominal': share*bond['Nominal'], 'Maturity': bond['Maturity'],
                        'Coupon': bond['Coupon'], 'Yield': bond['Yield'], 'Price': bond['Price']}
             portfolio[bond['Name']] = ic_bond
-        i1 = InsuranceCo(name, 1-bond_weight, bond_list, portfolio, year)
+        i1 = InsuranceCo(name, 1-bond_weight, bond_list, portfolio, year, self.streams[name])
         return i1
     
     def make_dealer(self, name, special, long_limit, short_limit):
@@ -80,16 +184,16 @@ class Charter(object):
             d_bond = {'Name': bond['Name'], 'Nominal': bond['Nominal'], 'Price': bond['Price'], 'Specialization': special[bond['Name']]}
             bond_list.append(bond['Name'])
             portfolio[bond['Name']] = d_bond
-        return Dealer(name, bond_list, portfolio, long_limit, short_limit, TREYNOR_BOUNDS, TREYNOR_FACTOR)
+        return Dealer(name, bond_list, portfolio, long_limit, short_limit, TREYNOR_BOUNDS, TREYNOR_FACTOR, self.streams[name])
     
     def make_dealers(self, ul, ll, d_special):
         dealers = [self.make_dealer(name, special, ul, ll) for name, special in d_special.items()]
-        dealers_dict = dict(zip(['d%i' % i for i in range(1, 4)], dealers))
+        dealers_dict = {dealer._trader_id: dealer for dealer in dealers}
         return dealers, dealers_dict
     
     def make_buyside(self):
         buyside = np.array([self.insuranceco, self.mutualfund])
-        np.random.shuffle(buyside)
+        self.rng.shuffle(buyside)
         #return buyside
         return np.array([self.mutualfund])
 
@@ -98,60 +202,136 @@ class Charter(object):
             self.mutualfund.update_prices(self.bondmarket.last_prices)
             self.mutualfund.add_nav_to_history(current_date)
             
-    def make_chart_data(self):
-        temp_df = pd.DataFrame(self.bondmarket.price_history)
-        bonds = [x['Name'] for x in self.bondmarket.bonds]
-        x = [np.array(temp_df.Date)]*len(bonds) 
-        y = [temp_df[x] for x in bonds]
-        for ix, line in enumerate(self.lines):
-            line.set_data(x[ix], y[ix])
+    def make_chart_data(self, j):
+        '''Append day j's prices to the chart buffers and point the lines at them'''
+        self.append_prices([j], self.bondmarket.universe.last_price[None, :])
+        self.draw_lines()
         
-    def makefig(self):
-        fig = plt.figure(figsize=(13,9))
-        ax = fig.add_subplot(111)
-        ax.axis([PRIMER, self.run_steps, 40, 104])
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Price')
-        colors = ['DarkOrange', 'DarkBlue', 'DarkGreen', 'Chartreuse', 'DarkRed']
-        bonds = [x['Name'] for x in self.bondmarket.bonds]
-        lines = []
-        for i, c in enumerate(colors):
-            line_obj = ax.plot([], [], lw=2, color=c)[0]
-            lines.append(line_obj)
-            ax.text(0.05+0.075*i, 1.0, bonds[i], transform=ax.transAxes, ha="right", va="bottom", color=c, fontweight="light", fontsize=10)
-        return fig, ax, lines
-    
-    def setup_plot(self):
-        for line in self.lines:
-            line.set_data([], [])
-        return tuple(self.lines)
+    def run_headless(self, output=None, frame_file=None, frame_every=1):
+        for j in range(PRIMER, self.run_steps):
+            self.run_mcs_chart(j)
+            if frame_file is not None and (j - PRIMER) % frame_every == 0:
+                self.fig.savefig(frame_file % j)
+        if output is not None:
+            self.fig.savefig(output)
         
     def run_mcs_chart(self, j):
+        prof = self.profiler
+        if prof is not None:
+            trades = self.bondmarket.trade_sequence
+            prof.begin_step(j)
         for buyside in self.make_buyside():
             buyside.make_portfolio_decision(j)
+            if prof is not None:
+                prof.lap('decisions')
             if buyside.rfq_collector:
                 for rfq in buyside.rfq_collector:
                     quotes = [d.make_quote(rfq) for d in self.dealers]
+                    if prof is not None:
+                        prof.lap('quotes')
+                        prof.count('Rfqs')
                     # Note: selected dealer and buyside know the new price
                     if any(quotes):
                         dealer_confirm, buyside_confirm = self.bondmarket.match_trade(quotes, j)
+                        if prof is not None:
+                            prof.lap('matching')
                         self.dealers_dict[dealer_confirm['Dealer']].modify_portfolio(dealer_confirm)
                         buyside.modify_portfolio(buyside_confirm)
+                        if prof is not None:
+                            prof.lap('confirms')
+                    elif prof is not None:
+                        prof.count('Rejected')
         # All agents get price updates from the bondmarket at the end of the day
         self.bondmarket.update_eod_bond_price(j)
         if j == 50:
             self.bondmarket.shock_ytm(0.01)
+        if prof is not None:
+            prof.lap('repricing')
+            prof.count('NewtonIterations', self.bondmarket.newton_iterations)
         prices = self.bondmarket.last_prices
         for d in self.dealers:
             d.update_prices(prices)
         self.mutualfund.update_prices(prices)
-        self.mutualfund.add_nav_to_history(j)
         self.insuranceco.update_prices(prices)
         self.bondmarket.print_last_prices(j)
-        self.make_chart_data()
+        if prof is not None:
+            prof.lap('broadcast')
+        self.mutualfund.add_nav_to_history(j)
+        if prof is not None:
+            prof.lap('nav')
+        self.make_chart_data(j)
+        if prof is not None:
+            prof.lap('chart')
+            prof.count('Trades', self.bondmarket.trade_sequence - trades)
+            prof.end_step()
         return tuple(self.lines)
+
+
+class FeedCharter(PriceChart):
+    '''
+    FeedCharter
+    
+    live chart of a simulation running in another process: attaches read-only to the 
+    PriceFeed named feed_name and, fps times a second, draws whatever days have been 
+    published since the last frame. The simulation never waits for the chart. Stops 
+    once the publisher has finished and every day has been drawn.
     
+    bond_names is the feed's column order (PricePublisher.bond_names) and start_date and
+    end_date the first and last day, for the x axis. With headless=True the feed is polled without a display 
+    and the final chart is saved to output.
+    '''
+    
+    def __init__(self, feed_name, bond_names, end_date, fps=FRAME_RATE, headless=False, output=None,
+                 max_points=MAX_POINTS, start_date=PRIMER):
+        self.feed = PriceFeed.attach(feed_name)
+        self.since = 0
+        self.fps = fps
+        self.setup_chart(bond_names, end_date, headless, max_points, start_date=start_date)
+        try:
+            if headless:
+                self.run_headless(output)
+            else:
+                self.animate_chart(self.update_chart, self.frames(), 1000/fps, blit=False, cache_frame_data=False)
+        finally:
+            self.feed.close()
+            
+    def __repr__(self):
+        return 'FeedCharter({0})'.format(self.feed.name)
+        
+    def frames(self):
+        while True:
+            done = self.feed.closed
+            yield self.since
+            if done and self.since == self.feed.count:
+                return
+    
+    def update_chart(self, frame=None):
+        rows, self.since = self.feed.read(self.since)
+        if len(rows):
+            columns = self.feed.unpack(rows)
+            self.append_prices(columns['Day'], columns['Prices'])
+            self.ax.set_title('Day %d   NAV per share %.4f   Dealer inventory %.0f' % (columns['Day'][-1], 
+                              columns['NAVPerShare'][-1], columns['DealerInventory'][-1].sum()), fontsize=10)
+        return self.draw_lines()
+    
+    def run_headless(self, output=None):
+        for _ in self.frames():
+            self.update_chart()
+            time.sleep(1/self.fps)
+        if output is not None:
+            self.fig.savefig(output)
+
 
+def live_chart(config=None, fps=FRAME_RATE, capacity=None, **chart_args):
+    '''
+    Run a Runner (config: its keyword arguments) in a publisher process at full speed and 
+    chart it live here; returns the FeedCharter
+    '''
+    config = dict(config or {})
+    run_steps = config.get('run_steps', 252)
+    primer = config.get('primer', PRIMER)
+    with PricePublisher(config, capacity or run_steps+1) as publisher:
+        return FeedCharter(publisher.feed.name, publisher.bond_names, primer+run_steps, fps, start_date=primer, **chart_args)
 
                     
                         
@@ -187,7 +367,8 @@ if __name__ == '__main__':
                 #}
     
     # Chart output prices
-    market1 = Charter(mm_share=mm_share, run_steps=run_steps, year=year)
+    market1 = Charter(mm_share=mm_share, run_steps=run_steps, year=year, profiler=PhaseProfiler())
+    print(market1.profiler.report())
     
 
 
@@ -0,0 +1,182 @@
+import numpy as np
+
+from collections import namedtuple
+
+from corpbondabm import marketdata
+from corpbondabm.bondmarket2017_r1 import SIDES, take_prices
+from corpbondabm.randomstreams import RandomStream
+from corpbondabm.trader2017_r1 import ALPHA, BETA_D, BETA_D1, BETA_W, BETA_W1, NAV_WINDOW
+
+RfqBatch = namedtuple('RfqBatch', ['Fund', 'Bond', 'Side', 'Amount', 'OrderNumber'])
+
+
+class Cohort(object):
+    '''
+    Cohort
+
+    base class for N buy side traders of one kind held as arrays: nominal and price are
+    (N x bonds), one row per fund. Fund k trades under the name names[k].
+
+    make_portfolio_decision returns an RfqBatch of parallel arrays (fund, bond position,
+    SIDES code, amount, rfq number) in fund then bond order, the order N separate traders
+    would have sent them in.
+    '''
+
+    def __init__(self, name, n, bond_list, nominal, prices, rng=None):
+        self._trader_id = name
+        self.n = n
+        self.names = ['%s_%d' % (name, k) for k in range(n)]
+        self.bond_list = bond_list
+        self.index = {bond: j for j, bond in enumerate(bond_list)}
+        self.nominal = np.array(np.broadcast_to(np.asarray(nominal, dtype=float), (n, len(bond_list))))
+        self.price = np.array(np.broadcast_to(np.asarray(prices, dtype=float), (n, len(bond_list))))
+        self.rfq_sequence = np.zeros(n, dtype=np.int64)
+        self.rfqs = self.make_batch(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8), np.zeros(0))
+        self.rng = rng if rng is not None else RandomStream()
+        self._market_order = None
+
+    def __repr__(self):
+        return 'Cohort({0}, {1}, {2})'.format(self._trader_id, self.trader_type, self.n)
+
+    def __len__(self):
+        return self.n
+
+    def make_batch(self, fund, bond, side, amount):
+        '''RfqBatch for rfqs sorted by fund, numbering each fund's rfqs on from its last one'''
+        counts = np.bincount(fund, minlength=self.n)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        order_number = self.rfq_sequence[fund] + np.arange(len(fund)) - first + 1
+        self.rfq_sequence += counts
+        return RfqBatch(fund, bond, side, amount, order_number)
+
+    def rfq_dicts(self, batch=None):
+        '''The batch as rfq dicts, as a single BuySide would put in its rfq_collector'''
+        batch = self.rfqs if batch is None else batch
+        return [{'order_id': '%s_%d' % (self.names[k], number), 'name': self.bond_list[j], 'side': SIDES[side], 'amount': amount}
+                for k, j, side, amount, number in zip(batch.Fund.tolist(), batch.Bond.tolist(), batch.Side.tolist(),
+                                                      batch.Amount.tolist(), batch.OrderNumber.tolist())]
+
+    def update_prices(self, prices):
+        '''prices: a dict by bond name or the market's PriceView, read as one array for every fund'''
+        self.price[:], self._market_order = take_prices(prices, self.bond_list, self._market_order)
+
+    def compute_portfolio_value(self):
+        return np.sum(self.nominal*self.price/100, axis=1)
+
+    def fill(self, k, j, size, price):
+        '''Fund k's fill in bond j: size is signed (negative to sell)'''
+        self.nominal[k, j] += size
+        self.price[k, j] = price
+        self.pay(k, size*price/100)
+
+    def end_of_day(self, step, prices):
+        self.update_prices(prices)
+
+
+class MutualFundCohort(Cohort):
+    '''
+    MutualFundCohort
+
+    N MutualFund2 traders as arrays: cash, shares and the cash band (lower_bound,
+    upper_bound, target; scalars or one per fund) are length N. The last NAV_WINDOW NAV
+    rows are kept per fund in a ring buffer for the flow model.
+    '''
+
+    NAV_FIELDS = ('BondValue', 'Cash', 'NAV', 'NAVPerShare', 'CashFlow')
+
+    def __init__(self, name, n, lower_bound, upper_bound, target, bond_list, nominal, prices, weights, shares, rng=None):
+        Cohort.__init__(self, name, n, bond_list, nominal, prices, rng)
+        self.trader_type = 'MutualFund'
+        self.lower_bound = np.broadcast_to(np.asarray(lower_bound, dtype=float), (n,))
+        self.upper_bound = np.broadcast_to(np.asarray(upper_bound, dtype=float), (n,))
+        self.target = np.broadcast_to(np.asarray(target, dtype=float), (n,))
+        self.index_weight_array = np.array([weights[x] for x in bond_list])
+        self.shares = np.array(np.broadcast_to(np.asarray(shares, dtype=float), (n,)))
+        self.nav_ring = {field: np.zeros((NAV_WINDOW, n)) for field in self.NAV_FIELDS}
+        self.nav_steps = np.full(NAV_WINDOW, -1, dtype=np.int64)
+        bond_value = self.compute_portfolio_value()
+        self.cash = self.target*bond_value/(1-self.target)
+        self.add_nav_to_history(0)
+
+    def nav(self, step, field='NAV'):
+        slot = step % NAV_WINDOW
+        if self.nav_steps[slot] != step:
+            raise KeyError(step)
+        return self.nav_ring[field][slot]
+
+    def pay(self, k, amount):
+        self.cash[k] -= amount
+
+    def add_nav_to_history(self, step):
+        bond_value = self.compute_portfolio_value()
+        cash = self.cash
+        nav_per_share = (bond_value + cash)/self.shares
+        expected_cash_flow = self.compute_flow(step) if step >= 8 else np.zeros(self.n)
+        self.cash = cash + expected_cash_flow
+        self.shares = self.shares + expected_cash_flow/nav_per_share
+        nav = bond_value + self.cash
+        slot = step % NAV_WINDOW
+        self.nav_steps[slot] = step
+        for field, value in zip(self.NAV_FIELDS, (bond_value, cash, nav, nav/self.shares, expected_cash_flow)):
+            self.nav_ring[field][slot] = value
+
+    def compute_flow(self, step):
+        nav_lag1 = self.nav(step-1, 'NAVPerShare')
+        retdaily_lag1 = nav_lag1/self.nav(step-2, 'NAVPerShare') - 1
+        retweekly_lag1 = nav_lag1/self.nav(step-6, 'NAVPerShare') - 1
+        flow_ratio = ALPHA + BETA_D*retdaily_lag1 + BETA_D1*(retdaily_lag1<0) + BETA_W*retweekly_lag1 + BETA_W1*(retweekly_lag1<0)
+        return flow_ratio*self.nav(step-1, 'NAV')
+
+    def make_portfolio_decision(self, step):
+        '''MutualFund2.make_portfolio_decision for every fund at once; returns the RfqBatch'''
+        current_nav = self.nav(step-1)
+        sell = self.cash < self.lower_bound*current_nav
+        buy = ~sell & (self.cash > self.upper_bound*current_nav)
+        cash_to_raise = self.target*current_nav - self.cash
+        sizes = np.abs(np.round(self.index_weight_array*cash_to_raise[:, None]/(self.price/100), 0))
+        active = (sell | buy)[:, None] & (sizes >= 1.0)
+        sides = np.where(sell, SIDES.index('sell'), SIDES.index('buy')).astype(np.int8)
+        fund, bond = np.nonzero(active)
+        self.rfqs = self.make_batch(fund, bond, sides[fund], sizes[fund, bond])
+        return self.rfqs
+
+    def end_of_day(self, step, prices):
+        self.update_prices(prices)
+        self.add_nav_to_history(step)
+
+
+class InsuranceCohort(Cohort):
+    '''
+    InsuranceCohort
+
+    N InsuranceCo traders as arrays: equity and the bond weight target are length N.
+    All insurers earn the same equity returns for the year; each picks its own random bond
+    when it rebalances.
+    '''
+
+    def __init__(self, name, n, equity_weight_target, bond_list, nominal, prices, year, rng=None):
+        Cohort.__init__(self, name, n, bond_list, nominal, prices, rng)
+        self.trader_type = 'InsuranceCo'
+        equity_weight_target = np.broadcast_to(np.asarray(equity_weight_target, dtype=float), (n,))
+        self.bond_weight_target = 1 - equity_weight_target
+        self.equity_returns = np.array(marketdata.load_equity_returns(year))
+        self.equity = equity_weight_target*self.compute_portfolio_value()/(1-equity_weight_target)
+
+    def pay(self, k, amount):
+        self.equity[k] -= amount
+
+    def make_portfolio_decision(self, step):
+        '''InsuranceCo.make_portfolio_decision for every insurer at once; returns the RfqBatch'''
+        self.equity *= (1+self.equity_returns[step-1])
+        bond_value = self.compute_portfolio_value()
+        portfolio_value = self.equity+bond_value
+        equity_percent = self.equity/portfolio_value
+        bond_diff = bond_value - self.bond_weight_target*portfolio_value
+        active = ((equity_percent < 0.395) | (equity_percent > 0.405)) & (np.abs(bond_diff) >= 1.0)
+        bond = self.rng.integers(0, len(self.bond_list), self.n)
+        bond_price = self.price[np.arange(self.n), bond]/100
+        sizes = np.abs(np.round(bond_diff/bond_price, 0))
+        sides = np.where(bond_diff >= 1.0, SIDES.index('sell'), SIDES.index('buy')).astype(np.int8)
+        fund = np.flatnonzero(active)
+        self.rfqs = self.make_batch(fund, bond[fund], sides[fund], sizes[fund])
+        return self.rfqs
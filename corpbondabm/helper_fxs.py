@@ -1,16 +1,112 @@
 import numpy as np
 
-    
+from collections import OrderedDict
+
+CASHFLOW_CACHE_SIZE = 1024
+
+
+class CashFlowCache(object):
+    '''
+    CashFlowCache
+
+    LRU cache of cash-flow schedules (per unit nominal) keyed on (maturity, coupon, nper)
+
+    grid() stacks the schedules for a whole universe into zero-padded (bonds x periods)
+    matrices and keeps the last grid, so a universe that does not change between days
+    is not rebuilt.
+    '''
+
+    def __init__(self, maxsize=CASHFLOW_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._schedules = OrderedDict()
+        self._grid_terms = None
+        self._grid = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._schedules)
+
+    def schedule(self, maturity, coupon, nper):
+        key = (float(maturity), float(coupon), int(nper))
+        try:
+            times, cash_flows = self._schedules[key]
+            self._schedules.move_to_end(key)
+            self.hits += 1
+            return times, cash_flows
+        except KeyError:
+            self.misses += 1
+        periods = int(round(key[2]*key[0]))
+        times = np.arange(1, periods+1)/key[2]
+        cash_flows = np.full(periods, key[1]/key[2])
+        cash_flows[-1] += 1
+        times.flags.writeable = False
+        cash_flows.flags.writeable = False
+        self._schedules[key] = (times, cash_flows)
+        if len(self._schedules) > self.maxsize:
+            self._schedules.popitem(last=False)
+        return times, cash_flows
+
+    def grid(self, maturities, coupons, nper):
+        maturities, coupons, nper = np.broadcast_arrays(np.asarray(maturities, dtype=float),
+                                                        np.asarray(coupons, dtype=float), np.asarray(nper, dtype=float))
+        terms = (maturities, coupons, nper)
+        if self._grid_terms is not None and all(np.array_equal(a, b) for a, b in zip(terms, self._grid_terms)):
+            return self._grid
+        rows = [self.schedule(m, c, n) for m, c, n in zip(maturities.tolist(), coupons.tolist(), nper.tolist())]
+        width = max(len(t) for t, _ in rows) if rows else 0
+        times = np.zeros((len(rows), width))
+        cash_flows = np.zeros((len(rows), width))
+        for i, (t, cf) in enumerate(rows):
+            times[i, :len(t)] = t
+            cash_flows[i, :len(cf)] = cf
+        self._grid_terms = tuple(a.copy() for a in terms)
+        self._grid = (times, cash_flows)
+        return self._grid
+
+    def clear(self):
+        self._schedules.clear()
+        self._grid_terms = None
+        self._grid = None
+
+
+CASHFLOW_CACHE = CashFlowCache()
+
+
+def bond_analytics(maturities, coupons, ytms, nominals=100, nper=2, cache=CASHFLOW_CACHE):
+    '''
+    Batched price and risk measures for a universe of bonds
+
+    Returns a dict of arrays: Price (per 100 nominal), Macaulay and Modified duration,
+    Convexity and DV01 (value change of the nominal held for a one basis point move).
+    '''
+    times, cash_flows = cache.grid(maturities, coupons, nper)
+    nper = np.broadcast_to(np.asarray(nper, dtype=float), times.shape[:1])[:, None]
+    rate = np.asarray(ytms, dtype=float)[:, None]/nper
+    periods = times*nper
+    discounted_cf = cash_flows*np.power(1+rate, -periods)
+    price = discounted_cf.sum(axis=1)
+    mac_duration = (times*discounted_cf).sum(axis=1)/price
+    mod_duration = mac_duration/(1+rate[:, 0])
+    convexity = (discounted_cf*periods*(periods+1)).sum(axis=1)/(price*((1+rate[:, 0])*nper[:, 0])**2)
+    dv01 = mod_duration*price*np.asarray(nominals)*0.0001
+    return {'Price': 100*price, 'Macaulay': mac_duration, 'Modified': mod_duration, 'Convexity': convexity, 'DV01': dv01}
+
+
 def add_durations(self):
-    self.durations = [self.get_duration(x['Nominal'], x['Maturity'], x['Coupon'], x['Yield'], 2) for x in self.bonds]
-    
-    
+    u = self.universe
+    self.durations = bond_analytics(u.maturity, u.coupon, u.ytm, u.nominal, u.nper)['Modified'].tolist()
+
+
+def add_risk_measures(self):
+    u = self.universe
+    self.risk_measures = bond_analytics(u.maturity, u.coupon, u.ytm, u.nominal, u.nper)
+
+
 def get_duration(self, nominal, maturity, coupon, ytm, nper):
-    cash_flows = [nominal*coupon/nper]*(nper*maturity)
-    cash_flows[-1] += nominal
-    times = [0.5*j for j in range(1, len(cash_flows)+1)]
-    discounted_cf = np.array([pow(1+ytm/nper, -i*nper) for i in times])*cash_flows
+    times, cash_flows = CASHFLOW_CACHE.schedule(maturity, coupon, nper)
+    discounted_cf = nominal*cash_flows*np.power(1+ytm/nper, -times*nper)
     price = np.sum(discounted_cf)
     mac_duration = np.sum(times*discounted_cf/price)
     mod_duration = mac_duration/(1+ytm/nper)
-    return mod_duration
\ No newline at end of file
+    return mod_duration
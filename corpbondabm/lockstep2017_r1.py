@@ -0,0 +1,193 @@
+import numpy as np
+
+from corpbondabm.bondmarket2017_r1 import BondMarket
+from corpbondabm.runner2017_r1 import BONDS, D_SPECIAL, PRIMER, TREYNOR_BOUNDS, TREYNOR_FACTOR
+from corpbondabm.trader2017_r1 import ALPHA, BETA_D, BETA_D1, BETA_W, BETA_W1, treynor_quotes
+
+SHOCK_DAY = 50
+
+
+class LockstepRunner(object):
+    '''
+    LockstepRunner
+
+    Runs K replications ("worlds") of the Runner market in lockstep. Bond prices and
+    yields are (K x bonds) arrays, dealer inventories and dealer prices are
+    (K x dealers x bonds) and the mutual fund's cash, shares and NAV history are per world,
+    so one pass of the day's logic (MutualFund2 decision, Dealer.make_quote,
+    BondMarket.match_trade and update_eod_bond_price) serves every world.
+
+    Worlds differ through the dealer tie-break draws and, optionally, through the size of
+    the yield shock applied on SHOCK_DAY (shocks: scalar or one value per world).
+    tie_break='first' picks the lowest-numbered dealer among equal best quotes instead of
+    a random one. The insurance company only receives prices in Runner, so it is not
+    modelled here.
+    '''
+
+    def __init__(self, worlds=8, market_name='bondmarket1', bonds=BONDS, d_special=D_SPECIAL,
+                 mm_share=0.15, mm_lower=0.03, mm_upper=0.07, mm_target=0.05,
+                 dealer_long=0.1, dealer_short=0.075, run_steps=252, year=2003,
+                 shocks=0.01, shock_day=SHOCK_DAY, seed=None, tie_break='random'):
+        self.worlds = worlds
+        self.run_steps = run_steps
+        self.shock_day = shock_day
+        self.shocks = np.broadcast_to(np.asarray(shocks, dtype=float), (worlds,))
+        self.rng = np.random.default_rng(seed)
+        self.tie_break = tie_break
+        self.bondmarket = self.make_market(market_name, year, bonds)
+        self.make_mutual_fund(mm_share, mm_lower, mm_upper, mm_target)
+        self.make_dealers(dealer_long, dealer_short, d_special)
+        self.seed_mutual_fund(PRIMER)
+        self.run_mcs(PRIMER)
+
+    def __repr__(self):
+        return 'LockstepRunner({0}, {1})'.format(self.bondmarket, self.worlds)
+
+    def make_market(self, name, year, bonds):
+        bondmarket = BondMarket(name, year)
+        for bond in bonds:
+            bondmarket.add_bond(bond['Name'], bond['Nominal'], bond['Maturity'], bond['Coupon'], bond['Yield'], bond['NPer'])
+        u = bondmarket.universe
+        self.bond_names = list(u.names)
+        self.ytm = np.tile(u.ytm, (self.worlds, 1))
+        self.last_prices = np.tile(u.last_price, (self.worlds, 1))
+        steps = PRIMER + self.run_steps
+        self.price_history = np.full((steps, self.worlds, u.size), np.nan)
+        self.trades = np.zeros(self.worlds, dtype=int)
+        return bondmarket
+
+    def make_mutual_fund(self, share, ll, ul, target):
+        u = self.bondmarket.universe
+        self.mm_lower, self.mm_upper, self.mm_target = ll, ul, target
+        self.mm_weights = u.nominal/np.sum(u.nominal)
+        self.mm_nominal = np.tile(share*u.nominal, (self.worlds, 1))
+        self.mm_prices = self.last_prices.copy()
+        self.mm_shares = np.full(self.worlds, 100000.0)
+        steps = PRIMER + self.run_steps
+        self.nav_history = {c: np.full((self.worlds, steps), np.nan) for c in ('BondValue', 'Cash', 'NAV', 'NAVPerShare', 'CashFlow')}
+        bond_value = self.mm_nominal @ u.price/100
+        self.mm_cash = target*bond_value/(1-target)
+        self.add_nav_to_history(0)
+
+    def make_dealers(self, long_limit, short_limit, d_special):
+        u = self.bondmarket.universe
+        self.dealer_names = list(d_special)
+        dealers = len(self.dealer_names)
+        self.specialization = np.array([[d_special[name][bond] for bond in self.bond_names] for name in self.dealer_names])
+        self.lower_limits = np.tile(-u.nominal*short_limit, (dealers, 1))
+        self.upper_limits = np.tile(u.nominal*long_limit, (dealers, 1))
+        self.dealer_quantity = np.zeros((self.worlds, dealers, u.size))
+        self.dealer_prices = np.tile(u.price, (self.worlds, dealers, 1))
+        self.lower_bound, self.upper_bound = TREYNOR_BOUNDS
+        self.spread_factor = TREYNOR_FACTOR
+
+    def seed_mutual_fund(self, prime1):
+        for current_date in range(prime1):
+            self.mm_prices[:] = self.last_prices
+            self.add_nav_to_history(current_date)
+
+    def add_nav_to_history(self, step):
+        bond_value = np.einsum('kb,kb->k', self.mm_nominal, self.mm_prices)/100
+        cash = self.mm_cash
+        nav_per_share = (bond_value + cash)/self.mm_shares
+        expected_cash_flow = self.compute_flow(step) if step >= 8 else np.zeros(self.worlds)
+        self.mm_cash = cash + expected_cash_flow
+        self.mm_shares = self.mm_shares + expected_cash_flow/nav_per_share
+        nav = bond_value + self.mm_cash
+        self.nav_history['BondValue'][:, step] = bond_value
+        self.nav_history['Cash'][:, step] = cash
+        self.nav_history['NAV'][:, step] = nav
+        self.nav_history['NAVPerShare'][:, step] = nav/self.mm_shares
+        self.nav_history['CashFlow'][:, step] = expected_cash_flow
+
+    def compute_flow(self, step):
+        nav_per_share = self.nav_history['NAVPerShare']
+        nav_lag1 = nav_per_share[:, step-1]
+        retdaily_lag1 = nav_lag1/nav_per_share[:, step-2] - 1
+        retweekly_lag1 = nav_lag1/nav_per_share[:, step-6] - 1
+        flow_ratio = ALPHA + BETA_D*retdaily_lag1 + BETA_D1*(retdaily_lag1<0) + BETA_W*retweekly_lag1 + BETA_W1*(retweekly_lag1<0)
+        return flow_ratio*self.nav_history['NAV'][:, step-1]
+
+    def make_portfolio_decision(self, step):
+        '''
+        MutualFund2.make_portfolio_decision for every world
+
+        Returns (K x bonds) signed rfq sizes: positive when the fund sells (the dealer's
+        inventory increases), negative when it buys, zero for no rfq.
+        '''
+        current_nav = self.nav_history['NAV'][:, step-1]
+        sell = self.mm_cash < self.mm_lower*current_nav
+        buy = ~sell & (self.mm_cash > self.mm_upper*current_nav)
+        cash_to_raise = self.mm_target*current_nav - self.mm_cash
+        sizes = np.abs(np.round(self.mm_weights*cash_to_raise[:, None]/(self.mm_prices/100), 0))
+        sizes[(~(sell | buy))[:, None] | (sizes < 1.0)] = 0
+        return np.where(buy[:, None], -sizes, sizes)
+
+    def make_quotes(self, bond, signed_size):
+        '''
+        Dealer.make_quote for every dealer in every world for one bond
+
+        signed_size is the (K,) change in dealer inventory the rfq would cause. Returns
+        (K x dealers) quote prices, NaN where the dealer would breach its limits.
+        '''
+        quotes, _ = treynor_quotes(self.dealer_quantity[:, :, bond], self.lower_limits[:, bond], self.upper_limits[:, bond],
+                                   self.dealer_prices[:, :, bond], signed_size[:, None], self.lower_bound, self.upper_bound,
+                                   self.spread_factor)
+        return quotes
+
+    def match_trade(self, quotes, signed_size):
+        '''
+        BondMarket.match_trade for every world: best bid for fund sells, best ask for fund
+        buys, ties broken per self.tie_break. Returns the winning dealer per world (-1 when
+        no dealer quoted).
+        '''
+        score = np.where(signed_size[:, None] > 0, -quotes, quotes)
+        score = np.where(np.isnan(score), np.inf, score)
+        best = score.min(axis=1)
+        ties = (score == best[:, None]) & np.isfinite(best)[:, None]
+        if self.tie_break == 'first':
+            pick = np.zeros(self.worlds, dtype=int)
+        else:
+            pick = (self.rng.random(self.worlds)*ties.sum(axis=1)).astype(int)
+        dealer = np.argmax(np.cumsum(ties, axis=1) > pick[:, None], axis=1)
+        return np.where(ties.any(axis=1), dealer, -1)
+
+    def trade_bond(self, bond, signed_size):
+        quotes = self.make_quotes(bond, signed_size)
+        dealer = self.match_trade(quotes, signed_size)
+        worlds = np.flatnonzero((dealer >= 0) & (signed_size != 0))
+        dealer = dealer[worlds]
+        size = signed_size[worlds]
+        price = quotes[worlds, dealer]
+        self.dealer_quantity[worlds, dealer, bond] += size
+        self.dealer_prices[worlds, dealer, bond] = price
+        self.mm_nominal[worlds, bond] -= size
+        self.mm_cash[worlds] += size*price/100
+        self.mm_prices[worlds, bond] = price
+        self.last_prices[worlds, bond] = price
+        self.trades[worlds] += 1
+
+    def update_eod_bond_price(self, step):
+        u = self.bondmarket.universe
+        ytm_delta_ps = self.bondmarket.bond_yield_changes()[step]
+        self.ytm = self.bondmarket.bond_ytms(100, u.maturity, u.coupon, self.last_prices, u.nper, self.ytm)*(1+ytm_delta_ps)
+        self.last_prices = self.bondmarket._price_bonds(100, u.maturity, u.coupon, self.ytm, u.nper)
+
+    def shock_ytm(self, shocks):
+        u = self.bondmarket.universe
+        self.ytm += shocks[:, None]
+        self.last_prices = self.bondmarket._price_bonds(100, u.maturity, u.coupon, self.ytm, u.nper)
+
+    def run_mcs(self, prime1):
+        for current_date in range(prime1, prime1+self.run_steps):
+            sizes = self.make_portfolio_decision(current_date)
+            for bond in np.flatnonzero(sizes.any(axis=0)):
+                self.trade_bond(bond, sizes[:, bond])
+            # All agents get price updates from the bondmarket at the end of the day
+            self.update_eod_bond_price(current_date)
+            if current_date == self.shock_day:
+                self.shock_ytm(self.shocks)
+            self.dealer_prices[:] = self.last_prices[:, None, :]
+            self.mm_prices[:] = self.last_prices
+            self.add_nav_to_history(current_date)
+            self.price_history[current_date] = self.last_prices
@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+
+YIELDCURVE_CSV = '../csv/yieldcurvep.csv'
+YIELDCURVE_COLUMNS = ['YTM1p', 'YTM2p', 'YTM5p', 'YTM10p', 'YTM25p']
+YIELDCURVE_TENORS = np.array([1, 2, 5, 10, 25], dtype=float)
+GSPC_CSV = '../csv/gspc.csv'
+CACHE_DIR = '.cache'
+
+_SERIES = {}
+
+
+class MarketSeries(object):
+    '''
+    MarketSeries
+
+    parsed market data held as one read-only array with a row per date, ordered by year
+
+    year() returns the rows for one year as a zero-copy view.
+    '''
+
+    def __init__(self, years, values, mtime):
+        order = np.argsort(years, kind='stable')
+        self.years = np.ascontiguousarray(years[order])
+        self.values = np.ascontiguousarray(values[order])
+        self.values.flags.writeable = False
+        self.mtime = mtime
+
+    def year(self, inyear):
+        start, stop = np.searchsorted(self.years, [inyear, inyear+1])
+        return self.values[start:stop]
+
+
+def parse_yieldcurve(csvfile):
+    import pandas as pd # only when the .npz cache is missing or stale
+    indf = pd.read_csv(csvfile, usecols=['DATE']+YIELDCURVE_COLUMNS)
+    years = pd.to_datetime(indf.DATE).dt.year.to_numpy()
+    return years, indf[YIELDCURVE_COLUMNS].to_numpy(dtype=float)
+
+
+def parse_equity_returns(csvfile):
+    import pandas as pd
+    indf = pd.read_csv(csvfile, usecols=['Date', 'Adj Close'])
+    years = pd.to_datetime(indf.Date).dt.year.to_numpy()
+    adj_close = indf['Adj Close'].to_numpy(dtype=float)
+    returns = np.full(len(adj_close), np.nan)
+    returns[1:] = (adj_close[1:]/adj_close[:-1] - 1)/100
+    return years, returns
+
+
+def cache_file(csvfile, name):
+    folder, base = os.path.split(os.path.abspath(csvfile))
+    return os.path.join(folder, CACHE_DIR, '%s.%s.npz' % (os.path.splitext(base)[0], name))
+
+
+def load_series(csvfile, parser, name):
+    '''
+    Return the parsed series for csvfile, parsing it at most once per modification time
+
+    Look in the in-process cache first, then in the .npz cache next to the CSV; only
+    when both are missing or stale is the CSV parsed, and the result is written back to
+    the .npz cache if the folder is writable.
+    '''
+    path = os.path.abspath(csvfile)
+    mtime = os.stat(path).st_mtime_ns
+    series = _SERIES.get((path, name))
+    if series is not None and series.mtime == mtime:
+        return series
+    npzfile = cache_file(path, name)
+    try:
+        with np.load(npzfile) as cached:
+            if int(cached['mtime']) != mtime:
+                raise ValueError('stale cache')
+            series = MarketSeries(cached['years'], cached['values'], mtime)
+    except (OSError, KeyError, ValueError):
+        years, values = parser(path)
+        series = MarketSeries(years, values, mtime)
+        try:
+            os.makedirs(os.path.dirname(npzfile), exist_ok=True)
+            tmpfile = '%s.%d.tmp' % (npzfile, os.getpid())
+            with open(tmpfile, 'wb') as f:
+                np.savez(f, years=series.years, values=series.values, mtime=np.int64(mtime))
+            os.replace(tmpfile, npzfile)
+        except OSError:
+            pass
+    _SERIES[(path, name)] = series
+    return series
+
+
+def load_yieldcurve_change(inyear, csvfile=YIELDCURVE_CSV):
+    return load_series(csvfile, parse_yieldcurve, 'yieldcurve').year(inyear)
+
+
+def interpolate_tenors(changes, maturities, tenors=YIELDCURVE_TENORS):
+    '''
+    Yield curve changes for bonds of any maturity: (days x tenors) changes to (days x bonds)
+
+    Each bond takes the linear interpolation between the two tenors around its maturity,
+    flat beyond the shortest and longest tenor. A bond whose maturity is a tenor gets that
+    tenor's column exactly.
+    '''
+    maturities = np.clip(np.asarray(maturities, dtype=float), tenors[0], tenors[-1])
+    hi = np.searchsorted(tenors, maturities)
+    lo = np.maximum(hi - 1, 0)
+    exact = tenors[hi] == maturities
+    lo[exact] = hi[exact]
+    weight = np.divide(maturities - tenors[lo], tenors[hi] - tenors[lo], out=np.zeros(maturities.shape), where=~exact)
+    return changes[:, lo]*(1 - weight) + changes[:, hi]*weight
+
+
+def load_equity_returns(inyear, csvfile=GSPC_CSV):
+    return load_series(csvfile, parse_equity_returns, 'returns').year(inyear)
+
+
+def clear_cache():
+    _SERIES.clear()
@@ -0,0 +1,177 @@
+import multiprocessing
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from corpbondabm.runner2017_r1 import BONDS, D_SPECIAL, Runner
+
+RING_SIZE = 4096
+HEADER = ('Count', 'Capacity', 'Bonds', 'Dealers', 'Closed', 'Width')
+HEADER_SIZE = 8
+SCALARS = ('Day', 'NAV', 'NAVPerShare', 'Cash', 'Trades')
+
+
+class PriceFeed(object):
+    '''
+    PriceFeed
+
+    ring buffer of StepRecords in shared memory, written by one process and read by any
+    number of others
+
+    Each day is one float64 row: the SCALARS, then the bond prices, then the (dealers x
+    bonds) inventory. The writer fills row Count % Capacity and only then bumps Count,
+    so readers never see a half-written row as new. Readers can get the last
+    Capacity - 1 rows: one that falls further behind loses the oldest ones, and read()
+    drops any row the writer may have overwritten while it was being copied.
+
+    create() makes and owns the segment (close() unlinks it); attach() opens an existing
+    one by name, read-only unless writer=True.
+    '''
+
+    def __init__(self, shm, owner, writer):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray(HEADER_SIZE, dtype=np.int64, buffer=shm.buf)
+        capacity, width = int(self.header[1]), int(self.header[5])
+        self.bonds, self.dealers = int(self.header[2]), int(self.header[3])
+        self.data = np.ndarray((capacity, width), dtype=np.float64, buffer=shm.buf, offset=8*HEADER_SIZE)
+        if not writer:
+            self.data.flags.writeable = False
+
+    def __repr__(self):
+        return 'PriceFeed({0}, {1} rows)'.format(self.name, self.count)
+
+    @classmethod
+    def create(cls, bonds, dealers, capacity=RING_SIZE):
+        width = len(SCALARS) + bonds + dealers*bonds
+        shm = shared_memory.SharedMemory(create=True, size=8*(HEADER_SIZE + capacity*width))
+        header = np.ndarray(HEADER_SIZE, dtype=np.int64, buffer=shm.buf)
+        header[:len(HEADER)] = [0, capacity, bonds, dealers, 0, width]
+        return cls(shm, True, True)
+
+    @classmethod
+    def attach(cls, name, writer=False):
+        try:
+            # the creating process owns the segment, so don't track (and unlink) it here
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError: # before Python 3.13; processes started by multiprocessing share the creator's tracker
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, False, writer)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def capacity(self):
+        return len(self.data)
+
+    @property
+    def count(self):
+        return int(self.header[0])
+
+    @property
+    def closed(self):
+        return bool(self.header[4])
+
+    def publish(self, record):
+        '''Write one StepRecord; usable as an iter_steps consumer'''
+        row = self.data[self.count % self.capacity]
+        row[:len(SCALARS)] = [getattr(record, name) for name in SCALARS]
+        row[len(SCALARS):len(SCALARS)+self.bonds] = record.Prices
+        row[len(SCALARS)+self.bonds:] = record.DealerInventory.ravel()
+        self.header[0] += 1
+
+    def finish(self):
+        self.header[4] = 1
+
+    def read(self, since=0):
+        '''
+        Copy the rows published after the first since rows: returns (rows, count), where
+        count is the since to pass next time
+        '''
+        count = self.count
+        # the slot after the newest row may be half rewritten already
+        start = max(since, count - self.capacity + 1)
+        rows = self.data[np.arange(start, count) % self.capacity]
+        # rows the writer reached while they were copied are no longer the ones asked for
+        first_valid = self.count - self.capacity + 1
+        if first_valid > start:
+            rows = rows[first_valid-start:]
+        return rows, count
+
+    def latest(self):
+        '''The newest row, or None before the first day is published'''
+        rows, _ = self.read(max(self.count-1, 0))
+        return rows[-1] if len(rows) else None
+
+    def unpack(self, rows):
+        '''Rows as named columns: the SCALARS, Prices (n x bonds) and DealerInventory (n x dealers x bonds)'''
+        rows = np.atleast_2d(rows)
+        columns = {name: rows[:, k] for k, name in enumerate(SCALARS)}
+        columns['Prices'] = rows[:, len(SCALARS):len(SCALARS)+self.bonds]
+        columns['DealerInventory'] = rows[:, len(SCALARS)+self.bonds:].reshape(len(rows), self.dealers, self.bonds)
+        return columns
+
+    def close(self):
+        self.header = self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def publish_run(name, config, h5_file=None):
+    '''Publisher process: run a Runner built from config at full speed, publishing every day to the feed'''
+    feed = PriceFeed.attach(name, writer=True)
+    try:
+        runner = Runner(run=False, **config)
+        for _ in runner.iter_steps(consumers=[feed.publish]):
+            pass
+        if h5_file is not None:
+            runner.make_h5s(h5_file)
+    finally:
+        feed.finish()
+        feed.close()
+
+
+class PricePublisher(object):
+    '''
+    PricePublisher
+
+    runs a simulation in its own process, publishing to a PriceFeed it owns
+
+    config holds Runner keyword arguments. Readers in other processes attach to
+    feed.name; bond_names and dealer_names give the column order.
+    '''
+
+    def __init__(self, config=None, capacity=RING_SIZE, h5_file=None):
+        self.config = dict(config or {})
+        self.bond_names = [bond['Name'] for bond in self.config.get('bonds', BONDS)]
+        self.dealer_names = list(self.config.get('d_special', D_SPECIAL))
+        self.feed = PriceFeed.create(len(self.bond_names), len(self.dealer_names), capacity)
+        self.process = multiprocessing.Process(target=publish_run, args=(self.feed.name, self.config, h5_file),
+                                               name='PricePublisher(%s)' % self.feed.name, daemon=True)
+
+    def __repr__(self):
+        return 'PricePublisher({0})'.format(self.feed.name)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        self.process.start()
+
+    def join(self, timeout=None):
+        self.process.join(timeout)
+
+    def close(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.process.pid is not None:
+            self.process.join()
+        self.feed.close()
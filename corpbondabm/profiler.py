@@ -0,0 +1,85 @@
+import time
+
+PHASES = ('decisions', 'quotes', 'matching', 'confirms', 'repricing', 'broadcast', 'nav')
+COUNTERS = ('Steps', 'Rfqs', 'Rejected', 'Trades', 'NewtonIterations')
+
+
+class PhaseProfiler(object):
+    '''
+    PhaseProfiler
+
+    wall-clock time and counters for each phase of the simulation day
+
+    The loop calls begin_step at the start of a day and lap(phase) at the end of each
+    phase: lap charges the time since the previous lap (or begin_step) to phase, so the
+    phases of a day add up to the day. Phases are the ones in PHASES plus any others a
+    loop laps (e.g. the Charter's 'chart'). With trace=True a row of phase times and
+    counters is kept for every day as well.
+
+    Runners hold profiler=None by default and only touch it behind an is-not-None test,
+    so an unprofiled run pays nothing but that test.
+    '''
+
+    def __init__(self, trace=False, clock=time.perf_counter):
+        self.clock = clock
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.laps = dict.fromkeys(PHASES, 0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.trace_rows = [] if trace else None
+        self._row = None
+        self._mark = None
+
+    def __repr__(self):
+        return 'PhaseProfiler({0} steps)'.format(self.counters['Steps'])
+
+    def begin_step(self, step):
+        if self.trace_rows is not None:
+            self._row = dict.fromkeys(self.seconds, 0.0)
+            self._row.update(dict.fromkeys(COUNTERS[1:], 0))
+            self._row['Step'] = step
+        self._mark = self.clock()
+
+    def lap(self, phase):
+        now = self.clock()
+        elapsed = now - self._mark
+        self._mark = now
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + elapsed
+        self.laps[phase] = self.laps.get(phase, 0) + 1
+        if self._row is not None:
+            self._row[phase] = self._row.get(phase, 0.0) + elapsed
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+        if self._row is not None:
+            self._row[counter] += n
+
+    def end_step(self):
+        self.counters['Steps'] += 1
+        if self._row is not None:
+            self.trace_rows.append(self._row)
+            self._row = None
+
+    def summary(self):
+        '''Seconds, laps, seconds per step and share of the profiled time for each phase'''
+        import pandas as pd
+        df = pd.DataFrame({'Seconds': pd.Series(self.seconds), 'Laps': pd.Series(self.laps)})
+        df.index.name = 'Phase'
+        df['PerStep'] = df.Seconds/max(self.counters['Steps'], 1)
+        total = df.Seconds.sum()
+        df['Share'] = df.Seconds/total if total > 0 else 0.0
+        return df
+
+    def trace(self):
+        '''One row per profiled day: phase seconds and that day's counters'''
+        if self.trace_rows is None:
+            raise ValueError('%r was not created with trace=True' % self)
+        import pandas as pd
+        columns = ['Step'] + list(self.seconds) + list(COUNTERS[1:])
+        return pd.DataFrame(self.trace_rows, columns=columns).fillna(0.0).set_index('Step')
+
+    def report(self):
+        lines = ['%-12s %10s %8s %7s' % ('Phase', 'Seconds', 'Laps', 'Share')]
+        for phase, row in self.summary().iterrows():
+            lines.append('%-12s %10.4f %8d %6.1f%%' % (phase, row.Seconds, row.Laps, 100*row.Share))
+        lines.append(', '.join('%s: %d' % item for item in self.counters.items()))
+        return '\n'.join(lines)
@@ -0,0 +1,74 @@
+import numpy as np
+
+RANDOM_BLOCK = 4096
+
+
+class RandomStream(object):
+    '''
+    RandomStream
+
+    an agent's own source of random draws
+
+    Wraps an np.random.Generator. With generator=None it falls back to the legacy global
+    np.random functions, so unseeded runs and np.random.seed() keep working. A
+    block_size > 0 pre-draws uniforms in bulk and serves randint/random from the block.
+    '''
+
+    def __init__(self, generator=None, block_size=0):
+        self.generator = generator
+        self.block_size = block_size
+        self._block = None
+        self._position = 0
+
+    def __repr__(self):
+        return 'RandomStream({0})'.format('legacy' if self.generator is None else self.generator.bit_generator.__class__.__name__)
+
+    def _next_uniform(self):
+        if self._block is None or self._position == len(self._block):
+            self._block = self.generator.random(self.block_size)
+            self._position = 0
+        u = self._block[self._position]
+        self._position += 1
+        return u
+
+    def randint(self, low, high):
+        if self.generator is None:
+            return np.random.randint(low, high)
+        if self.block_size:
+            return min(low + int(self._next_uniform()*(high-low)), high-1)
+        return int(self.generator.integers(low, high))
+
+    def integers(self, low, high, size):
+        '''size random integers in [low, high) as an array, for agents that decide in bulk'''
+        if self.generator is None:
+            return np.random.randint(low, high, size)
+        return self.generator.integers(low, high, size)
+    
+    def random(self):
+        if self.generator is None:
+            return np.random.random()
+        if self.block_size:
+            return self._next_uniform()
+        return self.generator.random()
+
+    def shuffle(self, x):
+        if self.generator is None:
+            np.random.shuffle(x)
+        else:
+            self.generator.shuffle(x)
+
+
+def make_streams(names, seed=None, block_size=0):
+    '''
+    One RandomStream per name
+
+    With a seed (an int or a SeedSequence) every stream gets its own Generator spawned
+    from that root SeedSequence, in the order of names, so streams are independent of
+    each other and reproducible. With seed=None every stream uses the legacy global RNG.
+    '''
+    names = list(names)
+    if seed is None:
+        return {name: RandomStream() for name in names}
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return {name: RandomStream(np.random.Generator(np.random.PCG64(child)), block_size)
+            for name, child in zip(names, root.spawn(len(names)))}
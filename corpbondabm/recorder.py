@@ -0,0 +1,126 @@
+import queue
+import threading
+
+import numpy as np
+
+CHUNK_SIZE = 4096
+QUEUE_CHUNKS = 8
+STRING_SIZE = 32
+
+
+class ColumnBuffer(object):
+    '''
+    ColumnBuffer
+
+    fixed-capacity row buffer held as one preallocated array per column
+
+    columns is a list of (name, dtype) pairs; use object for strings.
+    '''
+
+    def __init__(self, columns, capacity=CHUNK_SIZE):
+        self.columns = [name for name, _ in columns]
+        self.dtypes = dict(columns)
+        self.capacity = capacity
+        self._arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in columns}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def full(self):
+        return self.size == self.capacity
+
+    def append(self, row):
+        for name in self.columns:
+            self._arrays[name][self.size] = row[name]
+        self.size += 1
+
+    def take(self):
+        '''Hand over the filled rows as a dict of arrays and start a fresh buffer'''
+        chunk = {name: self._arrays[name][:self.size] for name in self.columns}
+        self._arrays = {name: np.empty(self.capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+        self.size = 0
+        return chunk
+
+
+class ChunkWriter(object):
+    '''
+    ChunkWriter
+
+    appends chunks of columns to tables in one HDF5 file from a background thread
+
+    The queue holds at most QUEUE_CHUNKS chunks, so a simulation that outruns the disk
+    blocks instead of growing memory. Errors in the writer thread are raised by close().
+    '''
+
+    def __init__(self, filename, complevel=5, complib='blosc'):
+        self.filename = filename
+        self.complevel = complevel
+        self.complib = complib
+        self._queue = queue.Queue(maxsize=QUEUE_CHUNKS)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='ChunkWriter(%s)' % filename, daemon=True)
+        self._thread.start()
+
+    def __repr__(self):
+        return 'ChunkWriter({0})'.format(self.filename)
+
+    def __reduce__(self):
+        raise TypeError('%r streams to disk and cannot be pickled; snapshot before streaming or without it' % self)
+
+    def put(self, key, chunk, min_itemsize=None):
+        if self._error is not None:
+            raise self._error
+        self._queue.put((key, chunk, min_itemsize))
+
+    def _run(self):
+        import pandas as pd
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                continue
+            key, chunk, min_itemsize = item
+            try:
+                pd.DataFrame(chunk).to_hdf(self.filename, key=key, append=True, format='table', complevel=self.complevel,
+                                           complib=self.complib, min_itemsize=min_itemsize)
+            except Exception as error:
+                self._error = error
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+class StreamRecorder(object):
+    '''
+    StreamRecorder
+
+    records rows for one table: rows are buffered in a ColumnBuffer and every full chunk
+    is handed to a ChunkWriter while the simulation carries on
+    '''
+
+    def __init__(self, writer, key, columns, chunk_size=CHUNK_SIZE):
+        self.writer = writer
+        self.key = key
+        self.buffer = ColumnBuffer(columns, chunk_size)
+        self.rows = 0
+        self.min_itemsize = {name: STRING_SIZE for name, dtype in columns if dtype is object} or None
+
+    def __repr__(self):
+        return 'StreamRecorder({0}, {1})'.format(self.writer.filename, self.key)
+
+    def record(self, row):
+        self.buffer.append(row)
+        self.rows += 1
+        if self.buffer.full:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer):
+            self.writer.put(self.key, self.buffer.take(), self.min_itemsize)
@@ -0,0 +1,84 @@
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from corpbondabm import marketdata
+from corpbondabm.runner2017_r1 import Runner
+
+
+def warm_worker(years):
+    '''Process pool initializer: imports are done at module load; prime the market data cache'''
+    for year in years:
+        marketdata.load_yieldcurve_change(year)
+        marketdata.load_equity_returns(year)
+
+
+def replication_seeds(n, seed=None):
+    '''Independent 32-bit seeds for n replications, spawned from one root SeedSequence'''
+    children = np.random.SeedSequence(seed).spawn(n)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def run_replication(replication, seed, config, h5_file):
+    if os.path.exists(h5_file): # to_hdf appends, so start each partition clean
+        os.remove(h5_file)
+    runner = Runner(h5_file=h5_file, seed=seed, **config)
+    return summarize(replication, seed, runner, h5_file)
+
+
+def summarize(replication, seed, runner, h5_file):
+    summary = {'Replication': replication, 'Seed': seed, 'H5File': h5_file,
+               'Trades': runner.bondmarket.trade_sequence, 'Cash': runner.mutualfund.cash,
+               'NAV': runner.mutualfund.nav_history[max(runner.mutualfund.nav_history)]['NAV']}
+    summary.update(runner.bondmarket.last_prices)
+    return summary
+
+
+class ReplicationResults(object):
+    '''
+    ReplicationResults
+
+    per-replication outputs of run_replications: one h5 partition per replication plus a
+    summary row for each
+    '''
+
+    def __init__(self, h5_dir, summaries):
+        self.h5_dir = h5_dir
+        self.summaries = sorted(summaries, key=lambda x: x['Replication'])
+
+    def __repr__(self):
+        return 'ReplicationResults({0}, {1})'.format(self.h5_dir, len(self.summaries))
+
+    def __len__(self):
+        return len(self.summaries)
+
+    def summary(self):
+        import pandas as pd
+        return pd.DataFrame(self.summaries).set_index('Replication')
+
+    def load(self, key):
+        '''Read one output table (e.g. trades, nav, last_prices) from every partition'''
+        import pandas as pd
+        frames = [pd.read_hdf(x['H5File'], key).assign(Replication=x['Replication']) for x in self.summaries]
+        return pd.concat(frames, ignore_index=True)
+
+
+def run_replications(configs, h5_dir, seed=None, max_workers=None):
+    '''
+    Run one Runner per config dict across a process pool
+
+    Each replication gets its own seed spawned from seed and writes its own partition,
+    h5_dir/rep_<n>.h5. Workers are reused across replications, so imports and the
+    market data cache are loaded once per worker rather than once per run.
+    '''
+    configs = list(configs)
+    os.makedirs(h5_dir, exist_ok=True)
+    seeds = replication_seeds(len(configs), seed)
+    h5_files = [os.path.join(h5_dir, 'rep_%05d.h5' % i) for i in range(len(configs))]
+    years = sorted({config.get('year', 2003) for config in configs})
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=warm_worker, initargs=(years,)) as pool:
+        futures = [pool.submit(run_replication, i, seeds[i], configs[i], h5_files[i]) for i in range(len(configs))]
+        summaries = [f.result() for f in futures]
+    return ReplicationResults(h5_dir, summaries)
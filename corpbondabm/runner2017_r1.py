@@ -1,13 +1,21 @@
+import pickle
 import time
 
 import numpy as np
 
-from corpbondabm.bondmarket2017_r1 import BondMarket
-from corpbondabm.trader2017_r1 import MutualFund2, InsuranceCo, Dealer
+from collections import namedtuple
+
+from corpbondabm.bondmarket2017_r1 import BondMarket, SIDES
+from corpbondabm.cohort2017_r1 import MutualFundCohort, InsuranceCohort
+from corpbondabm.profiler import PhaseProfiler
+from corpbondabm.randomstreams import make_streams
+from corpbondabm.recorder import CHUNK_SIZE, ChunkWriter
+from corpbondabm.trader2017_r1 import MutualFund2, InsuranceCo, Dealer, DealerPanel
 
 TREYNOR_BOUNDS = (0.01, 0.0125)
 TREYNOR_FACTOR = 10000
 PRIMER = 8
+SHOCKS = {50: 0.01}
 
 BONDS = [
          {'Name': 'MM101', 'Nominal': 500000, 'Maturity': 1, 'Coupon': 0.0175, 'Yield': 0.015, 'NPer': 2},
@@ -23,23 +31,65 @@ D_SPECIAL = {
              'd3': {'MM101': 0.5, 'MM102': 0.5, 'MM103': 0.75, 'MM104': 0.9, 'MM105': 0.9}
             }
 
+StepRecord = namedtuple('StepRecord', ['Day', 'Prices', 'NAV', 'NAVPerShare', 'Cash', 'CashFlow', 'Trades',
+                                       'DealerInventory', 'InventoryUsage', 'Spreads'])
+
+
+def nav_below(level):
+    '''stop_when predicate: the mutual fund's NAV per share has fallen below level'''
+    return lambda record: record.NAVPerShare < level
+
+
+def dealer_at_limit(fraction=1.0):
+    '''stop_when predicate: some dealer has used at least fraction of an inventory limit'''
+    return lambda record: record.InventoryUsage.max() >= fraction
+
+
 class Runner(object):
     
     def __init__(self, market_name='bondmarket1', bonds=BONDS, d_special=D_SPECIAL,
                  mm_name='m1', mm_share=0.15, mm_lower=0.03, mm_upper=0.07, mm_target=0.05,
                  ic_name='i1', ic_bond=0.6, dealer_long=0.1, dealer_short=0.075, run_steps=252,
-                 year=2003, h5_file='test.h5'):
+                 year=2003, h5_file='test.h5', seed=None, rng_block=0, shocks=SHOCKS, run=True,
+                 stream_h5=False, chunk_size=CHUNK_SIZE, cohorts=(), profiler=None, treynor_bounds=TREYNOR_BOUNDS,
+                 treynor_factor=TREYNOR_FACTOR, primer=PRIMER):
+        '''
+        cohorts adds populations of funds or insurers that trade alongside m1, each a dict
+        such as {'kind': 'MutualFund', 'name': 'mf', 'funds': 1000, 'share': 0.1}; see 
+        make_cohort for the optional keys.
+        
+        profiler is a PhaseProfiler to time the phases of each simulated day (None: no 
+        profiling).
+        
+        treynor_bounds and treynor_factor set the dealers' outside spread and standard 
+        accommodation; primer is the number of NAV history days before trading starts.
+        '''
+        self.streams = make_streams(['runner', market_name, mm_name, ic_name]+list(d_special)+[c['name'] for c in cohorts], 
+                                    seed, rng_block)
+        self.rng = self.streams['runner']
         self.bondmarket = self.make_market(market_name, year, bonds)
         self.mutualfund = self.make_mutual_fund(mm_name, mm_share, mm_lower, mm_upper, mm_target)
         self.insuranceco = self.make_insurance_co(ic_name, 1-mm_share, ic_bond, year)
+        self.treynor_bounds = tuple(treynor_bounds)
+        self.treynor_factor = treynor_factor
         self.dealers, self.dealers_dict = self.make_dealers(dealer_long, dealer_short, d_special)
+        self.dealer_panel = DealerPanel(self.dealers)
+        self.dealer_ids = np.array([self.bondmarket.register_agent(name) for name in self.dealer_panel.names])
+        self.cohorts = [self.make_cohort(spec, year) for spec in cohorts]
+        self.cohort_ids = [np.array([self.bondmarket.register_agent(name) for name in c.names]) for c in self.cohorts]
         self.run_steps = run_steps
-        self.seed_mutual_fund(PRIMER)
-        self.run_mcs(PRIMER)
-        self.make_h5s(h5_file)
+        self.shocks = dict(shocks)
+        self.writer = self.make_writer(h5_file, chunk_size) if stream_h5 else None
+        self.profiler = profiler
+        self.primer = primer
+        self.seed_mutual_fund(primer)
+        self.current_date = primer
+        if run:
+            self.run_mcs(primer)
+            self.make_h5s(h5_file)
         
     def make_market(self, name, year, bonds):
-        bondmarket = BondMarket(name, year)
+        bondmarket = BondMarket(name, year, rng=self.streams[name])
         for bond in bonds:
             bondmarket.add_bond(bond['Name'], bond['Nominal'], bond['Maturity'], bond['Coupon'], bond['Yield'], bond['NPer'])
         return bondmarket
@@ -53,7 +103,7 @@ class Runner(object):
             mm_bond = {'Name': bond['Name'], 'Nominal': share*bond['Nominal'], 'Maturity': bond['Maturity'],
                        'Coupon': bond['Coupon'], 'Yield': bond['Yield'], 'Price': bond['Price']}
             portfolio[bond['Name']] = mm_bond
-        m1 = MutualFund2(name, ll, ul, target, bond_list, portfolio, nominal_weights, 100000)
+        m1 = MutualFund2(name, ll, ul, target, bond_list, portfolio, nominal_weights, 100000, self.streams[name])
         return m1
         
     def make_insurance_co(self, name, share, bond_weight, year):
@@ -64,7 +114,7 @@ class Runner(object):
             ic_bond = {'Name': bond['Name'], 'Nominal': share*bond['Nominal'], 'Maturity': bond['Maturity'],
                        'Coupon': bond['Coupon'], 'Yield': bond['Yield'], 'Price': bond['Price']}
             portfolio[bond['Name']] = ic_bond
-        i1 = InsuranceCo(name, 1-bond_weight, bond_list, portfolio, year)
+        i1 = InsuranceCo(name, 1-bond_weight, bond_list, portfolio, year, self.streams[name])
         return i1
     
     def make_dealer(self, name, special, long_limit, short_limit):
@@ -74,55 +124,224 @@ class Runner(object):
             d_bond = {'Name': bond['Name'], 'Nominal': bond['Nominal'], 'Price': bond['Price'], 'Specialization': special[bond['Name']]}
             bond_list.append(bond['Name'])
             portfolio[bond['Name']] = d_bond
-        return Dealer(name, bond_list, portfolio, long_limit, short_limit, TREYNOR_BOUNDS, TREYNOR_FACTOR)
+        return Dealer(name, bond_list, portfolio, long_limit, short_limit, self.treynor_bounds, self.treynor_factor, 
+                      self.streams[name])
     
     def make_dealers(self, ul, ll, d_special):
         dealers = [self.make_dealer(name, special, ul, ll) for name, special in d_special.items()]
-        dealers_dict = dict(zip(['d%i' % i for i in range(1, 4)], dealers))
+        dealers_dict = {dealer._trader_id: dealer for dealer in dealers}
         return dealers, dealers_dict
     
+    def make_cohort(self, spec, year):
+        '''
+        A MutualFundCohort or InsuranceCohort of spec['funds'] traders holding spec['share'] 
+        of every bond between them, split evenly. Optional keys: lower, upper, target and 
+        shares (per fund) for mutual funds, bond_weight for insurers.
+        '''
+        u = self.bondmarket.universe
+        name, n = spec['name'], spec['funds']
+        nominal = spec['share']*u.nominal/n
+        if spec['kind'] == 'MutualFund':
+            return MutualFundCohort(name, n, spec.get('lower', 0.03), spec.get('upper', 0.07), spec.get('target', 0.05), 
+                                    list(u.names), nominal, u.price, self.bondmarket.compute_weights_from_nominal(), 
+                                    spec.get('shares', 100000), self.streams[name])
+        if spec['kind'] == 'InsuranceCo':
+            return InsuranceCohort(name, n, 1-spec.get('bond_weight', 0.6), list(u.names), nominal, u.price, year, self.streams[name])
+        raise ValueError('Unknown cohort kind %r' % spec['kind'])
+    
     def make_buyside(self):
         buyside = np.array([self.insuranceco, self.mutualfund])
-        np.random.shuffle(buyside)
+        self.rng.shuffle(buyside)
         #return buyside
         return [self.mutualfund]
     
+    def make_writer(self, h5_file, chunk_size):
+        # Trades, prices, NAV and quote details are written in chunks by a background thread as the run goes
+        writer = ChunkWriter(h5_file)
+        self.bondmarket.stream_to(writer, chunk_size)
+        self.mutualfund.stream_to(writer, chunk_size)
+        for dealer in self.dealers:
+            dealer.stream_to(writer, chunk_size)
+        return writer
+    
     def make_h5s(self, h5_file):
         self.bondmarket.last_prices_to_h5(h5_file)
         self.bondmarket.trades_to_h5(h5_file)
         self.mutualfund.nav_to_h5(h5_file)
         for dealer in self.dealers:
             dealer.extra_to_h5(h5_file)
+        if self.writer is not None:
+            self.writer.close()
     
     def seed_mutual_fund(self, prime1):
         for current_date in range(prime1):
             self.mutualfund.update_prices(self.bondmarket.last_prices)
             self.mutualfund.add_nav_to_history(current_date)
+            for cohort in self.cohorts:
+                cohort.end_of_day(current_date, self.bondmarket.last_prices)
+            
+    def run_mcs(self, prime1, stop=None):
+        '''Run days prime1 up to (not including) stop, by default to the end of the run'''
+        stop = prime1+self.run_steps if stop is None else stop
+        for current_date in range(prime1, stop):
+            self.run_step(current_date)
             
-    def run_mcs(self, prime1):
+    def run_step(self, current_date):
+        prof = self.profiler
+        if prof is not None:
+            trades = self.bondmarket.trade_sequence
+            prof.begin_step(current_date)
+        self.dealer_panel.reset_spreads()
+        for buyside in self.make_buyside():
+            buyside.make_portfolio_decision(current_date)
+            if prof is not None:
+                prof.lap('decisions')
+            if buyside.rfq_collector:
+                buyside_id = self.bondmarket.register_agent(buyside._trader_id)
+                for order_number, rfq in zip(buyside.rfq_numbers(), buyside.rfq_collector):
+                    price = self.trade_rfq(rfq, buyside_id, order_number, current_date)
+                    # Note: selected dealer and buyside know the new price
+                    if price is not None:
+                        buyside.modify_portfolio({'Size': rfq['amount'], 'Bond': rfq['name'], 'Side': rfq['side'], 'Price': price})
+                    if prof is not None:
+                        prof.lap('confirms')
+        for cohort, ids in zip(self.cohorts, self.cohort_ids):
+            batch = cohort.make_portfolio_decision(current_date)
+            rfqs = cohort.rfq_dicts(batch)
+            if prof is not None:
+                prof.lap('decisions')
+            for rfq, k, j, side, number in zip(rfqs, batch.Fund.tolist(), batch.Bond.tolist(), 
+                                               batch.Side.tolist(), batch.OrderNumber.tolist()):
+                price = self.trade_rfq(rfq, ids[k], number, current_date)
+                if price is not None:
+                    cohort.fill(k, j, -rfq['amount'] if side else rfq['amount'], price)
+                if prof is not None:
+                    prof.lap('confirms')
+        # All agents get price updates from the bondmarket at the end of the day
+        self.bondmarket.update_eod_bond_price(current_date)
+        if current_date in self.shocks:
+            self.bondmarket.shock_ytm(self.shocks[current_date])
+        if prof is not None:
+            prof.lap('repricing')
+            prof.count('NewtonIterations', self.bondmarket.newton_iterations)
         prices = self.bondmarket.last_prices
-        for current_date in range(prime1, prime1+self.run_steps):
-            for buyside in self.make_buyside():
-                buyside.make_portfolio_decision(current_date)
-                if buyside.rfq_collector:
-                    for rfq in buyside.rfq_collector:
-                        quotes = [d.make_quote(rfq) for d in self.dealers]
-                        # Note: selected dealer and buyside know the new price
-                        if any(quotes):
-                            dealer_confirm, buyside_confirm = self.bondmarket.match_trade(quotes, current_date)
-                            self.dealers_dict[dealer_confirm['Dealer']].modify_portfolio(dealer_confirm)
-                            buyside.modify_portfolio(buyside_confirm)
-            # All agents get price updates from the bondmarket at the end of the day
-            self.bondmarket.update_eod_bond_price(current_date)
-            if current_date == 50:
-                self.bondmarket.shock_ytm(0.01)
-            prices = self.bondmarket.last_prices
-            for d in self.dealers:
-                d.update_prices(prices)
-            self.mutualfund.update_prices(prices)
-            self.mutualfund.add_nav_to_history(current_date)
-            self.insuranceco.update_prices(prices)
-            self.bondmarket.print_last_prices(current_date)
+        self.dealer_panel.update_prices(prices)
+        self.mutualfund.update_prices(prices)
+        self.insuranceco.update_prices(prices)
+        self.bondmarket.print_last_prices(current_date)
+        if prof is not None:
+            prof.lap('broadcast')
+        self.mutualfund.add_nav_to_history(current_date)
+        for cohort in self.cohorts:
+            cohort.end_of_day(current_date, prices)
+        if prof is not None:
+            prof.lap('nav')
+            prof.count('Trades', self.bondmarket.trade_sequence - trades)
+            prof.end_step()
+        self.current_date = current_date + 1
+        
+    def trade_rfq(self, rfq, buyside_id, order_number, current_date):
+        '''Quote rfq to the dealer panel and match it; the dealer's fill is applied and the trade price returned (None if no trade)'''
+        prof = self.profiler
+        prices = self.dealer_panel.quote_prices(rfq)
+        if prof is not None:
+            prof.lap('quotes')
+            prof.count('Rfqs')
+        if prices is None:
+            if prof is not None:
+                prof.count('Rejected')
+            return None
+        side = SIDES.index(rfq['side'])
+        match = self.bondmarket.match_prices(prices, self.dealer_ids, buyside_id, order_number, 
+                                             self.bondmarket.universe.index[rfq['name']], side, rfq['amount'], current_date)
+        if prof is not None:
+            prof.lap('matching')
+        if match is None:
+            return None
+        dealer, price = match
+        self.dealer_panel.fill(dealer, self.dealer_panel.index[rfq['name']], rfq['amount'] if side else -rfq['amount'], price)
+        return price
+        
+    @property
+    def end_date(self):
+        return self.primer + self.run_steps
+    
+    def dealer_inventory(self):
+        '''(dealers x bonds) inventory and the fraction of the relevant limit each position uses'''
+        panel = self.dealer_panel
+        inventory, lower, upper = panel.quantity.copy(), panel.lower_limit, panel.upper_limit
+        usage = np.where(inventory < 0, inventory/lower, inventory/upper)
+        return inventory, usage
+    
+    def step_record(self, current_date, trades):
+        nav = self.mutualfund.nav_history[current_date]
+        inventory, usage = self.dealer_inventory()
+        return StepRecord(current_date, self.bondmarket.universe.last_price.copy(), nav['NAV'], nav['NAVPerShare'], 
+                          nav['Cash'], nav['CashFlow'], trades, inventory, usage.max(axis=1), self.dealer_panel.mean_spreads())
+    
+    def iter_steps(self, stop=None, stop_when=None, consumers=()):
+        '''
+        Run the simulation one day at a time, yielding a StepRecord after each day
+        
+        Runs from current_date up to stop (default: the end of the run). Each record is 
+        passed to every consumer before it is yielded; if stop_when(record) is true the 
+        generator stops after that record. Breaking out of the loop also stops the run, 
+        and the Runner can be resumed later from current_date.
+        '''
+        stop = self.end_date if stop is None else stop
+        while self.current_date < stop:
+            trades = self.bondmarket.trade_sequence
+            current_date = self.current_date
+            self.run_step(current_date)
+            record = self.step_record(current_date, self.bondmarket.trade_sequence - trades)
+            for consumer in consumers:
+                consumer(record)
+            yield record
+            if stop_when is not None and stop_when(record):
+                return
+    
+    def snapshot(self):
+        '''
+        Checkpoint the full simulation state: market, agents, random streams and histories
+        
+        The legacy global np.random state is saved too, for runs without a seed.
+        '''
+        return pickle.dumps({'runner': self, 'legacy_rng': np.random.get_state()}, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    @classmethod
+    def restore(cls, snapshot):
+        state = pickle.loads(snapshot)
+        np.random.set_state(state['legacy_rng'])
+        return state['runner']
+    
+    def save_snapshot(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(self.snapshot())
+            
+    @classmethod
+    def load_snapshot(cls, filename):
+        with open(filename, 'rb') as f:
+            return cls.restore(f.read())
+        
+    def fork(self, scenarios, run=True):
+        '''
+        Branch the simulation at its current date into one Runner per scenario
+        
+        Each scenario is a shocks dict ({day: yield shock}) that replaces the shocks from 
+        the current date on. Every branch starts from the same checkpoint, including the 
+        random streams, so branches differ only by their scenario. With run=True each 
+        branch is run to the end; write its output with make_h5s.
+        '''
+        checkpoint = self.snapshot()
+        branches = []
+        for shocks in scenarios:
+            branch = self.restore(checkpoint)
+            branch.shocks = {day: shock for day, shock in branch.shocks.items() if day < branch.current_date}
+            branch.shocks.update(shocks)
+            if run:
+                branch.run_mcs(branch.current_date, branch.end_date)
+            branches.append(branch)
+        return branches
 
                     
 if __name__ == '__main__':
@@ -161,7 +380,8 @@ if __name__ == '__main__':
     h5dir = 'C:\\Users\\user\\Documents\\Agent-Based Models\\Corporate Bonds\\h5 files\\'
     h5_file = '%s%s' % (h5dir, h5filename)
     
-    market1 = Runner(mm_share=mm_share, run_steps=run_steps, year=year, h5_file=h5_file)
+    market1 = Runner(mm_share=mm_share, run_steps=run_steps, year=year, h5_file=h5_file, profiler=PhaseProfiler())
+    print(market1.profiler.report())
     
     print('Run Time: %.2f seconds' % ((time.time() - start)))
 
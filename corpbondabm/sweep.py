@@ -0,0 +1,199 @@
+import glob
+import hashlib
+import itertools
+import json
+import os
+import shutil
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from corpbondabm.replicator import summarize, warm_worker
+from corpbondabm.runner2017_r1 import Runner
+
+SWEEP_PARAMS = ('mm_share', 'mm_lower', 'mm_upper', 'mm_target', 'ic_bond', 'dealer_long', 'dealer_short', 'year',
+                'run_steps', 'treynor_bounds', 'treynor_factor', 'primer')
+# Runner arguments run_point sets itself
+RESERVED = ('seed', 'h5_file', 'run')
+SUMMARY_FILE = 'summary.json'
+H5_FILE = 'output.h5'
+
+
+def grid_design(grid):
+    '''Every combination of grid values: grid maps a parameter to its list of values'''
+    check_params(grid)
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def random_design(ranges, n, seed=None):
+    '''
+    n points drawn at random: ranges maps a parameter to (low, high) for a uniform draw
+    or to a list of values to choose from
+    '''
+    check_params(ranges)
+    rng = np.random.default_rng(seed)
+    names = sorted(ranges)
+    design = []
+    for _ in range(n):
+        point = {}
+        for name in names:
+            values = ranges[name]
+            if isinstance(values, list):
+                point[name] = values[int(rng.integers(len(values)))]
+            else:
+                point[name] = float(rng.uniform(*values))
+        design.append(point)
+    return design
+
+
+def check_params(params):
+    unknown = set(params) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError('Cannot sweep %s; sweepable: %s' % (', '.join(sorted(unknown)), ', '.join(SWEEP_PARAMS)))
+
+
+def code_version():
+    '''Hash of the package source, so results cached by older code are not reused'''
+    digest = hashlib.sha256()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for path in sorted(glob.glob(os.path.join(folder, '*.py'))):
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read().replace(b'\r\n', b'\n'))
+    return digest.hexdigest()
+
+
+def canonical(config):
+    '''config as it is stored and hashed: JSON types, keys sorted'''
+    return json.loads(json.dumps(config, sort_keys=True))
+
+
+def point_seed(config, seed, replication=0):
+    '''A 32-bit seed for one replication of one point, fixed by its config rather than its place in the design'''
+    text = json.dumps([canonical(config), seed, replication], sort_keys=True)
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], 'little')
+
+
+def point_key(config, seed, version):
+    text = json.dumps({'Config': canonical(config), 'Seed': seed, 'Version': version}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def point_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], key)
+
+
+def load_point(path):
+    try:
+        with open(os.path.join(path, SUMMARY_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def run_point(key, config, seed, replication, version, path):
+    '''
+    Worker: run one point and store it under path
+
+    The point is written to a scratch folder first and renamed into place, so an
+    interrupted sweep never leaves a half-written point that looks cached.
+    '''
+    scratch = '%s.%d.tmp' % (path, os.getpid())
+    shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(scratch)
+    runner = Runner(h5_file=os.path.join(scratch, H5_FILE), seed=seed, **config)
+    summary = summarize(replication, seed, runner, os.path.join(path, H5_FILE))
+    record = {'Key': key, 'Config': canonical(config), 'Seed': seed, 'Replication': replication, 'Version': version,
+              'Summary': canonical(summary)}
+    with open(os.path.join(scratch, SUMMARY_FILE), 'w') as f:
+        json.dump(record, f, indent=1)
+    try:
+        os.rename(scratch, path)
+    except OSError: # a concurrent sweep stored the same point first
+        shutil.rmtree(scratch, ignore_errors=True)
+    return record
+
+
+class SweepResults(object):
+    '''
+    SweepResults
+
+    one record per point and replication of a sweep, in design order: the config, the
+    seed, the Runner summary (as in ReplicationResults) and whether it came from the cache
+    '''
+
+    def __init__(self, cache_dir, records):
+        self.cache_dir = cache_dir
+        self.records = records
+
+    def __repr__(self):
+        return 'SweepResults({0}, {1})'.format(self.cache_dir, len(self.records))
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def cached(self):
+        return sum(record['Cached'] for record in self.records)
+
+    def summary(self):
+        import pandas as pd
+        rows = []
+        for record in self.records:
+            row = {'Key': record['Key'], 'Point': record['Point'], 'Cached': record['Cached']}
+            row.update(record['Config'])
+            row.update(record['Summary'])
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def load(self, key):
+        '''Read one output table (e.g. trades, nav, last_prices) from every point'''
+        import pandas as pd
+        frames = [pd.read_hdf(record['Summary']['H5File'], key).assign(Point=record['Point'], Replication=record['Replication'])
+                  for record in self.records]
+        return pd.concat(frames, ignore_index=True)
+
+
+def run_sweep(design, cache_dir, seed=None, replications=1, base=None, max_workers=None):
+    '''
+    Run every point of design (a list of parameter dicts, e.g. from grid_design or
+    random_design) replications times across a process pool
+
+    Each point runs Runner(**base, **point); base may hold any Runner argument but the
+    RESERVED ones, which every point sets itself. Its summary and h5 outputs are stored in
+    cache_dir under a hash of the config, the seed and the package source. Points already
+    there are loaded instead of run, so a resumed or extended sweep only runs what is new.
+    Seeds come from the config and seed, so a point keeps its seed when the design around
+    it changes.
+    '''
+    base = dict(base or {})
+    reserved = sorted(set(base) & set(RESERVED))
+    if reserved:
+        raise ValueError('base cannot set %s: the sweep sets them for each point' % ', '.join(reserved))
+    version = code_version()
+    records = [None]*(len(design)*replications)
+    jobs = []
+    for i, point in enumerate(design):
+        check_params(point)
+        config = dict(base, **point)
+        for replication in range(replications):
+            run_seed = point_seed(config, seed, replication)
+            key = point_key(config, run_seed, version)
+            path = point_path(cache_dir, key)
+            record = load_point(path)
+            n = i*replications + replication
+            if record is None:
+                jobs.append((n, i, (key, config, run_seed, replication, version, path)))
+            else:
+                records[n] = dict(record, Point=i, Cached=True)
+    if jobs:
+        for job in jobs:
+            os.makedirs(os.path.dirname(job[2][-1]), exist_ok=True)
+        years = sorted({job[2][1].get('year', 2003) for job in jobs})
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=warm_worker, initargs=(years,)) as pool:
+            futures = [(n, i, pool.submit(run_point, *args)) for n, i, args in jobs]
+            for n, i, future in futures:
+                records[n] = dict(future.result(), Point=i, Cached=False)
+    return SweepResults(cache_dir, records)
@@ -0,0 +1,62 @@
+import numpy as np
+
+from corpbondabm.marketdata import YIELDCURVE_TENORS
+
+# share of issues by maturity at issue, roughly the US investment-grade mix
+MATURITY_WEIGHTS = {1: 0.06, 2: 0.10, 3: 0.12, 5: 0.20, 7: 0.14, 10: 0.20, 15: 0.04, 20: 0.04, 25: 0.03, 30: 0.07}
+# yields at the curve tenors on the Runner's start date (the BONDS yields)
+CURVE_YIELDS = np.array([0.015, 0.0175, 0.025, 0.026, 0.0421])
+SPREAD_SCALE = 0.004
+NOMINAL_MEDIAN = 1000000
+SPECIALIZATION_LEVELS = (0.9, 0.75, 0.5)
+
+
+def make_bonds(n, seed=None):
+    '''
+    n bonds in the BONDS format, named MM101 on
+
+    Maturities follow MATURITY_WEIGHTS. Yields are the curve interpolated at the
+    maturity plus a lognormal credit spread, coupons are the yield at issue rounded to
+    1/8 of a percent (so most bonds trade near par) and nominals are lognormal about
+    NOMINAL_MEDIAN in steps of 50,000.
+    '''
+    rng = np.random.default_rng(seed)
+    maturity = rng.choice(list(MATURITY_WEIGHTS), n, p=list(MATURITY_WEIGHTS.values()))
+    spread = SPREAD_SCALE*rng.lognormal(-1.0, 0.75, n)
+    ytm = np.interp(maturity, YIELDCURVE_TENORS, CURVE_YIELDS) + spread
+    coupon = np.maximum(np.round((ytm + rng.normal(0, 0.005, n))*800)/800, 0.00125)
+    nominal = np.maximum(np.round(NOMINAL_MEDIAN*rng.lognormal(0, 0.5, n)/50000)*50000, 50000)
+    return [{'Name': 'MM%d' % (101+k), 'Nominal': int(nominal[k]), 'Maturity': int(maturity[k]),
+             'Coupon': float(coupon[k]), 'Yield': float(ytm[k]), 'NPer': 2} for k in range(n)]
+
+
+def make_specialization(dealers, maturities, seed=None):
+    '''
+    (dealers x bonds) specialization matrix
+
+    Like D_SPECIAL, each dealer centres on part of the curve: a bond within a factor of
+    2 of the dealer's home maturity gets 0.9, within a factor of 5 0.75, and 0.5
+    otherwise. Home maturities are log-uniform between the shortest and longest bond.
+    '''
+    rng = np.random.default_rng(seed)
+    log_maturity = np.log(np.asarray(maturities, dtype=float))
+    home = rng.uniform(log_maturity.min(), log_maturity.max(), dealers)
+    distance = np.abs(log_maturity[None, :] - home[:, None])
+    return np.select([distance <= np.log(2), distance <= np.log(5)], SPECIALIZATION_LEVELS[:2], SPECIALIZATION_LEVELS[2])
+
+
+def make_d_special(dealers, bonds, seed=None):
+    '''D_SPECIAL for dealers d1..dN over bonds (BONDS format)'''
+    names = [bond['Name'] for bond in bonds]
+    special = make_specialization(dealers, [bond['Maturity'] for bond in bonds], seed).tolist()
+    return {'d%d' % (i+1): dict(zip(names, special[i])) for i in range(dealers)}
+
+
+def synthetic_market(bonds, dealers, seed=None):
+    '''
+    bonds and d_special for a market of the given size, as keyword arguments for Runner
+    or Charter: Runner(**synthetic_market(1000, 50, seed=1), run_steps=60)
+    '''
+    bond_seed, dealer_seed = np.random.SeedSequence(seed).spawn(2)
+    bond_list = make_bonds(bonds, bond_seed)
+    return {'bonds': bond_list, 'd_special': make_d_special(dealers, bond_list, dealer_seed)}
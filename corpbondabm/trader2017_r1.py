@@ -1,5 +1,13 @@
+import warnings
+
 import numpy as np
-import pandas as pd
+
+from collections.abc import MutableMapping
+
+from corpbondabm import marketdata
+from corpbondabm.bondmarket2017_r1 import take_prices
+from corpbondabm.randomstreams import RandomStream
+from corpbondabm.recorder import CHUNK_SIZE, StreamRecorder
 
 
 ALPHA = 0.00017
@@ -7,6 +15,37 @@ BETA_D = 0.56
 BETA_D1 = -0.0002
 BETA_W = 0.60
 BETA_W1 = -0.0002
+NAV_WINDOW = 8
+RECONCILE_EVERY = 32
+# drift, relative to the bond value, above which reconcile warns
+DRIFT_TOLERANCE = 1e-9
+
+NAV_COLUMNS = [('Step', np.int64), ('BondValue', float), ('Cash', float), ('NAV', float), ('NAVPerShare', float), ('CashFlow', float)]
+QUOTE_DETAIL_COLUMNS = [('Dealer', object), ('order_id', object), ('name', object), ('amount', float), ('side', object), ('price', float),
+                        ('ExpectedInventory', float), ('LowerLimit', float), ('UpperLimit', float), ('LastPrice', float),
+                        ('OutsideSpread', float), ('InventoryRange', float), ('InsideSpread', float), ('Ask', float), ('Bid', float),
+                        ('QuotePrice', float)]
+
+
+class PortfolioRow(dict):
+    '''
+    PortfolioRow
+    
+    dict snapshot of one bond in a trader's portfolio; item assignment writes through to
+    the trader's arrays
+    '''
+    
+    def __init__(self, trader, j):
+        dict.__init__(self, trader._row(j))
+        self._trader = trader
+        self._j = j
+        
+    def __setitem__(self, key, value):
+        self._trader._set_field(self._j, key, value)
+        dict.__setitem__(self, key, value)
+        
+    def __reduce__(self):
+        return (PortfolioRow, (self._trader, self._j))
 
 
 class BuySide(object):
@@ -14,55 +53,227 @@ class BuySide(object):
     BuySide
     
     base class for buy side traders
+    
+    Nominal and Price are held as arrays in bond_list order; the other fields of each bond
+    are kept as given in terms. bond_value is a running value of the bonds that 
+    modify_portfolio and update_prices adjust by the change they make. It is recomputed in
+    full (reconcile) on dict price updates and every RECONCILE_EVERY market updates, to 
+    stop rounding drift. The largest drift found is kept in max_drift, and drift above 
+    DRIFT_TOLERANCE of the bond value raises a RuntimeWarning, as it means the running
+    value missed a change rather than just rounded.
     '''
     
-    def __init__(self, name, bond_list, portfolio):
+    FIELDS = {'Nominal': 'nominal', 'Price': 'price'}
+    
+    def __init__(self, name, bond_list, portfolio, rng=None):
         '''
         Initialize BuySide with some base class attributes and a method
         
         rfq is a public container for carrying price quote requests to the sell side
+        rng is the trader's own RandomStream (default: the legacy global np.random)
         '''
         self._trader_id = name # trader id
         self.bond_list = bond_list
-        self.portfolio = portfolio
+        self.index = {bond: j for j, bond in enumerate(bond_list)}
+        self.nominal = np.array([portfolio[bond]['Nominal'] for bond in bond_list], dtype=float)
+        self.price = np.array([portfolio[bond]['Price'] for bond in bond_list], dtype=float)
+        self.terms = {bond: {k: v for k, v in portfolio[bond].items() if k not in self.FIELDS} for bond in bond_list}
         self.rfq_collector = []
         self._rfq_sequence = 0
+        self.rng = rng if rng is not None else RandomStream()
+        self._price_updates = 0
+        self._market_order = None
+        self.max_drift = 0.0
+        self.reconcile()
         
     def __repr__(self):
         return 'BuySide({0})'.format(self._trader_id)
     
+    @property
+    def portfolio(self):
+        return {bond: PortfolioRow(self, j) for j, bond in enumerate(self.bond_list)}
+    
+    def _row(self, j):
+        row = dict(self.terms[self.bond_list[j]])
+        row['Nominal'] = self.nominal[j]
+        row['Price'] = self.price[j]
+        return row
+    
+    def _set_field(self, j, key, value):
+        if key == 'Nominal':
+            self.bond_value += (value - self.nominal[j])*self.price[j]/100
+            self.nominal[j] = value
+        elif key == 'Price':
+            self.bond_value += self.nominal[j]*(value - self.price[j])/100
+            self.price[j] = value
+        else:
+            self.terms[self.bond_list[j]][key] = value
+    
     def make_rfq(self, name, side, amount):
         self._rfq_sequence += 1
         order_id = '%s_%d' % (self._trader_id, self._rfq_sequence)
         rfq =  {'order_id': order_id, 'name': name, 'side': side, 'amount': amount}
         self.rfq_collector.append(rfq)
         
+    def rfq_numbers(self):
+        '''The integer rfq numbers of the rfqs in rfq_collector (cleared before each decision)'''
+        return range(self._rfq_sequence - len(self.rfq_collector) + 1, self._rfq_sequence + 1)
+        
     def update_prices(self, prices):
-        for bond in self.bond_list:
-            self.portfolio[bond]['Price'] = prices[bond]
+        '''prices: a dict by bond name or the market's PriceView, read as one array'''
+        new_prices, self._market_order = take_prices(prices, self.bond_list, self._market_order)
+        self.bond_value += self.nominal @ (new_prices - self.price)/100
+        self.price[:] = new_prices
+        self._price_updates += 1
+        # prices from a dict are reconciled every time, as before the PriceView
+        if self._market_order is None or self._price_updates % RECONCILE_EVERY == 0:
+            self.reconcile()
+            
+    def fill(self, j, size, price):
+        '''Add size (negative to sell) of bond j at price'''
+        self.bond_value += ((self.nominal[j] + size)*price - self.nominal[j]*self.price[j])/100
+        self.nominal[j] += size
+        self.price[j] = price
+        
+    def reconcile(self):
+        '''Recompute bond_value in full; returns the drift of the running value'''
+        bond_value = np.sum(self.nominal*self.price/100)
+        drift = bond_value - getattr(self, 'bond_value', bond_value)
+        self.bond_value = bond_value
+        self.max_drift = max(self.max_drift, abs(drift))
+        if abs(drift) > DRIFT_TOLERANCE*max(abs(bond_value), 1):
+            warnings.warn('{0} bond value drifted by {1:g} from {2:g}'.format(self._trader_id, drift, bond_value), 
+                          RuntimeWarning)
+        return drift
         
     def compute_portfolio_value(self):
-        return np.sum([self.portfolio[x]['Nominal']*self.portfolio[x]['Price']/100 for x in self.bond_list])
+        return self.bond_value
     
         
+class NavHistory(MutableMapping):
+    '''
+    NavHistory
+    
+    a MutualFund's NAV rows (NAV_COLUMNS) by step, in preallocated columns
+    
+    The last window steps are also kept in a ring buffer indexed by step % window, so the
+    flow model's lags are read with value(step, column) without a search. Steps must be
+    added in order; a step can be overwritten. After spill_to(recorder) rows go to the 
+    recorder instead of the columns and only the ring stays in memory.
+    
+    Indexing by step returns the row as a dict, so the history still reads like the dict
+    of rows it replaces.
+    '''
+    
+    COLUMNS = tuple(name for name, _ in NAV_COLUMNS)
+    
+    def __init__(self, window=NAV_WINDOW, capacity=256):
+        self.window = window
+        self.size = 0
+        self.recorder = None
+        self._columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in NAV_COLUMNS}
+        self._ring = {name: np.zeros(window, dtype=dtype) for name, dtype in NAV_COLUMNS}
+        self._ring_steps = np.full(window, -1, dtype=np.int64)
+        
+    def __repr__(self):
+        return 'NavHistory({0})'.format(len(self))
+        
+    def spill_to(self, recorder):
+        '''Send new rows to recorder and keep only the ring buffer'''
+        self.recorder = recorder
+        self.size = 0
+        
+    def _position(self, step):
+        steps = self._columns['Step'][:self.size]
+        k = np.searchsorted(steps, step)
+        return k if k < self.size and steps[k] == step else None
+        
+    def value(self, step, column):
+        slot = step % self.window
+        if self._ring_steps[slot] == step:
+            return self._ring[column][slot]
+        k = None if self.recorder is not None else self._position(step)
+        if k is None:
+            raise KeyError(step)
+        return self._columns[column][k]
+    
+    def __getitem__(self, step):
+        slot = step % self.window
+        if self._ring_steps[slot] == step:
+            return {name: self._ring[name][slot].item() for name in self.COLUMNS}
+        k = None if self.recorder is not None else self._position(step)
+        if k is None:
+            raise KeyError(step)
+        return {name: self._columns[name][k].item() for name in self.COLUMNS}
+    
+    def __setitem__(self, step, row):
+        # rows missing a column (e.g. CashFlow) store NaN for it
+        row = {name: row.get(name, np.nan) for name in self.COLUMNS}
+        row['Step'] = step
+        slot = step % self.window
+        if step > self._ring_steps.max() - self.window:
+            self._ring_steps[slot] = step
+            for name in self.COLUMNS:
+                self._ring[name][slot] = row[name]
+        if self.recorder is not None:
+            self.recorder.record(row)
+            return
+        k = self._position(step)
+        if k is None:
+            if self.size and step < self._columns['Step'][self.size-1]:
+                raise ValueError('NAV rows must be added in step order')
+            k = self.size
+            capacity = len(self._columns['Step'])
+            if k == capacity:
+                for name, col in self._columns.items():
+                    grown = np.zeros(2*capacity, dtype=col.dtype)
+                    grown[:capacity] = col
+                    self._columns[name] = grown
+            self.size += 1
+        for name in self.COLUMNS:
+            self._columns[name][k] = row[name]
+            
+    def __delitem__(self, step):
+        raise TypeError('NAV rows cannot be removed')
+    
+    def _steps(self):
+        if self.recorder is not None:
+            return sorted(step for step in self._ring_steps.tolist() if step >= 0)
+        return self._columns['Step'][:self.size].tolist()
+    
+    def __iter__(self):
+        return iter(self._steps())
+    
+    def __len__(self):
+        return len(self._steps())
+    
+    def to_columns(self):
+        '''The rows held in memory as a dict of arrays, in NAV_COLUMNS order'''
+        if self.recorder is not None:
+            rows = [self[step] for step in self._steps()]
+            return {name: np.array([row[name] for row in rows]) for name in self.COLUMNS}
+        return {name: self._columns[name][:self.size] for name in self.COLUMNS}
+    
+    
 class MutualFund(BuySide):
     '''
     MutualFund
         
         
     '''
-    def __init__(self, name, lower_bound, upper_bound, target, bond_list, portfolio, weights, shares):
+    def __init__(self, name, lower_bound, upper_bound, target, bond_list, portfolio, weights, shares, rng=None):
         '''
         Initialize MutualFund
         
         
         '''
-        BuySide.__init__(self, name, bond_list, portfolio)
+        BuySide.__init__(self, name, bond_list, portfolio, rng)
         self.trader_type = 'MutualFund'
         self.lower_bound = lower_bound
         self.upper_bound = upper_bound
         self.target = target
-        self.nav_history = {}
+        self.nav_recorder = None
+        self.nav_history = NavHistory()
         self.shares = shares
         self.index_weight_array = self.make_weight_array(weights)
         self.setup_portfolio()
@@ -70,6 +281,27 @@ class MutualFund(BuySide):
     def __repr__(self):
         return 'BuySide({0}, {1})'.format(self._trader_id, self.trader_type)
     
+    @property
+    def nav_history(self):
+        return self._nav_history
+    
+    @nav_history.setter
+    def nav_history(self, rows):
+        '''Replace the history, e.g. with a dict of rows by step'''
+        if not isinstance(rows, NavHistory):
+            history = NavHistory()
+            if self.nav_recorder is not None:
+                history.spill_to(self.nav_recorder)
+            for step in sorted(rows):
+                history[step] = rows[step]
+            rows = history
+        self._nav_history = rows
+    
+    def stream_to(self, writer, chunk_size=CHUNK_SIZE):
+        '''Stream NAV rows to writer in chunks; only the last NAV_WINDOW steps stay in nav_history'''
+        self.nav_recorder = StreamRecorder(writer, 'nav', NAV_COLUMNS, chunk_size)
+        self.nav_history.spill_to(self.nav_recorder)
+        
     def setup_portfolio(self):
         bond_value = self.compute_portfolio_value()
         self.cash = self.target*bond_value/(1-self.target)
@@ -99,21 +331,22 @@ class MutualFund(BuySide):
         self.nav_history[step] = {'Step': step, 'BondValue': bond_value, 'Cash': cash, 'NAV': nav, 'NAVPerShare': nav_per_share, 'CashFlow': expected_cash_flow}
         
     def compute_flow(self, step):
-        nav_lag1 = self.nav_history[step-1]['NAVPerShare']
-        retdaily_lag1 = nav_lag1/self.nav_history[step-2]['NAVPerShare'] - 1
-        retweekly_lag1 = nav_lag1/self.nav_history[step-6]['NAVPerShare'] - 1
+        # compute_flow looks back at most 6 steps, always within the NavHistory ring
+        nav_per_share = self.nav_history.value
+        nav_lag1 = nav_per_share(step-1, 'NAVPerShare')
+        retdaily_lag1 = nav_lag1/nav_per_share(step-2, 'NAVPerShare') - 1
+        retweekly_lag1 = nav_lag1/nav_per_share(step-6, 'NAVPerShare') - 1
         flow_ratio = ALPHA + BETA_D*retdaily_lag1 + BETA_D1*(retdaily_lag1<0) + BETA_W*retweekly_lag1 + BETA_W1*(retweekly_lag1<0)
-        return flow_ratio*self.nav_history[step-1]['NAV']
+        return flow_ratio*self.nav_history.value(step-1, 'NAV')
     
     def modify_portfolio(self, confirm):
-        bond = confirm['Bond']
+        j = self.index[confirm['Bond']]
         if confirm['Side'] == 'buy':
-            self.portfolio[bond]['Nominal'] += confirm['Size']
+            self.fill(j, confirm['Size'], confirm['Price'])
             self.cash -= confirm['Size']*confirm['Price']/100
         else:
-            self.portfolio[bond]['Nominal'] -= confirm['Size']
+            self.fill(j, -confirm['Size'], confirm['Price'])
             self.cash += confirm['Size']*confirm['Price']/100
-        self.portfolio[bond]['Price'] = confirm['Price']
             
     def make_portfolio_decision(self, step):
         '''
@@ -132,11 +365,11 @@ class MutualFund(BuySide):
         self.rfq_collector.clear()
         expected_cash_flow = self.compute_flow(step)
         expected_cash_position = self.cash + expected_cash_flow
-        expected_nav = self.nav_history[step-1]['BondValue'] + expected_cash_position
+        expected_nav = self.nav_history.value(step-1, 'BondValue') + expected_cash_position
         if expected_cash_position < self.lower_bound*expected_nav or expected_cash_position > self.upper_bound*expected_nav:
             target_cash = self.target * expected_nav
             cash_to_raise = target_cash - expected_cash_position
-            xprices = np.array([self.portfolio[x]['Price']/100 for x in self.bond_list])
+            xprices = self.price/100
             sizes = np.abs(np.round(self.index_weight_array*cash_to_raise/xprices,0))
             if expected_cash_position < self.lower_bound*expected_nav:
                 side = 'sell'
@@ -147,8 +380,12 @@ class MutualFund(BuySide):
                     self.make_rfq(bond, side, sizes[i])
     
     def nav_to_h5(self, filename):
-        df = pd.DataFrame([v for v in self.nav_history.values()])
-        df.to_hdf(filename, 'nav', append=True, format='table', complevel=5, complib='blosc')
+        if self.nav_recorder is not None:
+            self.nav_recorder.flush()
+            return
+        import pandas as pd
+        df = pd.DataFrame(self.nav_history.to_columns())
+        df.to_hdf(filename, key='nav', append=True, format='table', complevel=5, complib='blosc')
         
         
 class MutualFund2(MutualFund):
@@ -157,13 +394,13 @@ class MutualFund2(MutualFund):
         
         
     '''
-    def __init__(self, name, lower_bound, upper_bound, target, bond_list, portfolio, weights, shares):
+    def __init__(self, name, lower_bound, upper_bound, target, bond_list, portfolio, weights, shares, rng=None):
         '''
         Initialize MutualFund
         
         
         '''
-        MutualFund.__init__(self, name, lower_bound, upper_bound, target, bond_list, portfolio, weights, shares)
+        MutualFund.__init__(self, name, lower_bound, upper_bound, target, bond_list, portfolio, weights, shares, rng)
             
     def make_portfolio_decision(self, step):
         '''
@@ -180,11 +417,11 @@ class MutualFund2(MutualFund):
         2. Selling cannot
         '''
         self.rfq_collector.clear()
-        current_nav = self.nav_history[step-1]['NAV']
+        current_nav = self.nav_history.value(step-1, 'NAV')
         if self.cash < self.lower_bound*current_nav or self.cash > self.upper_bound*current_nav:
             target_cash = self.target * current_nav
             cash_to_raise = target_cash - self.cash
-            xprices = np.array([self.portfolio[x]['Price']/100 for x in self.bond_list])
+            xprices = self.price/100
             sizes = np.abs(np.round(self.index_weight_array*cash_to_raise/xprices,0))
             if self.cash < self.lower_bound*current_nav:
                 side = 'sell'
@@ -201,13 +438,13 @@ class InsuranceCo(BuySide):
         
         
     '''
-    def __init__(self, name, equity_weight_target, bond_list, portfolio, year):
+    def __init__(self, name, equity_weight_target, bond_list, portfolio, year, rng=None):
         '''
         Initialize InsuranceCo
         
         
         '''
-        BuySide.__init__(self, name, bond_list, portfolio)
+        BuySide.__init__(self, name, bond_list, portfolio, rng)
         self.trader_type = 'InsuranceCo'
         self.bond_weight_target = 1 - equity_weight_target
         self.equity_returns = self.make_equity_returns(year)
@@ -220,20 +457,17 @@ class InsuranceCo(BuySide):
         return equity_weight*self.compute_portfolio_value()/(1-equity_weight)
     
     def modify_portfolio(self, confirm):
-        bond = confirm['Bond']
+        j = self.index[confirm['Bond']]
         if confirm['Side'] == 'buy':
-            self.portfolio[bond]['Nominal'] += confirm['Size']
+            self.fill(j, confirm['Size'], confirm['Price'])
             self.equity -= confirm['Size']*confirm['Price']/100
         else:
-            self.portfolio[bond]['Nominal'] -= confirm['Size']
+            self.fill(j, -confirm['Size'], confirm['Price'])
             self.equity += confirm['Size']*confirm['Price']/100
-        self.portfolio[bond]['Price'] = confirm['Price']
             
     def make_equity_returns(self, inyear):
-        indf = pd.read_csv('../csv/gspc.csv', parse_dates=['Date'])
-        indf = indf.assign(Year = [x.year for x in indf.Date],
-                           Return = indf['Adj Close'].pct_change()/100)
-        return np.array(indf[indf.Year==inyear]['Return'])
+        # copy: the insurer owns its return path and may override it
+        return np.array(marketdata.load_equity_returns(inyear))
     
     def make_portfolio_decision(self, step):
         '''
@@ -253,8 +487,9 @@ class InsuranceCo(BuySide):
             bond_diff = bond_value - self.bond_weight_target*portfolio_value
             if np.abs(bond_diff) >= 1.0:
                 side = 'sell' if bond_diff >= 1.0 else 'buy'
-                bond = self.bond_list[np.random.randint(0, len(self.bond_list))]
-                bond_price = self.portfolio[bond]['Price']/100
+                j = self.rng.randint(0, len(self.bond_list))
+                bond = self.bond_list[j]
+                bond_price = self.price[j]/100
                 self.make_rfq(bond, side, np.abs(np.round(bond_diff/bond_price,0)))
     
     
@@ -264,13 +499,13 @@ class HedgeFund(BuySide):
         
         
     '''
-    def __init__(self, name, bond_list, portfolio):
+    def __init__(self, name, bond_list, portfolio, rng=None):
         '''
         Initialize HedgeFund
         
         
         '''
-        BuySide.__init__(self, name, bond_list, portfolio)
+        BuySide.__init__(self, name, bond_list, portfolio, rng)
         self.trader_type = 'HedgeFund'
         
     def __repr__(self):
@@ -282,44 +517,84 @@ class Dealer(object):
     Dealer
     
     Dealer receives rfqs and quotes prices as described in Treynor (FAJ, 1987) page 30.
+    
+    Inventory is held as one array per field (nominal, specialization, lower_limit, 
+    upper_limit, quantity, price) in bond_list order, with index mapping bond name to 
+    position. portfolio is a dict view of the arrays for code that works bond by bond.
     '''
     
-    def __init__(self, name, bond_list, portfolio, long_limit, short_limit, bounds, spread_factor):
+    FIELDS = {'Nominal': 'nominal', 'Price': 'price', 'Specialization': 'specialization', 
+              'LowerLimit': 'lower_limit', 'UpperLimit': 'upper_limit', 'Quantity': 'quantity'}
+    
+    __slots__ = ('_trader_id', 'trader_type', 'bond_list', 'index', 'nominal', 'specialization', 'lower_limit', 
+                 'upper_limit', 'quantity', 'price', 'lower_bound', 'upper_bound', 'spread_factor', 'quote_details', 
+                 'detail_recorder', 'rng', '_market_order')
+    
+    def __init__(self, name, bond_list, portfolio, long_limit, short_limit, bounds, spread_factor, rng=None):
         '''
         Initialize Dealer with some base class attributes and a method
         
-        
+        portfolio is a dict of bond dicts with Nominal, Price and Specialization; it is 
+        copied into arrays. rng is the dealer's own RandomStream (default: the legacy 
+        global np.random)
         '''
         self._trader_id = name # trader id
         self.trader_type = 'Dealer'
         self.bond_list = bond_list
-        self.portfolio = portfolio
+        self.index = {bond: j for j, bond in enumerate(bond_list)}
+        self.nominal = np.array([portfolio[bond]['Nominal'] for bond in bond_list], dtype=float)
+        self.specialization = np.array([portfolio[bond]['Specialization'] for bond in bond_list], dtype=float)
+        self.price = np.array([portfolio[bond]['Price'] for bond in bond_list], dtype=float)
+        self.lower_limit = np.empty(len(bond_list))
+        self.upper_limit = np.empty(len(bond_list))
+        self.quantity = np.zeros(len(bond_list))
         self.lower_bound, self.upper_bound = bounds
         self.spread_factor = spread_factor
         self.update_limits(long_limit, short_limit)
         self.quote_details = []
+        self.detail_recorder = None
+        self.rng = rng if rng is not None else RandomStream()
+        self._market_order = None
         
     def __repr__(self):
         return 'Dealer({0}, {1})'.format(self._trader_id, self.trader_type)
     
+    @property
+    def portfolio(self):
+        return {bond: PortfolioRow(self, j) for j, bond in enumerate(self.bond_list)}
+    
+    def _row(self, j):
+        row = {'Name': self.bond_list[j]}
+        for key, attr in self.FIELDS.items():
+            row[key] = getattr(self, attr)[j]
+        return row
+    
+    def _set_field(self, j, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        getattr(self, self.FIELDS[key])[j] = value
+    
+    def stream_to(self, writer, chunk_size=CHUNK_SIZE):
+        '''Stream quote details to writer in chunks instead of keeping them in memory'''
+        self.detail_recorder = StreamRecorder(writer, '%s_details' % self._trader_id, QUOTE_DETAIL_COLUMNS, chunk_size)
+    
     def update_limits(self, long1, short1):
-        for bond in self.bond_list:
-            self.portfolio[bond]['LowerLimit'] = -self.portfolio[bond]['Nominal']*short1
-            self.portfolio[bond]['UpperLimit'] = self.portfolio[bond]['Nominal']*long1
-            self.portfolio[bond]['Quantity'] = 0
+        self.lower_limit[:] = -self.nominal*short1
+        self.upper_limit[:] = self.nominal*long1
+        self.quantity[:] = 0
             
     def update_prices(self, prices):
-        for bond in self.bond_list:
-            self.portfolio[bond]['Price'] = prices[bond]
+        '''prices: a dict by bond name or the market's PriceView, read as one array'''
+        self.price[:], self._market_order = take_prices(prices, self.bond_list, self._market_order)
     
     def modify_portfolio(self, confirm):
-        bond = confirm['Bond']
+        j = self.index[confirm['Bond']]
         # if confirm order to sell, dealer buys and increases inventory
         if confirm['Side'] == 'buy':
-            self.portfolio[bond]['Quantity'] -= confirm['Size']
+            self.quantity[j] -= confirm['Size']
         else:
-            self.portfolio[bond]['Quantity'] += confirm['Size']
-        self.portfolio[bond]['Price'] = confirm['Price']
+            self.quantity[j] += confirm['Size']
+        self.price[j] = confirm['Price']
             
     def make_quote(self, rfq):
         '''
@@ -338,9 +613,10 @@ class Dealer(object):
         bond = rfq['name']
         side = rfq['side']
         amount = rfq['amount']
-        lower_limit = self.portfolio[bond]['LowerLimit']
-        upper_limit = self.portfolio[bond]['UpperLimit']
-        bond_price = self.portfolio[bond]['Price']
+        j = self.index[bond]
+        lower_limit = float(self.lower_limit[j])
+        upper_limit = float(self.upper_limit[j])
+        bond_price = float(self.price[j])
         outside_bid = (1 - self.lower_bound)*bond_price
         outside_ask = (1 + self.upper_bound)*bond_price
         outside_spread = outside_ask - outside_bid
@@ -349,7 +625,7 @@ class Dealer(object):
         inside_spread = self.spread_factor*outside_spread/inventory_range
         # if incoming order to sell, dealer buys and increases inventory
         size = amount if side == 'sell' else -amount
-        expected_inventory = self.portfolio[bond]['Quantity'] + size
+        expected_inventory = float(self.quantity[j]) + size
         if lower_limit <= expected_inventory <= upper_limit:
             quote_midpoint = 0.5*(outside_ask + outside_bid)
             if expected_inventory < 0: # quote_midpoint adjusted up to encourage selling
@@ -365,14 +641,217 @@ class Dealer(object):
                              'ExpectedInventory': expected_inventory, 'LowerLimit': lower_limit, 'UpperLimit': upper_limit, 'LastPrice': bond_price,
                              'OutsideSpread': outside_spread, 'InventoryRange': inventory_range, 'InsideSpread': inside_spread,
                              'Ask': ask_price, 'Bid': bid_price, 'QuotePrice': price}
-            self.quote_details.append(extra_details)
+            self.record_quote(extra_details)
         else:
             quote = None #{'Dealer': self._trader_id, 'order_id': order_id, 'name': bond, 'amount': None, 'side': side, 'price': None}
         return quote
             
+    def record_quote(self, extra_details):
+        if self.detail_recorder is not None:
+            self.detail_recorder.record(extra_details)
+        else:
+            self.quote_details.append(extra_details)
+            
     def extra_to_h5(self, filename):
+        if self.detail_recorder is not None:
+            self.detail_recorder.flush()
+            return
+        import pandas as pd
         df = pd.DataFrame(self.quote_details)
-        df.to_hdf(filename, '%s_details' % self._trader_id, append=True, format='table', complevel=5, complib='blosc')    
+        df.to_hdf(filename, key='%s_details' % self._trader_id, append=True, format='table', complevel=5, complib='blosc')
+
+
+def treynor_quotes(quantity, lower_limit, upper_limit, bond_price, size, lower_bound, upper_bound, spread_factor):
+    '''
+    Dealer.make_quote on arrays, broadcasting over dealers, rfqs or worlds
+    
+    size is the change in dealer inventory the rfq would cause (+amount for a sell rfq, 
+    -amount for a buy rfq). Returns the quote price, NaN where the dealer would breach an
+    inventory limit, and a dict of the intermediate values kept in Dealer.quote_details.
+    '''
+    outside_bid = (1 - lower_bound)*bond_price
+    outside_ask = (1 + upper_bound)*bond_price
+    outside_spread = outside_ask - outside_bid
+    inventory_range = upper_limit - lower_limit
+    inside_spread = spread_factor*outside_spread/inventory_range
+    expected_inventory = quantity + size
+    quote_midpoint = 0.5*(outside_ask + outside_bid)
+    # quote_midpoint adjusted up when short to encourage selling, down when long to encourage buying
+    quote_midpoint = quote_midpoint + np.where(expected_inventory < 0, 0.5*outside_spread*(expected_inventory/(lower_limit - spread_factor)), 0)
+    quote_midpoint = quote_midpoint - np.where(expected_inventory > 0, 0.5*outside_spread*(expected_inventory/(upper_limit + spread_factor)), 0)
+    ask_price = quote_midpoint + 0.5*inside_spread
+    bid_price = quote_midpoint - 0.5*inside_spread
+    price = np.where(size > 0, bid_price, ask_price)
+    feasible = (lower_limit <= expected_inventory) & (expected_inventory <= upper_limit)
+    details = {'ExpectedInventory': expected_inventory, 'LowerLimit': lower_limit, 'UpperLimit': upper_limit, 'LastPrice': bond_price,
+               'OutsideSpread': outside_spread, 'InventoryRange': inventory_range, 'InsideSpread': inside_spread,
+               'Ask': ask_price, 'Bid': bid_price}
+    return np.where(feasible, price, np.nan), details
+
+
+class DealerPanel(object):
+    '''
+    DealerPanel
+    
+    all dealers' inventories, limits and prices as (dealers x bonds) arrays, so every 
+    dealer's quote for an rfq (or a batch of rfqs) comes from one vectorized pass of the 
+    Treynor logic in treynor_quotes
+    
+    The panel is built from Dealer objects that share a bond_list. Each dealer's quantity,
+    limit and price arrays are rebound to its row of the panel arrays, so fills and price 
+    updates made through either the panel or a dealer are seen by both.
+    
+    The panel also keeps each dealer's remaining capacity per bond and side: how much it
+    can still buy (sell_capacity, for sell rfqs) or sell (buy_capacity, for buy rfqs) 
+    before hitting a limit. make_quotes only asks dealers with enough capacity and rejects
+    an rfq no dealer can absorb without quoting at all. Fills should go through 
+    modify_portfolio, which keeps the capacities current; call refresh_capacity after 
+    changing dealer inventories or limits directly.
+    
+    The inside spreads quoted since reset_spreads are summed per bond, so mean_spreads
+    gives the day's average quoted spread without keeping the quote details.
+    '''
+    
+    ARRAYS = ('quantity', 'lower_limit', 'upper_limit', 'price')
+    
+    def __init__(self, dealers, record_details=True):
+        '''
+        record_details keeps writing each quote to its dealer's quote_details (or 
+        detail recorder), as Dealer.make_quote does
+        '''
+        self.dealers = list(dealers)
+        self.names = [d._trader_id for d in self.dealers]
+        self.dealer_index = {name: i for i, name in enumerate(self.names)}
+        self.bond_list = list(self.dealers[0].bond_list)
+        if any(list(d.bond_list) != self.bond_list for d in self.dealers):
+            raise ValueError('DealerPanel dealers must share one bond_list')
+        self.index = {bond: j for j, bond in enumerate(self.bond_list)}
+        self.record_details = record_details
+        for attr in self.ARRAYS:
+            setattr(self, attr, np.array([getattr(d, attr) for d in self.dealers], dtype=float))
+        self._bind()
+        self.lower_bound = np.array([d.lower_bound for d in self.dealers])
+        self.upper_bound = np.array([d.upper_bound for d in self.dealers])
+        self.spread_factor = np.array([d.spread_factor for d in self.dealers], dtype=float)
+        self.refresh_capacity()
+        self.reset_spreads()
+        self.rejected = 0
+        self._market_order = None
+        
+    def _bind(self):
+        for i, dealer in enumerate(self.dealers):
+            for attr in self.ARRAYS:
+                setattr(dealer, attr, getattr(self, attr)[i])
+                
+    def __setstate__(self, state):
+        # pickling copies the dealers' rows apart from the panel arrays, so bind them again
+        self.__dict__.update(state)
+        self._bind()
+        
+    def __repr__(self):
+        return 'DealerPanel({0})'.format(', '.join(self.names))
+    
+    def __len__(self):
+        return len(self.dealers)
     
+    def refresh_capacity(self):
+        self.sell_capacity = self.upper_limit - self.quantity
+        self.buy_capacity = self.quantity - self.lower_limit
+        
+    def reset_spreads(self):
+        self.spread_sum = np.zeros(len(self.bond_list))
+        self.spread_count = np.zeros(len(self.bond_list))
+        
+    def mean_spreads(self):
+        '''
+        Mean inside spread quoted per bond since reset_spreads, NaN for bonds not quoted
+        
+        Both quote_prices and quote_batch count; quote and Dealer.make_quote do not.
+        '''
+        return np.divide(self.spread_sum, self.spread_count, out=np.full(len(self.bond_list), np.nan), 
+                         where=self.spread_count > 0)
+        
+    def able_dealers(self, bond, side, amount):
+        '''Positions of the dealers with the capacity to take the rfq'''
+        capacity = self.sell_capacity if side == 'sell' else self.buy_capacity
+        return np.flatnonzero(capacity[:, self.index[bond]] >= amount)
+    
+    def quote(self, bond, side, amount):
+        '''Every dealer's quote for one rfq: (dealers,) prices, NaN where a dealer cannot quote'''
+        j = self.index[bond]
+        size = amount if side == 'sell' else -amount
+        return treynor_quotes(self.quantity[:, j], self.lower_limit[:, j], self.upper_limit[:, j], self.price[:, j], size,
+                              self.lower_bound, self.upper_bound, self.spread_factor)
+    
+    def quote_batch(self, bonds, sides, amounts):
+        '''
+        Every dealer's quote for a batch of rfqs: (rfqs x dealers) prices
+        
+        All rfqs are quoted against the current inventories, as if each were the only one.
+        '''
+        j = np.array([self.index[bond] for bond in bonds])
+        size = np.where(np.asarray(sides) == 'sell', 1, -1)*np.asarray(amounts, dtype=float)
+        prices, details = treynor_quotes(self.quantity[:, j].T, self.lower_limit[:, j].T, self.upper_limit[:, j].T, 
+                                         self.price[:, j].T, size[:, None], self.lower_bound, self.upper_bound, self.spread_factor)
+        quoting = ~np.isnan(prices)
+        np.add.at(self.spread_sum, j, np.where(quoting, details['InsideSpread'], 0).sum(axis=1))
+        np.add.at(self.spread_count, j, quoting.sum(axis=1))
+        return prices
     
+    def quote_prices(self, rfq):
+        '''
+        Every dealer's quote price for one rfq, NaN where a dealer does not quote
+        
+        Only dealers with the capacity to take the rfq are quoted; if there are none the
+        rfq is counted in rejected and None is returned.
+        '''
+        bond = rfq['name']
+        side = rfq['side']
+        amount = rfq['amount']
+        able = self.able_dealers(bond, side, amount)
+        if not len(able):
+            self.rejected += 1
+            return None
+        j = self.index[bond]
+        size = amount if side == 'sell' else -amount
+        quoted, details = treynor_quotes(self.quantity[able, j], self.lower_limit[able, j], self.upper_limit[able, j], 
+                                         self.price[able, j], size, self.lower_bound[able], self.upper_bound[able], 
+                                         self.spread_factor[able])
+        prices = np.full(len(self.dealers), np.nan)
+        prices[able] = quoted
+        quoting = ~np.isnan(quoted)
+        self.spread_sum[j] += details['InsideSpread'][quoting].sum()
+        self.spread_count[j] += quoting.sum()
+        if self.record_details:
+            for k in np.flatnonzero(~np.isnan(quoted)):
+                i = able[k]
+                extra_details = {'Dealer': self.names[i], 'order_id': rfq['order_id'], 'name': bond, 'amount': amount, 'side': side, 
+                                 'price': quoted[k]}
+                extra_details.update((key, value[k]) for key, value in details.items())
+                extra_details['QuotePrice'] = quoted[k]
+                self.dealers[i].record_quote(extra_details)
+        return prices
+    
+    def make_quotes(self, rfq):
+        '''Quotes for one rfq in the form BondMarket.match_trade takes: a quote dict or None per dealer'''
+        prices = self.quote_prices(rfq)
+        quotes = [None]*len(self.dealers)
+        if prices is not None:
+            for i in np.flatnonzero(~np.isnan(prices)):
+                quotes[i] = {'Dealer': self.names[i], 'order_id': rfq['order_id'], 'name': rfq['name'], 'amount': rfq['amount'], 
+                             'side': rfq['side'], 'price': prices[i]}
+        return quotes
     
+    def modify_portfolio(self, confirm):
+        size = confirm['Size'] if confirm['Side'] == 'sell' else -confirm['Size']
+        self.fill(self.dealer_index[confirm['Dealer']], self.index[confirm['Bond']], size, confirm['Price'])
+        
+    def fill(self, i, j, size, price):
+        '''Dealer i's fill in bond j: size is the change in its inventory'''
+        self.quantity[i, j] += size
+        self.price[i, j] = price
+        self.sell_capacity[i, j] = self.upper_limit[i, j] - self.quantity[i, j]
+        self.buy_capacity[i, j] = self.quantity[i, j] - self.lower_limit[i, j]
+        
+    def update_prices(self, prices):
+        self.price[:], self._market_order = take_prices(prices, self.bond_list, self._market_order)
@@ -0,0 +1,78 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from corpbondabm.aggregator import QuantileSketch, RunningMoments, StepAggregator, aggregate_replications
+from corpbondabm.runner2017_r1 import Runner
+
+
+class TestAggregator(unittest.TestCase):
+
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.values = rng.normal(100, 5, size=(3000, 2, 3))
+        self.values[::5, 1, 2] = np.nan
+        
+    def fill(self, moments, sketch, values):
+        for x in values:
+            for row in range(len(x)):
+                moments.update(row, x[row])
+                sketch.add(row, x[row])
+        
+    def test_running_moments(self):
+        moments, sketch = RunningMoments((2, 3)), QuantileSketch((2, 3))
+        self.fill(moments, sketch, self.values)
+        np.testing.assert_allclose(moments.mean, np.nanmean(self.values, axis=0))
+        np.testing.assert_allclose(moments.variance, np.nanvar(self.values, axis=0, ddof=1))
+        self.assertEqual(moments.count[1, 2], 2400)
+        
+    def test_quantile_sketch(self):
+        moments, sketch = RunningMoments((2, 3)), QuantileSketch((2, 3))
+        self.fill(moments, sketch, self.values)
+        quantiles = [0.05, 0.5, 0.95]
+        np.testing.assert_allclose(sketch.quantile(quantiles), np.nanquantile(self.values, quantiles, axis=0), atol=0.25)
+        self.assertLessEqual((sketch.weights[0, 0] > 0).sum(), sketch.size)
+        self.assertTrue(np.isnan(QuantileSketch((2, 3)).quantile(0.5)).all())
+        
+    def test_merge(self):
+        whole = RunningMoments((2, 3)), QuantileSketch((2, 3))
+        first, second = (RunningMoments((2, 3)), QuantileSketch((2, 3))), (RunningMoments((2, 3)), QuantileSketch((2, 3)))
+        self.fill(*whole, self.values)
+        self.fill(*first, self.values[:1000])
+        self.fill(*second, self.values[1000:])
+        moments = first[0].merge(second[0])
+        np.testing.assert_allclose(moments.mean, whole[0].mean)
+        np.testing.assert_allclose(moments.variance, whole[0].variance)
+        # a sketch survives pickling (to come back from a worker) before it is merged
+        sketch = pickle.loads(pickle.dumps(first[1])).merge(second[1])
+        np.testing.assert_allclose(sketch.quantile([0.05, 0.5, 0.95]), whole[1].quantile([0.05, 0.5, 0.95]), atol=0.25)
+        with self.assertRaises(ValueError):
+            sketch.merge(QuantileSketch((2, 2)))
+            
+    def test_step_aggregator(self):
+        runners = [Runner(run=False, seed=1, run_steps=60, mm_share=share) for share in (0.35, 0.55)]
+        aggregators = [StepAggregator.for_runner(runner) for runner in runners]
+        for runner, aggregator in zip(runners, aggregators):
+            list(runner.iter_steps(consumers=[aggregator]))
+        aggregator = aggregators[0].merge(aggregators[1])
+        self.assertEqual(aggregator.replications, 2)
+        navs = [runner.mutualfund.nav_history[67]['NAV'] for runner in runners]
+        self.assertAlmostEqual(aggregator.mean('NAV')[-1], np.mean(navs))
+        self.assertAlmostEqual(aggregator.std('NAV')[-1], np.std(navs, ddof=1))
+        lower, upper = aggregator.band('NAV')
+        self.assertTrue(min(navs) <= lower[-1] <= upper[-1] <= max(navs))
+        self.assertEqual(aggregator.mean('DealerInventory').shape, (60, 3, 5))
+        summary = aggregator.summary('Prices')
+        self.assertEqual(len(summary), 60*5)
+        self.assertListEqual(list(summary.columns[-3:]), ['Q0.05', 'Q0.5', 'Q0.95'])
+        
+    def test_aggregate_replications(self):
+        aggregator = aggregate_replications([{'run_steps': 60}]*3, seed=1, max_workers=2)
+        self.assertEqual(aggregator.replications, 3)
+        self.assertEqual(aggregator.count('Prices')[-1].tolist(), [3]*5)
+        # bonds only trade, and so are only quoted, after the day-50 shock
+        self.assertTrue(np.isnan(aggregator.mean('Spreads')[0]).all())
+        with self.assertRaises(ValueError):
+            aggregate_replications([])
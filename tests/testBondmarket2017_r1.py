@@ -2,7 +2,7 @@ import unittest
 
 import numpy as np
 
-from corpbondabm.bondmarket2017_r1 import BondMarket
+from corpbondabm.bondmarket2017_r1 import BondMarket, take_prices
 
 
 class TestBondmarket(unittest.TestCase):
@@ -42,6 +42,43 @@ class TestBondmarket(unittest.TestCase):
         self.assertDictEqual(self.bondmarket.bonds[4], expected)
         self.assertEqual(self.bondmarket.last_prices['MM105'], price5)
         
+    def test_universe_views(self):
+        universe = self.bondmarket.universe
+        self.assertEqual(len(self.bondmarket.bonds), 5)
+        self.assertListEqual(universe.names, ['MM101', 'MM102', 'MM103', 'MM104', 'MM105'])
+        self.assertListEqual(list(universe.nominal), [500, 500, 1000, 2000, 1000])
+        # rows and last_prices write through to the columns
+        self.bondmarket.bonds[2]['Yield'] = 0.03
+        self.assertEqual(universe.ytm[2], 0.03)
+        self.bondmarket.last_prices['MM104'] = 99.5
+        self.assertEqual(universe.last_price[3], 99.5)
+        self.assertIs(self.bondmarket.last_prices.array.base, universe.last_price.base)
+        self.assertEqual(self.bondmarket.last_prices.index['MM105'], 4)
+        
+    def test_universe_grows(self):
+        for i in range(20):
+            self.bondmarket.add_bond('XX%i' % i, 100, 5, .03, .03, 2)
+        self.assertEqual(len(self.bondmarket.bonds), 25)
+        self.assertEqual(self.bondmarket.bonds[-1]['Name'], 'XX19')
+        self.assertAlmostEqual(self.bondmarket.last_prices['XX19'], 100.0, 10)
+        self.assertEqual(self.bondmarket.last_prices['MM101'], 100.24721536368058)
+        with self.assertRaises(ValueError):
+            self.bondmarket.add_bond('MM101', 500, 1, .0175, .015, 2)
+        
+    def test_take_prices(self):
+        view = self.bondmarket.last_prices
+        bond_list = ['MM105', 'MM101']
+        prices, order = take_prices(view, bond_list)
+        self.assertListEqual(list(order), [4, 0])
+        self.assertListEqual(list(prices), [view['MM105'], view['MM101']])
+        # positions survive the universe growing, and dicts by bond name work too
+        self.bondmarket.add_bond('XX1', 100, 5, .03, .03, 2)
+        view['MM105'] = 90.0
+        self.assertEqual(take_prices(view, bond_list, order)[0][0], 90.0)
+        prices, order = take_prices(dict(view), bond_list)
+        self.assertIsNone(order)
+        self.assertListEqual(list(prices), [90.0, view['MM101']])
+        
     @unittest.skip('Not in use')
     def test_compute_weights_from_price(self):
         weights = list(np.round(self.bondmarket.compute_weights_from_price(),2))
@@ -62,6 +99,24 @@ class TestBondmarket(unittest.TestCase):
         self.assertDictEqual(self.bondmarket.trades[0], trade_report)
         self.assertEqual(self.bondmarket.last_prices['MM101'], 99.95)
         
+    def test_report_trades_order_id(self):
+        matcher = {'Dealer': 'd1', 'order_id': 'm1', 'name': 'MM101', 'amount': 20, 'side': 'buy', 'price': 99.95}
+        for order_id in ('m1', 'm1_x', '_1'):
+            with self.subTest(order_id=order_id):
+                with self.assertRaises(ValueError):
+                    self.bondmarket.report_trades(dict(matcher, order_id=order_id), 1)
+        self.assertEqual(len(self.bondmarket.trades), 0)
+        # a buy side name may itself hold underscores
+        self.bondmarket.report_trades(dict(matcher, order_id='mf_0_7'), 1)
+        self.assertEqual(self.bondmarket.trades[0]['OrderId'], 'mf_0_7')
+        
+    def test_trades_append_report(self):
+        report = {'Sequence': 1, 'Dealer': 'd4', 'OrderId': 'i1_3', 'Bond': 'MM103', 'Size': 10, 'Side': 'sell', 
+                  'Price': 98.5, 'Day': 12}
+        self.bondmarket.trades.append(report)
+        self.assertDictEqual(self.bondmarket.trades[0], report)
+        self.assertEqual(self.bondmarket.register_agent('d4'), 0)
+        
     def test_match_trade(self):
         quotes = [
                     {'Dealer': 'd1', 'order_id': 'm1_1', 'name': 'MM101', 'amount': 5, 'side': 'buy', 'price': 100.1183},
@@ -84,7 +139,45 @@ class TestBondmarket(unittest.TestCase):
         dealer_confirm, buyside_confirm = self.bondmarket.match_trade(quotes, step)
         self.assertDictEqual({'Dealer': 'd2', 'Size': 8, 'Bond': 'MM101', 'Side': 'sell', 'Price': 99.8888}, dealer_confirm)
         self.assertDictEqual({'BuySide': 'm1', 'Size': 8, 'Bond': 'MM101', 'Side': 'sell', 'Price': 99.8888}, buyside_confirm)
+        
+    def test_match_trade_no_quotes(self):
+        for quotes in ([None, None, None], [None, {}, None], []):
+            with self.subTest(quotes=quotes):
+                with self.assertRaisesRegex(ValueError, 'no dealer quoted'):
+                    self.bondmarket.match_trade(quotes, 10)
+        self.assertEqual(len(self.bondmarket.trades), 0)
       
+    def test_match_prices(self):
+        dealer_ids = np.array([self.bondmarket.register_agent(d) for d in ['d1', 'd2', 'd3']])
+        m1 = self.bondmarket.register_agent('m1')
+        self.assertEqual(self.bondmarket.register_agent('d2'), 1)
+        prices = np.array([100.1183, 100.1453, 100.1183])
+        np.random.seed(1) # same draw as test_match_trade: position 1 of the ties (d3)
+        self.assertEqual(self.bondmarket.match_prices(prices, dealer_ids, m1, 1, 0, 0, 5, 10), (2, 100.1183))
+        prices = np.array([99.6789, np.nan, 99.8888])
+        self.assertEqual(self.bondmarket.match_prices(prices, dealer_ids, m1, 2, 0, 1, 8, 11), (2, 99.8888))
+        self.assertIsNone(self.bondmarket.match_prices(np.full(3, np.nan), dealer_ids, m1, 3, 0, 1, 8, 11))
+        self.assertEqual(len(self.bondmarket.trades), 2)
+        self.assertDictEqual(self.bondmarket.trades[0], {'Sequence': 1, 'Dealer': 'd3', 'OrderId': 'm1_1', 'Bond': 'MM101', 
+                                                         'Size': 5, 'Side': 'buy', 'Price': 100.1183, 'Day': 10})
+        self.assertEqual(self.bondmarket.last_prices['MM101'], 99.8888)
+        columns = self.bondmarket.trades.to_columns()
+        self.assertEqual(list(columns['OrderId']), ['m1_1', 'm1_2'])
+        self.assertEqual(list(columns['Side']), ['buy', 'sell'])
+        
+    def test_trade_log_growth(self):
+        trades = self.bondmarket.trades
+        for k in range(2000):
+            self.bondmarket.report_trades({'Dealer': 'd1', 'order_id': 'm1_%d' % k, 'name': 'MM102', 'amount': 1, 'side': 'sell', 
+                                           'price': 100 + k}, k)
+        self.assertEqual(len(trades), 2000)
+        self.assertEqual(trades[-1]['OrderId'], 'm1_1999')
+        # slices work as they did on the list of trades
+        self.assertListEqual([t['OrderId'] for t in trades[:3]], ['m1_0', 'm1_1', 'm1_2'])
+        self.assertListEqual([t['Day'] for t in trades[-4::2]], [1996, 1998])
+        self.assertListEqual(trades[2005:], [])
+        np.testing.assert_array_equal(trades.column('Day'), np.arange(2000))
+        
     def test_update_eod_bond_price(self):
         for bond in self.bondmarket.bonds:
             self.bondmarket.last_prices[bond['Name']] += 1.0
@@ -97,6 +190,44 @@ class TestBondmarket(unittest.TestCase):
                 self.assertAlmostEqual(new_bondmarket_prices[i], expected_prices[i], 6)
                 self.assertAlmostEqual(updated_bondmarket_prices[i], expected_prices[i], 6)
                 
+    def test_update_eod_bond_price_scalar(self):
+        self.bondmarket.batch_pricing = False
+        for bond in self.bondmarket.bonds:
+            self.bondmarket.last_prices[bond['Name']] += 1.0
+        self.bondmarket.update_eod_bond_price(8)
+        new_bondmarket_prices = np.array(list(self.bondmarket.last_prices.values()))
+        expected_prices = np.array([101.24725089, 102.468441831, 99.8341791171, 99.2514299988, 97.7771024019])
+        for i in range(5):
+            with self.subTest(i=i):
+                self.assertAlmostEqual(new_bondmarket_prices[i], expected_prices[i], 6)
+                
+    def test_update_eod_bond_price_nper(self):
+        # annual and quarterly coupons price the same whether batched or not
+        prices = []
+        for batch_pricing in (True, False):
+            bondmarket = BondMarket('bondmarket1', 2003, batch_pricing=batch_pricing)
+            bondmarket.add_bond('MM101', 500, 1, .0175, .015, 2)
+            bondmarket.add_bond('MM102', 500, 2, .025, .0175, 4)
+            bondmarket.add_bond('MM103', 1000, 5, .0225, .025, 2)
+            bondmarket.add_bond('MM104', 2000, 10, .024, .026, 2)
+            bondmarket.add_bond('MM105', 1000, 25, .12, .0421, 1)
+            bondmarket.update_eod_bond_price(8)
+            prices.append(bondmarket.universe.price.copy())
+        np.testing.assert_allclose(prices[0], prices[1], rtol=0, atol=1e-8)
+        
+    def test_bond_ytms(self):
+        maturities = np.array([1, 2, 5, 10, 25, 30])
+        coupons = np.array([.0175, .025, .0225, .024, .04, .06])
+        prices = np.array([101.0, 102.0, 99.5, 97.0, 95.0, 120.0])
+        guesses = np.array([.015, .0175, .025, .026, .0421, .05])
+        ytms = self.bondmarket.bond_ytms(100, maturities, coupons, prices, 2, guesses)
+        for i in range(6):
+            with self.subTest(i=i):
+                expected = self.bondmarket.bond_ytm(100, maturities[i], coupons[i], prices[i], 2, guesses[i])
+                self.assertAlmostEqual(ytms[i], expected, 10)
+        repriced = self.bondmarket._price_bonds(100, maturities, coupons, ytms, 2)
+        np.testing.assert_allclose(repriced, prices, rtol=0, atol=1e-8)
+        
     def test_shock_ytm(self):
         old_rates = np.array([bond['Yield'] for bond in self.bondmarket.bonds])
         self.bondmarket.shock_ytm(0.01)
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from corpbondabm.charter2017_r1 import Charter, live_chart
+
+
+class TestCharter(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        
+    def test_headless(self):
+        output = os.path.join(self.tmpdir, 'prices.png')
+        frame_file = os.path.join(self.tmpdir, 'frame_%03d.png')
+        charter = Charter(mm_share=0.55, run_steps=60, year=2016, seed=3, headless=True, output=output,
+                          frame_file=frame_file, frame_every=25)
+        self.assertTrue(os.path.exists(output))
+        self.assertListEqual(sorted(os.listdir(self.tmpdir)), ['frame_008.png', 'frame_033.png', 'frame_058.png', 'prices.png'])
+        # the buffers hold the whole price history
+        history = charter.bondmarket.price_history
+        self.assertEqual(charter.chart_size, len(history))
+        np.testing.assert_array_equal(charter.chart_days, [row['Date'] for row in history])
+        np.testing.assert_array_equal(charter.chart_prices[1], [row['MM102'] for row in history])
+        x, y = charter.lines[4].get_data()
+        np.testing.assert_array_equal(y, charter.chart_prices[4])
+        
+    def test_decimate(self):
+        charter = Charter(run_steps=20, year=2016, seed=3, headless=True, max_points=5)
+        self.assertEqual(charter.decimate(5), slice(0, 5))
+        np.testing.assert_array_equal(charter.decimate(12), [0, 3, 6, 9, 11])
+        np.testing.assert_array_equal(charter.decimate(13), [0, 3, 6, 9, 12])
+        x, y = charter.lines[0].get_data()
+        np.testing.assert_array_equal(x, [8, 11, 14, 17, 19])
+        
+    def test_live_chart(self):
+        output = os.path.join(self.tmpdir, 'live.png')
+        charter = live_chart({'mm_share': 0.35, 'run_steps': 60, 'year': 2016, 'seed': 3}, fps=50, headless=True, output=output)
+        self.assertTrue(os.path.exists(output))
+        self.assertEqual(charter.chart_size, 60)
+        np.testing.assert_array_equal(charter.chart_days[:60], np.arange(8, 68))
+        
+    def test_live_chart_primer(self):
+        charter = live_chart({'run_steps': 20, 'primer': 12, 'seed': 3}, fps=50, headless=True)
+        np.testing.assert_array_equal(charter.chart_days[:charter.chart_size], np.arange(12, 32))
+        self.assertTupleEqual(charter.ax.get_xlim(), (12, 32))
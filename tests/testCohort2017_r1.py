@@ -0,0 +1,96 @@
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from corpbondabm.bondmarket2017_r1 import BondMarket
+from corpbondabm.cohort2017_r1 import MutualFundCohort, InsuranceCohort
+from corpbondabm.runner2017_r1 import Runner
+from corpbondabm.trader2017_r1 import MutualFund2, InsuranceCo
+
+MM_FRACTION = 0.15
+
+
+class TestCohort(unittest.TestCase):
+
+
+    def setUp(self):
+        self.bondmarket = BondMarket('bondmarket1', 2003)
+        self.bondmarket.add_bond('MM101', 500, 1, .0175, .015, 2)
+        self.bondmarket.add_bond('MM102', 500, 2, .025, .0175, 2)
+        self.bondmarket.add_bond('MM103', 1000, 5, .0225, .025, 2)
+        self.bondmarket.add_bond('MM104', 2000, 10, .024, .026, 2)
+        self.bondmarket.add_bond('MM105', 1000, 25, .04, .0421, 2)
+        self.weights = self.bondmarket.compute_weights_from_nominal()
+        self.bond_list = list(self.bondmarket.universe.names)
+        self.nominal = MM_FRACTION*self.bondmarket.universe.nominal
+        self.prices = self.bondmarket.universe.price
+
+    def portfolio(self, nominal):
+        return {bond: {'Name': bond, 'Nominal': n, 'Price': p} for bond, n, p in zip(self.bond_list, nominal, self.prices)}
+
+    def test_mutual_fund_decision(self):
+        # three funds with different cash: in band, low (sell) and high (buy)
+        cohort = MutualFundCohort('mf', 3, 0.03, 0.08, 0.05, self.bond_list, self.nominal, self.prices, self.weights, 10)
+        cohort.nav_ring['NAV'][6 % 8] = 750
+        cohort.nav_steps[6 % 8] = 6
+        cohort.cash = np.array([30.0, 20.0, 70.0])
+        batch = cohort.make_portfolio_decision(7)
+        for k, cash in enumerate([30, 20, 70]):
+            with self.subTest(k=k):
+                m2 = MutualFund2('m2', 0.03, 0.08, 0.05, self.bond_list, self.portfolio(self.nominal), self.weights, 10)
+                m2.nav_history[6] = {'Step': 6, 'BondValue': 720, 'Cash': 30, 'NAV': 750, 'NAVPerShare': 75}
+                m2.cash = cash
+                m2.make_portfolio_decision(7)
+                mine = [rfq for rfq in cohort.rfq_dicts() if rfq['order_id'].startswith('mf_%d_' % k)]
+                self.assertEqual([(r['name'], r['side'], r['amount']) for r in mine],
+                                 [(r['name'], r['side'], r['amount']) for r in m2.rfq_collector])
+        self.assertListEqual(list(batch.Fund), [1]*5 + [2]*5)
+        self.assertListEqual(list(batch.OrderNumber), [1, 2, 3, 4, 5]*2)
+        # rfq numbers carry on per fund
+        cohort.make_portfolio_decision(7)
+        self.assertListEqual(list(cohort.rfqs.OrderNumber), [6, 7, 8, 9, 10]*2)
+
+    def test_mutual_fund_nav(self):
+        cohort = MutualFundCohort('mf', 2, 0.03, 0.08, 0.05, self.bond_list, self.nominal, self.prices, self.weights, 100)
+        m1 = MutualFund2('m1', 0.03, 0.08, 0.05, self.bond_list, self.portfolio(self.nominal), self.weights, 100)
+        for step in range(1, 12):
+            prices = dict(zip(self.bond_list, self.prices*(1 + 0.001*np.sin(step + np.arange(5)))))
+            cohort.end_of_day(step, prices)
+            m1.update_prices(prices)
+            m1.add_nav_to_history(step)
+        np.testing.assert_allclose(cohort.nav(11, 'NAVPerShare'), m1.nav_history[11]['NAVPerShare'], rtol=1e-12)
+        np.testing.assert_allclose(cohort.cash, m1.cash, rtol=1e-12)
+        cohort.fill(1, 0, -5, 100)
+        self.assertAlmostEqual(cohort.cash[1] - cohort.cash[0], 5)
+        self.assertEqual(cohort.nominal[1, 0], self.nominal[0] - 5)
+
+    def test_insurance_decision(self):
+        ic_nominal = (1-MM_FRACTION)*self.bondmarket.universe.nominal
+        cohort = InsuranceCohort('ic', 2, 0.4, self.bond_list, ic_nominal, self.prices, 2003)
+        prices = {'MM101': 101, 'MM102': 98, 'MM103': 95, 'MM104': 105, 'MM105': 100}
+        cohort.update_prices(prices)
+        cohort.equity_returns[0] = 0.2
+        cohort.equity[1] = 0.4*cohort.compute_portfolio_value()[1]/0.6/1.2 # back on target after the return
+        np.random.seed(1) # randomly selects 'MM104' for the first insurer
+        batch = cohort.make_portfolio_decision(1)
+        i1 = InsuranceCo('i1', 0.4, self.bond_list, self.portfolio(ic_nominal), 2003)
+        i1.update_prices(prices)
+        i1.equity_returns[0] = 0.2
+        np.random.seed(1)
+        i1.make_portfolio_decision(1)
+        self.assertListEqual(cohort.rfq_dicts(batch), [dict(i1.rfq_collector[0], order_id='ic_0_1')])
+
+    def test_runner_cohorts(self):
+        cohorts = [{'kind': 'MutualFund', 'name': 'mf', 'funds': 20, 'share': 0.01},
+                   {'kind': 'InsuranceCo', 'name': 'ic', 'funds': 5, 'share': 0.02}]
+        with mock.patch.object(Runner, 'make_h5s'):
+            runner = Runner(mm_share=0.35, run_steps=60, year=2016, seed=3, cohorts=cohorts)
+            plain = Runner(mm_share=0.35, run_steps=60, year=2016, seed=3)
+        self.assertEqual(len(runner.cohorts[0]), 20)
+        traders = {runner.bondmarket.trades[k]['OrderId'].rsplit('_', 1)[0] for k in range(len(runner.bondmarket.trades))}
+        self.assertTrue(any(t.startswith('mf_') for t in traders))
+        self.assertGreater(runner.bondmarket.trade_sequence, plain.bondmarket.trade_sequence)
+        with self.assertRaises(ValueError):
+            Runner(run=False, cohorts=[{'kind': 'HedgeFund', 'name': 'h', 'funds': 1, 'share': 0.1}])
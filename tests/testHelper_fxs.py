@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+from corpbondabm import helper_fxs
+from corpbondabm.bondmarket2017_r1 import BondMarket
+
+
+class TestHelperFxs(unittest.TestCase):
+
+
+    def setUp(self):
+        self.maturities = np.array([1, 2, 5, 10, 25])
+        self.coupons = np.array([.0175, .025, .0225, .024, .04])
+        self.ytms = np.array([.015, .0175, .025, .026, .0421])
+        self.nominals = np.array([500, 500, 1000, 2000, 1000])
+        self.cache = helper_fxs.CashFlowCache(maxsize=3)
+        
+    def test_schedule(self):
+        times, cash_flows = self.cache.schedule(2, .025, 2)
+        self.assertListEqual(list(times), [0.5, 1.0, 1.5, 2.0])
+        self.assertListEqual(list(cash_flows), [.0125, .0125, .0125, 1.0125])
+        self.cache.schedule(2, .025, 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        
+    def test_lru_eviction(self):
+        for m in [1, 2, 5]:
+            self.cache.schedule(m, .03, 2)
+        self.cache.schedule(1, .03, 2) # 1 is now most recently used
+        self.cache.schedule(10, .03, 2) # evicts 2
+        self.assertEqual(len(self.cache), 3)
+        self.assertNotIn((2.0, .03, 2), self.cache._schedules)
+        self.assertIn((1.0, .03, 2), self.cache._schedules)
+        
+    def test_bond_analytics(self):
+        analytics = helper_fxs.bond_analytics(self.maturities, self.coupons, self.ytms, self.nominals, 2, cache=self.cache)
+        expected_prices = [100.24721536368058, 101.46775304752784, 98.83180926153969, 98.24880431930488, 96.7721765936335]
+        np.testing.assert_allclose(analytics['Price'], expected_prices, rtol=1e-12)
+        # modified duration and convexity against central differences of the market pricer
+        bondmarket = BondMarket('bondmarket1', 2003)
+        dy = 1e-5
+        p0 = bondmarket._price_bonds(100, self.maturities, self.coupons, self.ytms, 2)
+        p_up = bondmarket._price_bonds(100, self.maturities, self.coupons, self.ytms+dy, 2)
+        p_down = bondmarket._price_bonds(100, self.maturities, self.coupons, self.ytms-dy, 2)
+        np.testing.assert_allclose(analytics['Modified'], (p_down-p_up)/(2*dy*p0), rtol=1e-6)
+        np.testing.assert_allclose(analytics['Convexity'], (p_up+p_down-2*p0)/(dy*dy*p0), rtol=1e-4)
+        np.testing.assert_allclose(analytics['DV01'], analytics['Modified']*p0*self.nominals/100*0.0001)
+        
+    def test_get_duration(self):
+        expected = [0.988256354266175, 1.9465421776593244, 4.696489340935677, 8.823444249623744, 15.53637285817858]
+        for i in range(5):
+            with self.subTest(i=i):
+                duration = helper_fxs.get_duration(None, 100, self.maturities[i], self.coupons[i], self.ytms[i], 2)
+                self.assertAlmostEqual(duration, expected[i], 12)
+                
+    def test_add_durations(self):
+        bondmarket = BondMarket('bondmarket1', 2003)
+        for m, c, y, n in zip(self.maturities, self.coupons, self.ytms, self.nominals):
+            bondmarket.add_bond('MM%i' % m, n, m, c, y, 2)
+        helper_fxs.add_durations(bondmarket)
+        expected = [helper_fxs.get_duration(None, 100, m, c, y, 2) for m, c, y in zip(self.maturities, self.coupons, self.ytms)]
+        np.testing.assert_allclose(bondmarket.durations, expected, rtol=1e-12)
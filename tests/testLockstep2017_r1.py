@@ -0,0 +1,48 @@
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from corpbondabm.lockstep2017_r1 import LockstepRunner
+from corpbondabm.runner2017_r1 import Runner
+
+
+class TestLockstep(unittest.TestCase):
+    
+    
+    def test_matches_runner(self):
+        # with ties going to the first dealer both runners are deterministic
+        with mock.patch.object(Runner, 'make_h5s'), mock.patch.object(np.random, 'randint', lambda low, high: 0):
+            runner = Runner(mm_share=0.35, run_steps=120, year=2016)
+        lockstep = LockstepRunner(worlds=2, mm_share=0.35, run_steps=120, year=2016, tie_break='first')
+        self.assertListEqual(list(lockstep.trades), [len(runner.bondmarket.trades)]*2)
+        for k in range(2):
+            with self.subTest(k=k):
+                np.testing.assert_allclose(lockstep.last_prices[k], list(runner.bondmarket.last_prices.values()), rtol=1e-12)
+                np.testing.assert_allclose(lockstep.dealer_quantity[k], [[d.portfolio[b]['Quantity'] for b in d.bond_list] for d in runner.dealers])
+                self.assertAlmostEqual(lockstep.mm_cash[k], runner.mutualfund.cash, 6)
+                nav = [runner.mutualfund.nav_history[s]['NAV'] for s in range(128)]
+                np.testing.assert_allclose(lockstep.nav_history['NAV'][k], nav, rtol=1e-12)
+        
+    def test_worlds(self):
+        shocks = np.array([0.0, 0.01, 0.02])
+        lockstep = LockstepRunner(worlds=3, mm_share=0.35, run_steps=60, year=2016, shocks=shocks, seed=5)
+        self.assertEqual(lockstep.price_history.shape, (68, 3, 5))
+        self.assertEqual(lockstep.dealer_quantity.shape, (3, 3, 5))
+        # bigger shocks, lower prices
+        self.assertTrue((np.diff(lockstep.last_prices, axis=0) < 0).all())
+        again = LockstepRunner(worlds=3, mm_share=0.35, run_steps=60, year=2016, shocks=shocks, seed=5)
+        np.testing.assert_array_equal(lockstep.price_history[8:], again.price_history[8:])
+        np.testing.assert_array_equal(lockstep.dealer_quantity, again.dealer_quantity)
+        
+    def test_match_trade(self):
+        lockstep = LockstepRunner(worlds=3, run_steps=0, tie_break='first')
+        quotes = np.array([[100.1, 100.2, 100.1], [99.9, 99.9, np.nan], [np.nan, np.nan, np.nan]])
+        # world 0 buys (best ask), world 1 sells (best bid), world 2 has no quotes
+        dealer = lockstep.match_trade(quotes, np.array([-5.0, 5.0, 5.0]))
+        self.assertListEqual(list(dealer), [0, 0, -1])
+        lockstep.tie_break = 'random'
+        picks = {tuple(lockstep.match_trade(quotes, np.array([-5.0, 5.0, 5.0]))) for _ in range(50)}
+        self.assertSetEqual({p[0] for p in picks}, {0, 2})
+        self.assertSetEqual({p[1] for p in picks}, {0, 1})
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from corpbondabm import marketdata
+
+
+class TestMarketdata(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csvfile = os.path.join(self.tmpdir, 'yieldcurvep.csv')
+        shutil.copyfile(marketdata.YIELDCURVE_CSV, self.csvfile)
+        marketdata.clear_cache()
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        marketdata.clear_cache()
+        
+    def test_load_yieldcurve_change(self):
+        changes = marketdata.load_yieldcurve_change(2003, self.csvfile)
+        self.assertEqual(changes.shape, (250, 5))
+        self.assertFalse(changes.flags.writeable)
+        self.assertTrue(os.path.exists(marketdata.cache_file(self.csvfile, 'yieldcurve')))
+        # second call is served from the in-process cache as a view of the same buffer
+        again = marketdata.load_yieldcurve_change(2003, self.csvfile)
+        self.assertIs(again.base, changes.base)
+        self.assertEqual(marketdata.load_yieldcurve_change(1990, self.csvfile).shape, (0, 5))
+        
+    def test_npz_cache(self):
+        expected = np.array(marketdata.load_yieldcurve_change(2010, self.csvfile))
+        marketdata.clear_cache()
+        with mock.patch('corpbondabm.marketdata.parse_yieldcurve', side_effect=AssertionError('parsed again')):
+            np.testing.assert_array_equal(marketdata.load_yieldcurve_change(2010, self.csvfile), expected)
+        
+    def test_stale_cache(self):
+        first = np.array(marketdata.load_yieldcurve_change(2010, self.csvfile))
+        with open(self.csvfile) as f:
+            lines = f.readlines()
+        with open(self.csvfile, 'w') as f:
+            f.writelines(lines[:-210]) # drop 2017
+        os.utime(self.csvfile, ns=(1, 1))
+        self.assertEqual(marketdata.load_yieldcurve_change(2017, self.csvfile).shape, (0, 5))
+        np.testing.assert_array_equal(marketdata.load_yieldcurve_change(2010, self.csvfile), first)
+        
+    def test_load_equity_returns(self):
+        returns = marketdata.load_equity_returns(2003)
+        self.assertEqual(len(returns), 252)
+        self.assertTrue(np.isfinite(returns).all())
+        
+    def test_interpolate_tenors(self):
+        changes = marketdata.load_yieldcurve_change(2003, self.csvfile)
+        # exact at the tenors, in any order
+        np.testing.assert_array_equal(marketdata.interpolate_tenors(changes, [25, 1, 2, 5, 10]), changes[:, [4, 0, 1, 2, 3]])
+        bonds = marketdata.interpolate_tenors(changes, [0.5, 3, 7.5, 30])
+        np.testing.assert_array_equal(bonds[:, 0], changes[:, 0])
+        np.testing.assert_allclose(bonds[:, 1], changes[:, 1] + (changes[:, 2] - changes[:, 1])/3)
+        np.testing.assert_allclose(bonds[:, 2], 0.5*(changes[:, 2] + changes[:, 3]))
+        np.testing.assert_array_equal(bonds[:, 3], changes[:, 4])
@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+from corpbondabm.pricefeed import PriceFeed, PricePublisher
+from corpbondabm.runner2017_r1 import Runner, StepRecord
+
+
+class TestPricefeed(unittest.TestCase):
+
+
+    def setUp(self):
+        self.feed = PriceFeed.create(5, 3, capacity=4)
+        
+    def tearDown(self):
+        self.feed.close()
+        
+    def record(self, day):
+        return StepRecord(day, np.arange(5) + day, 1000.0 + day, 10.0, 50.0, 0.0, day % 3,
+                          np.full((3, 5), float(day)), np.zeros(3), np.zeros(5))
+        
+    def test_ring(self):
+        reader = PriceFeed.attach(self.feed.name)
+        self.assertIsNone(reader.latest())
+        for day in range(8, 11):
+            self.feed.publish(self.record(day))
+        rows, since = reader.read()
+        self.assertEqual(since, 3)
+        columns = reader.unpack(rows)
+        self.assertListEqual(columns['Day'].tolist(), [8, 9, 10])
+        self.assertListEqual(columns['Prices'][-1].tolist(), [10, 11, 12, 13, 14])
+        self.assertEqual(columns['DealerInventory'].shape, (3, 3, 5))
+        self.assertListEqual(columns['Trades'].tolist(), [2, 0, 1])
+        # the writer laps a slow reader: only the last capacity-1 rows are left
+        for day in range(11, 17):
+            self.feed.publish(self.record(day))
+        rows, since = reader.read(since)
+        self.assertEqual(since, 9)
+        self.assertListEqual(reader.unpack(rows)['Day'].tolist(), [14, 15, 16])
+        self.assertEqual(reader.unpack(reader.latest())['NAV'][0], 1016)
+        self.assertEqual(len(reader.read(since)[0]), 0)
+        with self.assertRaises(ValueError):
+            reader.data[0, 0] = 1
+        self.assertFalse(reader.closed)
+        self.feed.finish()
+        self.assertTrue(reader.closed)
+        reader.close()
+        
+    def test_publisher(self):
+        config = {'mm_share': 0.35, 'run_steps': 60, 'year': 2016, 'seed': 3}
+        with PricePublisher(config, capacity=64) as publisher:
+            publisher.join(60)
+            self.assertEqual(publisher.process.exitcode, 0)
+            reader = PriceFeed.attach(publisher.feed.name)
+            self.assertTrue(reader.closed)
+            columns = reader.unpack(reader.read()[0])
+            reader.close()
+        records = list(Runner(run=False, **config).iter_steps())
+        self.assertListEqual(columns['Day'].tolist(), [r.Day for r in records])
+        np.testing.assert_array_equal(columns['Prices'], [r.Prices for r in records])
+        np.testing.assert_array_equal(columns['DealerInventory'][-1], records[-1].DealerInventory)
+        self.assertListEqual(publisher.bond_names, ['MM101', 'MM102', 'MM103', 'MM104', 'MM105'])
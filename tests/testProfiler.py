@@ -0,0 +1,63 @@
+import itertools
+import unittest
+
+from corpbondabm.profiler import PhaseProfiler, PHASES
+from corpbondabm.runner2017_r1 import Runner
+
+
+class TestProfiler(unittest.TestCase):
+
+
+    def setUp(self):
+        # each clock reading is one second after the last
+        self.profiler = PhaseProfiler(trace=True, clock=itertools.count().__next__)
+
+    def test_laps(self):
+        prof = self.profiler
+        prof.begin_step(8)
+        prof.lap('decisions')
+        prof.lap('quotes')
+        prof.count('Rfqs')
+        prof.lap('quotes')
+        prof.count('Rfqs')
+        prof.lap('chart')
+        prof.end_step()
+        self.assertEqual(prof.seconds['quotes'], 2)
+        self.assertEqual(prof.laps['quotes'], 2)
+        self.assertEqual(prof.seconds['chart'], 1)
+        self.assertEqual(prof.counters['Steps'], 1)
+        summary = prof.summary()
+        self.assertListEqual(list(summary.index), list(PHASES) + ['chart'])
+        self.assertAlmostEqual(summary.Share.sum(), 1.0)
+        trace = prof.trace()
+        self.assertListEqual(list(trace.index), [8])
+        self.assertEqual(trace.loc[8, 'Rfqs'], 2)
+        self.assertIn('quotes', prof.report())
+        with self.assertRaises(ValueError):
+            PhaseProfiler().trace()
+
+    def test_runner_profile(self):
+        plain = Runner(mm_share=0.35, run_steps=40, year=2016, seed=4, run=False)
+        profiled = Runner(mm_share=0.35, run_steps=40, year=2016, seed=4, run=False, profiler=PhaseProfiler(trace=True))
+        plain.run_mcs(plain.current_date)
+        profiled.run_mcs(profiled.current_date)
+        self.assertDictEqual(dict(plain.bondmarket.last_prices), dict(profiled.bondmarket.last_prices))
+        prof = profiled.profiler
+        self.assertEqual(prof.counters['Steps'], 40)
+        self.assertEqual(prof.counters['Trades'], len(profiled.bondmarket.trades))
+        self.assertEqual(prof.counters['Rfqs'], prof.counters['Rejected'] + prof.counters['Trades'])
+        self.assertGreaterEqual(prof.counters['NewtonIterations'], 40)
+        self.assertEqual(prof.laps['repricing'], 40)
+        trace = prof.trace()
+        self.assertEqual(len(trace), 40)
+        self.assertEqual(trace.Trades.sum(), prof.counters['Trades'])
+        self.assertGreater(prof.seconds['repricing'], 0)
+        
+    def test_runner_profile_scalar_pricing(self):
+        # one Newton solve per bond per day, each taking at least one iteration
+        runner = Runner(mm_share=0.35, run_steps=20, year=2016, seed=4, run=False, profiler=PhaseProfiler(trace=True))
+        runner.bondmarket.batch_pricing = False
+        runner.run_mcs(runner.current_date)
+        prof = runner.profiler
+        self.assertGreaterEqual(prof.counters['NewtonIterations'], 20*5)
+        self.assertTrue((prof.trace().NewtonIterations >= 5).all())
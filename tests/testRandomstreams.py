@@ -0,0 +1,43 @@
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from corpbondabm.randomstreams import RandomStream, make_streams
+from corpbondabm.runner2017_r1 import Runner
+
+
+class TestRandomstreams(unittest.TestCase):
+    
+    
+    def test_legacy_stream(self):
+        stream = RandomStream()
+        np.random.seed(1)
+        expected = [np.random.randint(0, 10) for _ in range(5)]
+        np.random.seed(1)
+        self.assertListEqual([stream.randint(0, 10) for _ in range(5)], expected)
+        
+    def test_make_streams(self):
+        streams = make_streams(['market', 'm1', 'd1'], seed=42)
+        draws = {name: [s.randint(0, 1000) for _ in range(20)] for name, s in streams.items()}
+        self.assertNotEqual(draws['market'], draws['m1'])
+        again = make_streams(['market', 'm1', 'd1'], seed=42)
+        self.assertListEqual([again['d1'].randint(0, 1000) for _ in range(20)], draws['d1'])
+        self.assertIsNone(make_streams(['market'])['market'].generator)
+        
+    def test_block_draws(self):
+        stream = make_streams(['market'], seed=3, block_size=16)['market']
+        draws = [stream.randint(2, 5) for _ in range(100)]
+        self.assertTrue(all(2 <= x < 5 for x in draws))
+        self.assertSetEqual(set(draws), {2, 3, 4})
+        uniforms = np.random.Generator(np.random.PCG64(np.random.SeedSequence(3).spawn(1)[0])).random(16)
+        self.assertEqual(draws[0], 2 + int(uniforms[0]*3))
+        
+    def test_seeded_runner(self):
+        with mock.patch.object(Runner, 'make_h5s'):
+            runs = [Runner(mm_share=0.35, run_steps=80, year=2016, seed=s) for s in (11, 11)]
+        trades = [[(t['Dealer'], t['Price']) for t in r.bondmarket.trades] for r in runs]
+        self.assertTrue(trades[0])
+        self.assertListEqual(trades[0], trades[1])
+        self.assertIsNot(runs[0].bondmarket.rng, runs[0].dealers[0].rng)
@@ -0,0 +1,70 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from corpbondabm.recorder import ColumnBuffer, ChunkWriter, StreamRecorder
+from corpbondabm.runner2017_r1 import Runner
+
+COLUMNS = [('Step', np.int64), ('Bond', object), ('Price', float)]
+
+
+class TestRecorder(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.h5_file = os.path.join(self.tmpdir, 'test.h5')
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        
+    def test_column_buffer(self):
+        buffer = ColumnBuffer(COLUMNS, 3)
+        buffer.append({'Step': 1, 'Bond': 'MM101', 'Price': 99.5})
+        buffer.append({'Step': 2, 'Bond': 'MM102', 'Price': 100.25, 'Extra': 'ignored'})
+        self.assertEqual(len(buffer), 2)
+        self.assertFalse(buffer.full)
+        chunk = buffer.take()
+        self.assertListEqual(list(chunk['Step']), [1, 2])
+        self.assertListEqual(list(chunk['Bond']), ['MM101', 'MM102'])
+        self.assertEqual(len(buffer), 0)
+        
+    def test_stream_recorder(self):
+        writer = ChunkWriter(self.h5_file)
+        recorder = StreamRecorder(writer, 'prices', COLUMNS, chunk_size=4)
+        for step in range(10):
+            recorder.record({'Step': step, 'Bond': 'MM%i' % (100+step), 'Price': 100.0+step})
+        self.assertEqual(len(recorder.buffer), 2) # two full chunks already handed to the writer
+        recorder.flush()
+        writer.close()
+        df = pd.read_hdf(self.h5_file, 'prices')
+        self.assertListEqual(list(df.columns), ['Step', 'Bond', 'Price'])
+        self.assertListEqual(list(df.Step), list(range(10)))
+        self.assertEqual(df.Bond.iloc[-1], 'MM109')
+        with self.assertRaises(TypeError):
+            pickle.dumps(writer)
+            
+    def test_writer_error(self):
+        writer = ChunkWriter(os.path.join(self.tmpdir, 'missing', 'test.h5'))
+        writer.put('prices', {'Step': np.arange(3)})
+        with self.assertRaises(Exception):
+            writer.close()
+        
+    def test_runner_stream_h5(self):
+        stored = os.path.join(self.tmpdir, 'stored.h5')
+        Runner(mm_share=0.35, run_steps=80, year=2016, seed=4, h5_file=stored)
+        runner = Runner(mm_share=0.35, run_steps=80, year=2016, seed=4, h5_file=self.h5_file, stream_h5=True, chunk_size=16)
+        self.assertFalse(runner.bondmarket.trades)
+        self.assertFalse(runner.dealers[0].quote_details)
+        self.assertLessEqual(len(runner.mutualfund.nav_history), 8)
+        for key in ['trades', 'last_prices', 'nav', 'd1_details', 'd2_details', 'd3_details']:
+            with self.subTest(key=key):
+                expected = pd.read_hdf(stored, key).reset_index(drop=True)
+                streamed = pd.read_hdf(self.h5_file, key).reset_index(drop=True)
+                self.assertTrue(len(expected))
+                pd.testing.assert_frame_equal(streamed, expected, check_dtype=False)
@@ -0,0 +1,34 @@
+import shutil
+import tempfile
+import unittest
+
+from corpbondabm import replicator
+
+
+class TestReplicator(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        
+    def test_replication_seeds(self):
+        seeds = replicator.replication_seeds(4, 12345)
+        self.assertEqual(len(set(seeds)), 4)
+        self.assertListEqual(seeds, replicator.replication_seeds(4, 12345))
+        
+    def test_run_replications(self):
+        configs = [{'run_steps': 60, 'mm_share': 0.35}, {'run_steps': 60, 'mm_share': 0.55}]
+        results = replicator.run_replications(configs, self.tmpdir, seed=1, max_workers=2)
+        self.assertEqual(len(results), 2)
+        summary = results.summary()
+        self.assertListEqual(list(summary.index), [0, 1])
+        self.assertIn('MM101', summary.columns)
+        nav = results.load('nav')
+        self.assertSetEqual(set(nav.Replication), {0, 1})
+        self.assertEqual(len(nav), 2*(60+8))
+        # a rerun into the same folder replaces rather than appends to the partitions
+        results = replicator.run_replications(configs, self.tmpdir, seed=1, max_workers=2)
+        self.assertEqual(len(results.load('nav')), 2*(60+8))
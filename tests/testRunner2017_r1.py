@@ -0,0 +1,92 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+from corpbondabm import marketdata
+from corpbondabm.runner2017_r1 import Runner, nav_below, dealer_at_limit
+
+
+class TestRunner(unittest.TestCase):
+
+
+    def setUp(self):
+        self.runner = Runner(mm_share=0.35, run_steps=120, year=2016, seed=4, run=False)
+        
+    def prices(self, runner):
+        return list(runner.bondmarket.last_prices.values())
+        
+    def test_run_mcs_stop(self):
+        self.assertEqual(self.runner.current_date, 8)
+        self.runner.run_mcs(self.runner.current_date, 42)
+        self.assertEqual(self.runner.current_date, 42)
+        self.assertEqual(self.runner.bondmarket.price_history[-1]['Date'], 41)
+        
+    def test_iter_steps(self):
+        seen = []
+        records = list(self.runner.iter_steps(stop=30, consumers=[seen.append]))
+        self.assertListEqual([r.Day for r in records], list(range(8, 30)))
+        self.assertIs(seen[-1], records[-1])
+        self.assertEqual(records[-1].Prices.shape, (5,))
+        self.assertEqual(records[-1].DealerInventory.shape, (3, 5))
+        self.assertEqual(records[-1].NAV, self.runner.mutualfund.nav_history[29]['NAV'])
+        # resumes where it stopped and counts every trade once
+        records += list(self.runner.iter_steps())
+        self.assertEqual(records[-1].Day, 127)
+        self.assertEqual(sum(r.Trades for r in records), len(self.runner.bondmarket.trades))
+        
+    def test_iter_steps_stop_when(self):
+        # the day-50 shock pushes the fund's NAV per share through 17
+        records = list(self.runner.iter_steps(stop_when=nav_below(17.0)))
+        self.assertEqual(records[-1].Day, 50)
+        self.assertEqual(self.runner.current_date, 51)
+        records = list(self.runner.iter_steps(stop_when=dealer_at_limit(0.3)))
+        self.assertGreaterEqual(records[-1].InventoryUsage.max(), 0.3)
+        self.assertLess(self.runner.current_date, self.runner.end_date)
+        
+    def test_snapshot_restore(self):
+        self.runner.run_mcs(self.runner.current_date, 42)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'day42.pkl')
+            self.runner.save_snapshot(filename)
+            self.runner.run_mcs(42, self.runner.end_date)
+            restored = Runner.load_snapshot(filename)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(restored.current_date, 42)
+        restored.run_mcs(42, restored.end_date)
+        self.assertListEqual(self.prices(restored), self.prices(self.runner))
+        self.assertEqual(len(restored.bondmarket.trades), len(self.runner.bondmarket.trades))
+        self.assertDictEqual(restored.mutualfund.nav_history[127], self.runner.mutualfund.nav_history[127])
+        
+    def test_fork(self):
+        with mock.patch.object(Runner, 'make_h5s'):
+            full = Runner(mm_share=0.35, run_steps=120, year=2016, seed=4)
+        self.runner.run_mcs(self.runner.current_date, 42)
+        same, bigger, none = self.runner.fork([{50: 0.01}, {50: 0.02}, {}])
+        # the parent is untouched and the branch with the default shock replays the full run
+        self.assertEqual(self.runner.current_date, 42)
+        self.assertEqual(same.current_date, 128)
+        self.assertListEqual(self.prices(same), self.prices(full))
+        for i in range(5):
+            with self.subTest(i=i):
+                self.assertLess(self.prices(bigger)[i], self.prices(same)[i])
+                self.assertGreater(self.prices(none)[i], self.prices(same)[i])
+                
+    def test_numpy_only_imports(self):
+        # a run (with warm market data caches) loads none of pandas, scipy or matplotlib
+        marketdata.load_yieldcurve_change(2016)
+        marketdata.load_equity_returns(2016)
+        code = ('import sys\n'
+                'from corpbondabm.runner2017_r1 import Runner\n'
+                'from corpbondabm import charter2017_r1, lockstep2017_r1, replicator\n'
+                'Runner(mm_share=0.35, run_steps=60, year=2016, seed=4, run=False).run_mcs(8)\n'
+                'print(sorted(m for m in ("pandas", "scipy", "matplotlib") if m in sys.modules))')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.abspath('..'), os.environ.get('PYTHONPATH', '')]))
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, check=True).stdout
+        self.assertEqual(out.strip(), '[]')
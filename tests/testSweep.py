@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from corpbondabm import sweep
+
+
+class TestSweep(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.base = {'run_steps': 60}
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        
+    def test_grid_design(self):
+        design = sweep.grid_design({'mm_share': [0.35, 0.55], 'treynor_factor': [1000, 2000, 3000]})
+        self.assertEqual(len(design), 6)
+        self.assertDictEqual(design[0], {'mm_share': 0.35, 'treynor_factor': 1000})
+        with self.assertRaises(ValueError):
+            sweep.grid_design({'seed': [1, 2]})
+        for base in ({'seed': 1}, {'h5_file': 'out.h5'}):
+            with self.subTest(base=base):
+                with self.assertRaises(ValueError):
+                    sweep.run_sweep(design, self.tmpdir, base=base)
+            
+    def test_random_design(self):
+        design = sweep.random_design({'mm_share': (0.3, 0.6), 'year': [2003, 2004]}, 5, seed=1)
+        self.assertEqual(len(design), 5)
+        self.assertTrue(all(0.3 <= point['mm_share'] <= 0.6 for point in design))
+        self.assertTrue(all(point['year'] in (2003, 2004) for point in design))
+        self.assertListEqual(design, sweep.random_design({'mm_share': (0.3, 0.6), 'year': [2003, 2004]}, 5, seed=1))
+        
+    def test_point_key(self):
+        version = sweep.code_version()
+        key = sweep.point_key({'mm_share': 0.35, 'treynor_bounds': (5, 25)}, 1, version)
+        self.assertEqual(key, sweep.point_key({'treynor_bounds': [5, 25], 'mm_share': 0.35}, 1, version))
+        self.assertNotEqual(key, sweep.point_key({'mm_share': 0.35, 'treynor_bounds': (5, 25)}, 2, version))
+        self.assertNotEqual(key, sweep.point_key({'mm_share': 0.35, 'treynor_bounds': (5, 25)}, 1, 'other'))
+        # seeds belong to the point, not to its place in the design
+        self.assertEqual(sweep.point_seed({'mm_share': 0.35}, 1), sweep.point_seed({'mm_share': 0.35}, 1))
+        self.assertNotEqual(sweep.point_seed({'mm_share': 0.35}, 1, 0), sweep.point_seed({'mm_share': 0.35}, 1, 1))
+        
+    def test_run_sweep(self):
+        design = sweep.grid_design({'mm_share': [0.35, 0.55]})
+        results = sweep.run_sweep(design, self.tmpdir, seed=1, base=self.base, max_workers=2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results.cached, 0)
+        summary = results.summary()
+        self.assertListEqual(list(summary.mm_share), [0.35, 0.55])
+        self.assertIn('MM101', summary.columns)
+        nav = results.load('nav')
+        self.assertSetEqual(set(nav.Point), {0, 1})
+        self.assertEqual(len(nav), 2*(60+8))
+        # a rerun is read from the cache without running anything
+        h5_time = os.path.getmtime(summary.H5File[0])
+        rerun = sweep.run_sweep(design, self.tmpdir, seed=1, base=self.base, max_workers=2)
+        self.assertEqual(rerun.cached, 2)
+        self.assertEqual(os.path.getmtime(summary.H5File[0]), h5_time)
+        self.assertListEqual(list(rerun.summary().NAV), list(summary.NAV))
+        # extending the grid only runs the new point
+        extended = sweep.run_sweep(sweep.grid_design({'mm_share': [0.35, 0.45, 0.55]}), self.tmpdir, seed=1,
+                                   base=self.base, max_workers=2)
+        self.assertListEqual(list(extended.summary().Cached), [True, False, True])
+        self.assertEqual(extended.summary().NAV[2], summary.NAV[1])
@@ -0,0 +1,44 @@
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from corpbondabm.runner2017_r1 import Runner
+from corpbondabm.synthetic import make_bonds, make_specialization, synthetic_market, MATURITY_WEIGHTS
+
+
+class TestSynthetic(unittest.TestCase):
+
+
+    def setUp(self):
+        self.market = synthetic_market(500, 12, seed=5)
+        
+    def test_make_bonds(self):
+        bonds = self.market['bonds']
+        self.assertEqual(len(bonds), 500)
+        self.assertEqual(len({bond['Name'] for bond in bonds}), 500)
+        self.assertTrue({bond['Maturity'] for bond in bonds} <= set(MATURITY_WEIGHTS))
+        coupons = np.array([bond['Coupon'] for bond in bonds])
+        yields = np.array([bond['Yield'] for bond in bonds])
+        self.assertTrue((coupons > 0).all() and (yields > 0).all())
+        self.assertLess(np.abs(coupons - yields).mean(), 0.01)
+        self.assertListEqual(make_bonds(20, 3), make_bonds(20, 3))
+        
+    def test_specialization(self):
+        special = make_specialization(4, [1, 2, 5, 10, 25], seed=2)
+        self.assertEqual(special.shape, (4, 5))
+        self.assertTrue(np.isin(special, [0.5, 0.75, 0.9]).all())
+        self.assertTrue((special.max(axis=1) == 0.9).all())
+        d_special = self.market['d_special']
+        self.assertListEqual(list(d_special), ['d%d' % i for i in range(1, 13)])
+        self.assertEqual(len(d_special['d12']), 500)
+        
+    def test_runner(self):
+        with mock.patch.object(Runner, 'make_h5s'):
+            runner = Runner(run_steps=50, year=2016, seed=2, **self.market)
+        self.assertEqual(len(runner.dealers_dict), 12)
+        self.assertIs(runner.dealers_dict['d12'], runner.dealers[-1])
+        self.assertEqual(runner.bondmarket.bond_yield_changes().shape[1], 500)
+        self.assertTrue(np.isfinite(runner.bondmarket.universe.last_price).all())
+        self.assertGreater(len(runner.bondmarket.trades), 0)
@@ -1,8 +1,11 @@
+import pickle
 import unittest
 
+from unittest import mock
+
 import numpy as np
 
-from corpbondabm.trader2017_r1 import BuySide, MutualFund, MutualFund2, InsuranceCo, HedgeFund, Dealer
+from corpbondabm.trader2017_r1 import BuySide, NavHistory, MutualFund, MutualFund2, InsuranceCo, HedgeFund, Dealer, DealerPanel
 from corpbondabm.bondmarket2017_r1 import BondMarket
 
 MM_FRACTION = 0.15
@@ -73,7 +76,29 @@ class TestTrader(unittest.TestCase):
         expected = MM_FRACTION*bond_values
         self.assertEqual(portfolio_value, expected)
         
+    def test_running_bond_value(self):
+        for k in range(40):
+            self.bondmarket.last_prices['MM10%d' % (k % 5 + 1)] = 95 + k/10
+            self.b1.update_prices(self.bondmarket.last_prices)
+            self.b1.fill(k % 5, 1 if k % 2 else -1, 99 + k/20)
+        expected = np.sum(self.b1.nominal*self.b1.price/100)
+        self.assertAlmostEqual(self.b1.compute_portfolio_value(), expected, 9)
+        self.assertAlmostEqual(self.b1.reconcile(), 0, 9)
+        self.assertLess(self.b1.max_drift, 1e-6)
+        self.assertEqual(self.b1.compute_portfolio_value(), expected)
+        # writes through the portfolio rows keep the running value too
+        self.b1.portfolio['MM102']['Nominal'] = 0
+        self.assertAlmostEqual(self.b1.compute_portfolio_value(), np.sum(self.b1.nominal*self.b1.price/100), 9)
+        
 
+    def test_reconcile_reports_drift(self):
+        self.b1.bond_value += 5.0 # a change the running value missed
+        with self.assertWarnsRegex(RuntimeWarning, 'b1 bond value drifted'):
+            for k in range(32):
+                self.b1.update_prices(self.bondmarket.last_prices)
+        self.assertAlmostEqual(self.b1.max_drift, 5.0, 6)
+        self.assertAlmostEqual(self.b1.compute_portfolio_value(), np.sum(self.b1.nominal*self.b1.price/100), 9)
+        
     # The Mutual Fund
     def test_repr_MutualFund(self):
         self.assertEqual('BuySide(m1, MutualFund)', '{0}'.format(self.m1))
@@ -86,6 +111,28 @@ class TestTrader(unittest.TestCase):
         self.assertDictEqual(self.m1.nav_history[1], {'Step': 1, 'BondValue': 750.0, 'Cash': 38.9178220025832, 'NAV': 788.91782200258319,
                                                       'NAVPerShare': 7.8891782200258316, 'CashFlow': 0})
           
+    def test_nav_history(self):
+        history = NavHistory(window=4, capacity=2)
+        for step in range(10):
+            history[step] = {'BondValue': 100, 'Cash': step, 'NAV': 100+step, 'NAVPerShare': 1+step/100, 'CashFlow': 0}
+        self.assertEqual(len(history), 10)
+        self.assertEqual(history.value(9, 'NAV'), 109)
+        self.assertEqual(history.value(2, 'Cash'), 2) # outside the ring, read from the columns
+        self.assertEqual(history[3]['Step'], 3)
+        self.assertEqual(max(history), 9)
+        history[9] = {'BondValue': 100, 'Cash': 0, 'NAV': 99, 'NAVPerShare': 0.99, 'CashFlow': 0}
+        self.assertEqual(history.value(9, 'NAV'), 99)
+        self.assertEqual(len(history), 10)
+        with self.assertRaises(ValueError):
+            history[-1] = {'NAV': 1}
+        recorder = mock.Mock()
+        history.spill_to(recorder)
+        history[10] = {'BondValue': 100, 'Cash': 0, 'NAV': 110, 'NAVPerShare': 1.1, 'CashFlow': 0}
+        self.assertEqual(recorder.record.call_args[0][0]['NAV'], 110)
+        self.assertEqual(list(history), [7, 8, 9, 10])
+        with self.assertRaises(KeyError):
+            history.value(5, 'NAV')
+        
     def test_compute_flow(self):
         self.m1.nav_history[1] = {'Step': 1, 'BondValue': 100, 'Cash': 0, 'NAV': 100, 'NAVPerShare': 10}
         self.m1.nav_history[5] = {'Step': 5, 'BondValue': 100, 'Cash': 0, 'NAV': 100, 'NAVPerShare': 10}
@@ -268,6 +315,13 @@ class TestTrader(unittest.TestCase):
         self.assertEqual(self.d1.portfolio['MM104']['Price'], 105)
         self.assertEqual(self.d1.portfolio['MM105']['Price'], 110)
         
+    def test_update_pricesD_market(self):
+        self.bondmarket.last_prices['MM104'] = 97.5
+        self.d1.update_prices(self.bondmarket.last_prices)
+        np.testing.assert_array_equal(self.d1.price, self.bondmarket.last_prices.array)
+        self.assertEqual(self.d1.portfolio['MM104']['Price'], 97.5)
+        self.assertFalse(hasattr(self.d1, '__dict__'))
+        
     '''
     There are 6 make_quote possibilities:
     1. rfq size results in a breach of the inventory limit (2 ways to do this)
@@ -383,6 +437,97 @@ class TestTrader(unittest.TestCase):
         self.assertLess(price8, price7)
         
         #print(price0, price1, price2, price3, price4, price5, price6, price7, price8)
-
         
+    def test_make_quotes_panel(self):
+        d_portfolio = {bond: dict(self.d1.portfolio[bond]) for bond in self.d1.bond_list}
+        d2 = Dealer('d2', self.d1.bond_list, d_portfolio, 0.2, 0.05, TREYNOR_BOUNDS, TREYNOR_FACTOR)
+        self.d1.portfolio['MM101']['Quantity'] = 48
+        d2.portfolio['MM101']['Quantity'] = -10
+        panel = DealerPanel([self.d1, d2], record_details=False)
+        for side in ['buy', 'sell']:
+            rfq = {'order_id': 'm1_1', 'name': 'MM101', 'side': side, 'amount': 5}
+            expected = [self.d1.make_quote(rfq) or None, d2.make_quote(rfq) or None]
+            quotes = panel.make_quotes(rfq)
+            self.assertEqual(len(quotes), 2)
+            for quote, exp in zip(quotes, expected):
+                if exp is None:
+                    self.assertIsNone(quote)
+                else:
+                    self.assertEqual(quote.keys(), exp.keys())
+                    self.assertAlmostEqual(quote['price'], exp['price'])
+        # quote_batch quotes each rfq against the current inventories
+        batch = panel.quote_batch(['MM101', 'MM103'], ['sell', 'buy'], [5, 10])
+        self.assertEqual(batch.shape, (2, 2))
+        np.testing.assert_allclose(batch[0], panel.quote('MM101', 'sell', 5)[0])
+        np.testing.assert_allclose(batch[1], panel.quote('MM103', 'buy', 10)[0])
+        
+    def test_panel_spreads(self):
+        panel = DealerPanel([self.d1], record_details=False)
+        self.assertTrue(np.isnan(panel.mean_spreads()).all())
+        rfq = {'order_id': 'm1_1', 'name': 'MM101', 'side': 'sell', 'amount': 5}
+        panel.quote_prices(rfq)
+        spread = panel.quote('MM101', 'sell', 5)[1]['InsideSpread'][0]
+        # quote_batch counts too: MM101 twice more and MM103 once
+        panel.quote_batch(['MM101', 'MM103', 'MM101'], ['sell', 'buy', 'buy'], [5, 10, 5])
+        spreads = panel.mean_spreads()
+        self.assertEqual(panel.spread_count[panel.index['MM101']], 3)
+        self.assertAlmostEqual(spreads[panel.index['MM101']], spread)
+        self.assertAlmostEqual(spreads[panel.index['MM103']], panel.quote('MM103', 'buy', 10)[1]['InsideSpread'][0])
+        panel.reset_spreads()
+        self.assertTrue(np.isnan(panel.mean_spreads()).all())
+        
+    def test_make_quotes_panel_details(self):
+        panel = DealerPanel([self.d1])
+        rfq = {'order_id': 'm1_1', 'name': 'MM101', 'side': 'sell', 'amount': 5}
+        panel.make_quotes(rfq)
+        self.d1.make_quote(rfq)
+        self.assertEqual(len(self.d1.quote_details), 2)
+        self.assertEqual(list(self.d1.quote_details[0]), list(self.d1.quote_details[1]))
+        for key in ['ExpectedInventory', 'InsideSpread', 'QuotePrice']:
+            self.assertAlmostEqual(self.d1.quote_details[0][key], self.d1.quote_details[1][key])
+        
+    def test_modify_portfolio_panel(self):
+        panel = DealerPanel([self.d1])
+        confirm_sell = {'Bond': 'MM101', 'Side': 'sell', 'Price': 100, 'Size': 5, 'Dealer': 'd1'}
+        confirm_buy = {'Bond': 'MM105', 'Side': 'buy', 'Price': 99, 'Size': 10, 'Dealer': 'd1'}
+        panel.modify_portfolio(confirm_sell)
+        panel.modify_portfolio(confirm_buy)
+        self.assertEqual(panel.quantity[0, 0], 5)
+        self.assertEqual(panel.quantity[0, 4], -10)
+        self.assertEqual(panel.price[0, 4], 99)
+        self.assertEqual(self.d1.portfolio['MM101']['Quantity'], 5)
+        self.assertEqual(self.d1.portfolio['MM105']['Quantity'], -10)
+        
+    def test_update_prices_panel(self):
+        panel = DealerPanel([self.d1])
+        prices = {'MM101': 100, 'MM102': 95, 'MM103': 90, 'MM104': 105, 'MM105': 110}
+        panel.update_prices(prices)
+        np.testing.assert_array_equal(panel.price[0], [100, 95, 90, 105, 110])
+        self.assertEqual(self.d1.portfolio['MM103']['Price'], 90)
+        self.bondmarket.last_prices['MM102'] = 97
+        panel.update_prices(self.bondmarket.last_prices)
+        self.assertEqual(panel.price[0, 1], 97)
+        self.assertEqual(self.d1.portfolio['MM102']['Price'], 97)
+        
+    def test_panel_shares_dealer_arrays(self):
+        panel = DealerPanel([self.d1])
+        self.d1.modify_portfolio({'Bond': 'MM102', 'Side': 'sell', 'Price': 101, 'Size': 5, 'Dealer': 'd1'})
+        self.assertEqual(panel.quantity[0, 1], 5)
+        panel = pickle.loads(pickle.dumps(panel))
+        panel.dealers[0].modify_portfolio({'Bond': 'MM102', 'Side': 'sell', 'Price': 101, 'Size': 5, 'Dealer': 'd1'})
+        self.assertEqual(panel.quantity[0, 1], 10)
         
+    def test_panel_capacity(self):
+        panel = DealerPanel([self.d1], record_details=False)
+        self.assertEqual(panel.sell_capacity[0, 0], 50)
+        self.assertEqual(panel.buy_capacity[0, 0], 37.5)
+        panel.modify_portfolio({'Bond': 'MM101', 'Side': 'sell', 'Price': 100, 'Size': 45, 'Dealer': 'd1'})
+        self.assertEqual(panel.sell_capacity[0, 0], 5)
+        self.assertEqual(panel.buy_capacity[0, 0], 82.5)
+        self.assertEqual(list(panel.able_dealers('MM101', 'sell', 5)), [0])
+        rfq = {'order_id': 'm1_1', 'name': 'MM101', 'side': 'sell', 'amount': 10}
+        self.assertEqual(panel.make_quotes(rfq), [None])
+        self.assertEqual(panel.rejected, 1)
+        rfq = {'order_id': 'm1_2', 'name': 'MM101', 'side': 'buy', 'amount': 10}
+        self.assertIsNotNone(panel.make_quotes(rfq)[0])
+        self.assertEqual(panel.rejected, 1)